@@ -8,7 +8,11 @@ from aiogram.enums import ParseMode
 import config
 from database.db import init_db
 from handlers import setup_routers
+from middlewares import DbSessionMiddleware
 from services.scheduler import setup_scheduler
+from services.charts import shutdown_chart_pool
+from services.llm_transport import close_client
+from services.nutrition_db import load_nutrition_db
 
 # Настройка логирования
 logging.basicConfig(
@@ -39,6 +43,9 @@ async def main():
     await init_db()
     logger.info("База данных готова")
 
+    # Локальный справочник КБЖУ (mmap + индекс для поиска)
+    load_nutrition_db()
+
     # Создаём бота и диспетчер
     bot = Bot(
         token=config.TELEGRAM_BOT_TOKEN,
@@ -48,6 +55,9 @@ async def main():
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
 
+    # Одна сессия БД на апдейт
+    dp.update.outer_middleware(DbSessionMiddleware())
+
     # Подключаем роутеры
     router = setup_routers()
     dp.include_router(router)
@@ -64,6 +74,8 @@ async def main():
     try:
         await dp.start_polling(bot)
     finally:
+        shutdown_chart_pool()
+        await close_client()
         await bot.session.close()
 
 
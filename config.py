@@ -14,9 +14,110 @@ ZAI_API_KEY = os.getenv("ZAI_API_KEY")
 ZAI_API_URL = os.getenv("ZAI_API_URL", "https://api.z.ai/api/paas/v4/chat/completions")
 ZAI_MODEL = os.getenv("ZAI_MODEL", "GLM-4.6V-Flash")
 
+# LLM circuit breaker (на каждого провайдера)
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", 20))  # последних запросов в окне
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", 5))  # минимум до срабатывания
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", 0.5))  # доля ошибок/медленных
+LLM_BREAKER_SLOW_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_SECONDS", 25))  # ответ медленнее — «плохой»
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))  # сек до пробного запроса
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 8))  # сек до хедж-запроса в чате
+
+# LLM повторы и адаптивная параллельность
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))  # повторов после первой попытки
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))  # сек, удваивается
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 10.0))  # сек, потолок задержки
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))  # потолок AIMD-лимита на провайдера
+
+# Полосы LLM-запросов (одновременных запросов на полосу)
+LLM_LANE_CHAT = int(os.getenv("LLM_LANE_CHAT", 8))  # диалог с коучем, уточнения
+LLM_LANE_VISION = int(os.getenv("LLM_LANE_VISION", 4))  # анализ фото
+LLM_LANE_BACKGROUND = int(os.getenv("LLM_LANE_BACKGROUND", 2))  # планы питания, сводки
+LLM_QUEUE_NOTICE_POSITION = int(os.getenv("LLM_QUEUE_NOTICE_POSITION", 3))  # с какой позиции показывать очередь
+LLM_QUEUE_NOTICE_INTERVAL = float(os.getenv("LLM_QUEUE_NOTICE_INTERVAL", 3))  # сек между правками позиции
+
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")  # реплика для статистики/отчётов (опционально)
+REPLICA_STALENESS_SECONDS = float(os.getenv("REPLICA_STALENESS_SECONDS", 30))  # после записи читаем с primary
+
+# Пул соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # сек ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # сек, Neon закрывает простаивающие соединения
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")  # ping при checkout
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "auto")  # auto — по хосту Neon -pooler; true/false — явно
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))  # без pgbouncer
+
+# Локальный справочник КБЖУ
+NUTRITION_DB_PATH = os.getenv(
+    "NUTRITION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nutrition.tsv")
+)
+NUTRITION_TOLERANCE = float(os.getenv("NUTRITION_TOLERANCE", 0.35))  # допустимое расхождение оценки LLM
+
+# Быстрый путь без LLM (вода/вес/активность/еда)
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", 0.8))  # минимальная уверенность правила
+
+# Инструменты, после которых хватает шаблонного ответа (без второго запроса к LLM)
+TEMPLATE_ONLY_TOOLS = {
+    name.strip() for name in os.getenv(
+        "TEMPLATE_ONLY_TOOLS", "log_water,log_weight,set_today_water,clear_today_water"
+    ).split(",") if name.strip()
+}
 
 # Default goals
 DEFAULT_WATER_GOAL = int(os.getenv("DEFAULT_WATER_GOAL", 2000))  # мл
 DEFAULT_CALORIE_GOAL = int(os.getenv("DEFAULT_CALORIE_GOAL", 2000))  # ккал
+
+# Charts (matplotlib в пуле процессов)
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 256))  # PNG в памяти
+
+# Weekly reports (пакетный расчёт и рассылка)
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", 500))  # пользователей за один проход
+SEND_RATE_PER_SEC = float(os.getenv("SEND_RATE_PER_SEC", 25))  # лимит Telegram ~30 сообщений/сек
+
+# Помесячные партиции таблиц записей (food/analyses/water/conversation)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 2))  # партиции создаются заранее
+PARTITION_MIGRATE = os.getenv("PARTITION_MIGRATE", "false").lower() in ("1", "true", "yes")  # перевести старые таблицы
+PARTITION_RETENTION_ACTION = os.getenv("PARTITION_RETENTION_ACTION", "archive")  # archive — отсоединить, drop — удалить
+# Перенос food_entries.ai_raw_response в food_analyses (однократно, при старте)
+RAW_ANALYSES_MIGRATE = os.getenv("RAW_ANALYSES_MIGRATE", "false").lower() in ("1", "true", "yes")
+# Удалить колонку после переноса — только если проверка нашла все строки в food_analyses
+RAW_ANALYSES_DROP_COLUMN = os.getenv("RAW_ANALYSES_DROP_COLUMN", "false").lower() in ("1", "true", "yes")
+# Срок хранения в месяцах по таблицам; 0 — хранить всегда
+PARTITION_RETENTION = {
+    table.strip(): int(months) for table, months in (
+        item.split(":") for item in os.getenv(
+            "PARTITION_RETENTION", "food_entries:0,food_analyses:6,water_entries:0,conversation_messages:6"
+        ).split(",") if item.strip()
+    )
+}
+
+# Фото: подготовка и кэш анализов
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 1568))  # px по длинной стороне
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", 256))  # анализов в памяти
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", 3600))  # сек
+
+# Альбомы: сборка (debounce) и параллельный анализ по одному фото
+ALBUM_QUIET_SECONDS = float(os.getenv("ALBUM_QUIET_SECONDS", 1.0))  # тишина после последнего фото
+ALBUM_MAX_WAIT = float(os.getenv("ALBUM_MAX_WAIT", 4.0))  # максимум ожидания с первого фото
+ALBUM_LATE_WINDOW = float(os.getenv("ALBUM_LATE_WINDOW", 60))  # сек: опоздавшие фото обработанного альбома пропускаются
+ALBUM_MAX_BYTES = int(os.getenv("ALBUM_MAX_BYTES", 50 * 1024 * 1024))  # все альбомы в памяти вместе
+ALBUM_TTL = float(os.getenv("ALBUM_TTL", 300))  # сек: старше — сборка/обработка считается зависшей
+ALBUM_SWEEP_INTERVAL = float(os.getenv("ALBUM_SWEEP_INTERVAL", 30))
+ALBUM_ANALYSIS_CONCURRENCY = int(os.getenv("ALBUM_ANALYSIS_CONCURRENCY", 4))
+ALBUM_PHOTO_TIMEOUT = float(os.getenv("ALBUM_PHOTO_TIMEOUT", 60))  # сек на запрос по одному фото (без очереди vision)
+
+# Запись воды из кнопок (micro-batching)
+WATER_BATCH_WINDOW = float(os.getenv("WATER_BATCH_WINDOW", 0.01))  # сек, сколько копим записи
+WATER_BATCH_MAX = int(os.getenv("WATER_BATCH_MAX", 500))  # записей в одном INSERT
+WATER_TOTALS_TTL = float(os.getenv("WATER_TOTALS_TTL", 600))  # сек, после — итог дня перечитывается из БД
+
+# Планы питания
+MEAL_PLAN_CALORIE_BAND = int(os.getenv("MEAL_PLAN_CALORIE_BAND", 100))  # ккал, шаг округления цели
+MEAL_PLAN_CACHE_TTL = int(os.getenv("MEAL_PLAN_CACHE_TTL", 12 * 3600))  # сек
+MEAL_PLAN_CACHE_SIZE = int(os.getenv("MEAL_PLAN_CACHE_SIZE", 500))  # планов в памяти
+MEAL_PLAN_PREGENERATE_TOP = int(os.getenv("MEAL_PLAN_PREGENERATE_TOP", 20))  # популярных сигнатур заранее
+MEAL_PLAN_PREGENERATE_MIN_DEMAND = int(os.getenv("MEAL_PLAN_PREGENERATE_MIN_DEMAND", 3))  # запросов сигнатуры для предгенерации
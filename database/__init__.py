@@ -1,7 +1,8 @@
 from database.db import get_session, init_db
 from database.models import (
-    User, FoodEntry, WeightEntry, WaterEntry, ActivityEntry,
-    ConversationMessage, UserMemory
+    User, FoodEntry, FoodAnalysis, WeightEntry, WaterEntry, ActivityEntry,
+    ConversationMessage, UserMemory, HealthMetricSample, HealthMetricDaily,
+    WeeklyReport
 )
 
 __all__ = [
@@ -9,9 +10,13 @@ __all__ = [
     "init_db",
     "User",
     "FoodEntry",
+    "FoodAnalysis",
     "WeightEntry",
     "WaterEntry",
     "ActivityEntry",
     "ConversationMessage",
-    "UserMemory"
+    "UserMemory",
+    "HealthMetricSample",
+    "HealthMetricDaily",
+    "WeeklyReport"
 ]
@@ -1,12 +1,24 @@
+import logging
 import ssl
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from database.models import Base
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+from uuid import uuid4
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from database.models import Base, User
+from database.partitions import PARTITIONED_TABLES, ensure_partitions, ensure_partitions_for, migrate_table
 import config
 
+logger = logging.getLogger(__name__)
 
-def get_database_url():
+
+def get_database_url(url: str = None):
     """Преобразует URL для asyncpg"""
-    url = config.DATABASE_URL
+    url = url or config.DATABASE_URL
     # Заменяем драйвер
     url = url.replace("postgresql://", "postgresql+asyncpg://")
     # Убираем sslmode и channel_binding (asyncpg использует ssl=require)
@@ -26,22 +38,329 @@ ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
-# Создаём async engine для PostgreSQL
-engine = create_async_engine(
-    get_database_url(),
-    echo=False,
-    pool_pre_ping=True,
-    connect_args={"ssl": ssl_context}
-)
+# ============================================================================
+# Engine и пул соединений
+# ============================================================================
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время ожидания соединения (checkout latency)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # Импорт здесь: services импортирует database
+            from services import metrics
+            metrics.observe(f"db.{self._orig_logging_name or 'primary'}.checkout_wait", time.perf_counter() - started)
+
+
+def is_pgbouncer(url: str) -> bool:
+    """Работаем ли через pgbouncer (transaction pooling): явно из env или по хосту Neon -pooler"""
+    mode = config.DB_PGBOUNCER.lower()
+    if mode == "auto":
+        return "-pooler." in url
+    return mode in ("1", "true", "yes")
+
+
+def create_engine(url: str, name: str) -> AsyncEngine:
+    """
+    Создать engine с настройками пула и кэша prepared statements
+
+    pgbouncer в transaction-режиме не гарантирует одно и то же серверное соединение
+    между запросами — кэш prepared statements asyncpg отключаем, имена делаем уникальными.
+    Без pgbouncer серверные prepared statements кэшируются (DB_STATEMENT_CACHE_SIZE).
+    """
+    connect_args = {"ssl": ssl_context}
+    db_url = get_database_url(url)
+
+    if is_pgbouncer(url):
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    else:
+        connect_args["statement_cache_size"] = config.DB_STATEMENT_CACHE_SIZE
+        connect_args["prepared_statement_cache_size"] = config.DB_STATEMENT_CACHE_SIZE
+
+    return create_async_engine(
+        db_url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_logging_name=name,
+        connect_args=connect_args
+    )
+
+
+# Основной engine (запись и чтение)
+engine = create_engine(config.DATABASE_URL, "primary")
+
+# Реплика для тяжёлых чтений (статистика, отчёты, графики); без неё — тот же engine
+replica_engine = create_engine(config.DATABASE_REPLICA_URL, "replica") if config.DATABASE_REPLICA_URL else None
 
 # Session factory
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Сессии только для чтения (реплика, если настроена)
+read_session = async_sessionmaker(replica_engine or engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# ============================================================================
+# Маршрутизация чтений: реплика со страховкой от отставания
+# ============================================================================
+
+# user_id → время последней записи (monotonic); читаем свои записи с primary
+_last_write: dict[int, float] = {}
+
+
+def mark_user_write(user_id: int):
+    """
+    Отметить запись пользователя: ближайшие REPLICA_STALENESS_SECONDS его чтения идут на primary
+
+    Внутри апдейта запись видна другим только после коммита — отметка повторяется
+    после коммита сессии апдейта (written_since не должен сработать раньше данных)
+    """
+    _stamp_write(user_id)
+    session = _update_session.get()
+    if session is not None and not session.info.get("uow_closed"):
+        session.info.setdefault("written_users", set()).add(user_id)
+
+
+def _stamp_write(user_id: int):
+    now = time.monotonic()
+    _last_write[user_id] = now
+    # Чистим старые отметки, чтобы словарь не рос бесконечно
+    if len(_last_write) > 10000:
+        cutoff = now - config.REPLICA_STALENESS_SECONDS
+        for uid in [uid for uid, ts in _last_write.items() if ts < cutoff]:
+            del _last_write[uid]
+
+
+def recently_written(user_id: int) -> bool:
+    """Писал ли пользователь недавно (реплика могла ещё не догнать)"""
+    ts = _last_write.get(user_id)
+    return ts is not None and time.monotonic() - ts < config.REPLICA_STALENESS_SECONDS
+
+
+def written_since(user_id: int, since: float) -> bool:
+    """Была ли запись пользователя после момента since (time.monotonic())"""
+    ts = _last_write.get(user_id)
+    return ts is not None and ts > since
+
+
+@event.listens_for(Session, "after_flush")
+def _track_user_writes(session, flush_context):
+    written = session.info.setdefault("written_users", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        user_id = obj.id if isinstance(obj, User) else getattr(obj, "user_id", None)
+        if user_id:
+            _stamp_write(user_id)
+            written.add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _stamp_committed_writes(session):
+    # Освобождение savepoint — ещё не коммит: ждём внешнюю транзакцию
+    if session.in_transaction():
+        return
+    for user_id in session.info.pop("written_users", ()):
+        _stamp_write(user_id)
+
+
+@asynccontextmanager
+async def read_scope(user_id: Optional[int] = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для read-only запросов (статистика, история, графики)
+
+    Идёт на реплику, если она настроена и пользователь не писал последние
+    REPLICA_STALENESS_SECONDS; иначе — session_scope() на primary (read-your-writes,
+    включая ещё не закоммиченные изменения текущего апдейта).
+    """
+    if replica_engine is None or (user_id is not None and recently_written(user_id)):
+        async with session_scope() as session:
+            yield session
+        return
+
+    async with read_session() as session:
+        yield session
+
+
+def _register_pool_metrics():
+    """Gauges по пулам: занятость и насыщение"""
+    from services import metrics
+
+    for name, eng in (("primary", engine), ("replica", replica_engine)):
+        if eng is None:
+            continue
+        pool = eng.sync_engine.pool
+        capacity = config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW
+        metrics.set_gauge(f"db.{name}.checked_out", pool.checkedout)
+        metrics.set_gauge(f"db.{name}.overflow", pool.overflow)
+        metrics.set_gauge(f"db.{name}.saturation", lambda p=pool: round(p.checkedout() / capacity, 3))
+
+
+# ============================================================================
+# Unit of work: одна сессия на апдейт Telegram
+# ============================================================================
+
+# Сессия текущего апдейта (ставит DbSessionMiddleware)
+_update_session: ContextVar[Optional[AsyncSession]] = ContextVar("update_session", default=None)
+# Счётчики апдейта: {"sessions": n, "connections": n}
+_update_stats: ContextVar[Optional[dict]] = ContextVar("update_stats", default=None)
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = _update_stats.get()
+    if stats is not None:
+        stats["connections"] += 1
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия на весь апдейт: все session_scope() внутри используют её,
+    коммит — один раз в конце (или release_connection() перед долгим ожиданием)
+    """
+    stats = {"sessions": 0, "connections": 0}
+    stats_token = _update_stats.set(stats)
+    async with async_session() as session:
+        token = _update_session.set(session)
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            # Фоновые задачи, унаследовавшие контекст апдейта, дальше работают со своими сессиями
+            session.info["uow_closed"] = True
+            _update_session.reset(token)
+            _update_stats.reset(stats_token)
+
+    # Импорт здесь: services импортирует database
+    from services import metrics
+    metrics.observe("db.sessions_per_update", stats["sessions"])
+    metrics.observe("db.connections_per_update", stats["connections"])
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для helper-функций
+
+    Внутри апдейта — общая сессия апдейта в savepoint (изменения только flush, коммит сделает
+    unit_of_work; ошибка внутри блока откатывает только его изменения, а не весь апдейт).
+    Вне апдейта (планировщик, фоновые задачи) — своя сессия с коммитом в конце.
+    """
+    stats = _update_stats.get()
+    if stats is not None:
+        stats["sessions"] += 1
+
+    session = _update_session.get()
+    if session is not None and not session.info.get("uow_closed"):
+        # Иначе упавший flush оставит транзакцию апдейта в failed-состоянии:
+        # следующие инструменты коуча и итоговый коммит тоже упадут
+        async with session.begin_nested():
+            yield session
+        return
+
+    async with async_session() as session:
+        yield session
+        await session.commit()
+
+
+async def release_connection():
+    """
+    Зафиксировать изменения апдейта и вернуть соединение в пул
+    (вызывать перед долгим внешним ожиданием, например запросом к LLM)
+    """
+    session = _update_session.get()
+    if session is not None:
+        await session.commit()
+
+
+def use_own_sessions():
+    """Отвязать текущую задачу от сессии апдейта (для параллельных запросов: AsyncSession не потокобезопасна)"""
+    _update_session.set(None)
+
+
+async def _move_raw_analyses(conn, source: str, drop_column: bool):
+    """
+    Перенести ai_raw_response из source в food_analyses (RAW_ANALYSES_MIGRATE)
+
+    Ошибка переноса (например, невалидный JSON) откатывает только его savepoint —
+    бот стартует, колонка остаётся. Колонка удаляется, только если drop_column
+    и каждая строка с ai_raw_response нашлась в food_analyses.
+
+    Args:
+        conn: Соединение внутри транзакции init_db
+        source: food_entries или food_entries_legacy (после перевода в партиции)
+        drop_column: Удалить колонку после проверенного переноса
+    """
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = :t AND column_name = 'ai_raw_response'"
+        ),
+        {"t": source}
+    )
+    if result.scalar() is None:
+        return
+
+    try:
+        async with conn.begin_nested():
+            await ensure_partitions_for(conn, "food_analyses", source)
+            result = await conn.execute(text(
+                "INSERT INTO food_analyses (food_entry_id, created_at, user_id, data) "
+                f'SELECT id, created_at, user_id, ai_raw_response::jsonb FROM "{source}" '
+                "WHERE ai_raw_response IS NOT NULL AND created_at IS NOT NULL "
+                "ON CONFLICT DO NOTHING"
+            ))
+    except Exception as e:
+        logger.error(f"[DB] Failed to move raw analyses from {source}, column kept: {e}")
+        return
+    logger.warning(f"[DB] Moved {result.rowcount} raw analyses from {source} to food_analyses")
+
+    if not drop_column:
+        return
+
+    result = await conn.execute(text(
+        f'SELECT count(*) FROM "{source}" s '
+        "WHERE s.ai_raw_response IS NOT NULL AND NOT EXISTS "
+        "(SELECT 1 FROM food_analyses a WHERE a.food_entry_id = s.id)"
+    ))
+    missing = result.scalar()
+    if missing:
+        logger.error(f"[DB] {missing} raw analyses from {source} are not in food_analyses, column kept")
+        return
+
+    await conn.execute(text(f'ALTER TABLE "{source}" DROP COLUMN ai_raw_response'))
+    logger.warning(f"[DB] Dropped {source}.ai_raw_response")
+
 
 async def init_db():
-    """Инициализация базы данных - создание всех таблиц"""
+    """Инициализация базы данных - создание всех таблиц и партиций"""
     async with engine.begin() as conn:
+        migrated = set()
+        if config.PARTITION_MIGRATE:
+            for table in PARTITIONED_TABLES:
+                if await migrate_table(conn, table):
+                    migrated.add(table)
         await conn.run_sync(Base.metadata.create_all)
+        for table in PARTITIONED_TABLES:
+            await ensure_partitions(conn, table)
+
+        if config.RAW_ANALYSES_MIGRATE:
+            await _move_raw_analyses(conn, "food_entries", drop_column=config.RAW_ANALYSES_DROP_COLUMN)
+            # Старая таблица после перевода в партиции (если есть) — колонку не трогаем
+            await _move_raw_analyses(conn, "food_entries_legacy", drop_column=False)
+    _register_pool_metrics()
 
 
 async def get_session() -> AsyncSession:
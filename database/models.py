@@ -1,5 +1,9 @@
-from datetime import datetime
-from sqlalchemy import BigInteger, String, Float, Integer, DateTime, Text, Boolean, ForeignKey
+from datetime import datetime, date
+from sqlalchemy import (
+    BigInteger, String, Float, Integer, SmallInteger, REAL, Date, DateTime, Text, Boolean, ForeignKey,
+    UniqueConstraint, Index
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -45,10 +49,16 @@ class User(Base):
     activity_entries: Mapped[list["ActivityEntry"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     conversation_messages: Mapped[list["ConversationMessage"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     user_memories: Mapped[list["UserMemory"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    weekly_reports: Mapped[list["WeeklyReport"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
 
 class FoodEntry(Base):
     __tablename__ = "food_entries"
+    # Помесячные партиции по created_at (см. database/partitions.py)
+    __table_args__ = (
+        Index("ix_food_entries_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"))
@@ -66,11 +76,35 @@ class FoodEntry(Base):
 
     # Мета
     photo_file_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    ai_raw_response: Mapped[str | None] = mapped_column(Text, nullable=True)
 
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Ключ партиции обязан входить в PK
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
 
     user: Mapped["User"] = relationship(back_populates="food_entries")
+    # Полный ответ AI — отдельная таблица, грузится только при обращении
+    analysis: Mapped["FoodAnalysis | None"] = relationship(
+        primaryjoin="FoodEntry.id == foreign(FoodAnalysis.food_entry_id)",
+        cascade="all, delete-orphan",
+        uselist=False
+    )
+
+
+class FoodAnalysis(Base):
+    """
+    Сырой разбор еды от AI (позиции, заметки, альтернативы)
+
+    Вынесен из food_entries, чтобы горячие запросы по еде не тянули TOAST.
+    FK на food_entries нет: обе таблицы партиционированы и чистятся
+    своими сроками хранения; удаление записи — каскадом ORM.
+    """
+    __tablename__ = "food_analyses"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+
+    food_entry_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Совпадает с food_entries.created_at — ключ партиции
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"))
+    data: Mapped[dict] = mapped_column(JSONB)
 
 
 class WeightEntry(Base):
@@ -89,13 +123,17 @@ class WeightEntry(Base):
 
 class WaterEntry(Base):
     __tablename__ = "water_entries"
+    __table_args__ = (
+        Index("ix_water_entries_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"))
 
     amount: Mapped[int] = mapped_column(Integer)  # мл
 
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
 
     user: Mapped["User"] = relationship(back_populates="water_entries")
 
@@ -119,12 +157,16 @@ class ActivityEntry(Base):
 class ConversationMessage(Base):
     """История диалога с AI коучем"""
     __tablename__ = "conversation_messages"
+    __table_args__ = (
+        Index("ix_conversation_messages_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"))
     role: Mapped[str] = mapped_column(String(20))  # "user" | "assistant"
     content: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
 
     user: Mapped["User"] = relationship(back_populates="conversation_messages")
 
@@ -141,3 +183,77 @@ class UserMemory(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user: Mapped["User"] = relationship(back_populates="user_memories")
+
+
+class HealthMetricSample(Base):
+    """
+    Сырые замеры метрик здоровья (пульс, сон и т.д.)
+
+    Узкая таблица (user_id, metric_id, ts, value) без суррогатного id:
+    рассчитана на частые замеры с часов. Relationship к User намеренно нет,
+    чтобы каскад ORM не подгружал тысячи строк — удаление через ON DELETE CASCADE.
+    """
+    __tablename__ = "health_metric_samples"
+
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    metric_id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)  # см. services/health_metrics.METRICS
+    ts: Mapped[datetime] = mapped_column(DateTime, primary_key=True)  # UTC
+    value: Mapped[float] = mapped_column(REAL)
+
+
+class HealthMetricDaily(Base):
+    """Дневные агрегаты метрик (min/avg/max) для дешёвых запросов трендов"""
+    __tablename__ = "health_metric_daily"
+
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    metric_id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # локальная дата пользователя
+
+    min_value: Mapped[float] = mapped_column(REAL)
+    max_value: Mapped[float] = mapped_column(REAL)
+    sum_value: Mapped[float] = mapped_column(Float)
+    sample_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    @property
+    def avg_value(self) -> float:
+        return self.sum_value / self.sample_count if self.sample_count else 0.0
+
+
+class WeeklyReport(Base):
+    """Недельный отчёт — считается пакетно по расписанию, /week читает готовый"""
+    __tablename__ = "weekly_reports"
+    __table_args__ = (UniqueConstraint("user_id", "period_start", name="uq_weekly_reports_user_period"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), index=True)
+
+    # Период — 7 полных локальных дней пользователя (period_end включительно)
+    period_start: Mapped[date] = mapped_column(Date)
+    period_end: Mapped[date] = mapped_column(Date)
+
+    days_logged: Mapped[int] = mapped_column(Integer, default=0)
+    avg_calories: Mapped[int] = mapped_column(Integer, default=0)
+    avg_protein: Mapped[float] = mapped_column(Float, default=0)
+    avg_water: Mapped[int] = mapped_column(Integer, default=0)  # мл
+    total_activity: Mapped[int] = mapped_column(Integer, default=0)  # ккал
+    adherence_pct: Mapped[int] = mapped_column(Integer, default=0)  # % дней в коридоре 80-110% цели
+
+    weight_start: Mapped[float | None] = mapped_column(Float, nullable=True)
+    weight_end: Mapped[float | None] = mapped_column(Float, nullable=True)
+    weight_delta: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+    best_day: Mapped[date | None] = mapped_column(Date, nullable=True)
+    best_day_calories: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    worst_day: Mapped[date | None] = mapped_column(Date, nullable=True)
+    worst_day_calories: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    calorie_goal: Mapped[int] = mapped_column(Integer, default=2000)  # цель на момент расчёта
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    delivered_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    user: Mapped["User"] = relationship(back_populates="weekly_reports")
@@ -0,0 +1,270 @@
+"""
+Помесячные партиции таблиц записей
+- food_entries, food_analyses, water_entries, conversation_messages: RANGE (created_at),
+  партиция на месяц + DEFAULT
+- Обслуживание раз в сутки: партиции на PARTITION_MONTHS_AHEAD месяцев вперёд,
+  отсоединение (archive) или удаление (drop) партиций старше срока хранения таблицы
+- Перевод существующих обычных таблиц — только по флагу PARTITION_MIGRATE
+"""
+import logging
+import re
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+import config
+from database.models import Base
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("food_entries", "food_analyses", "water_entries", "conversation_messages")
+
+# Имя партиции: <таблица>_pYYYYMM
+_PARTITION_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+# Обслуживание не должно надолго блокировать горячие таблицы
+_LOCK_TIMEOUT = "5s"
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+# ============================================================================
+# Каталог
+# ============================================================================
+
+async def _table_exists(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(text("SELECT to_regclass(:t)"), {"t": table})
+    return result.scalar() is not None
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.oid = to_regclass(:t)"
+        ),
+        {"t": table}
+    )
+    return result.scalar() is not None
+
+
+async def _partitions(conn: AsyncConnection, table: str) -> list[str]:
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:t)"
+        ),
+        {"t": table}
+    )
+    return [row[0] for row in result]
+
+
+# ============================================================================
+# Создание партиций
+# ============================================================================
+
+async def _create_partition(conn: AsyncConnection, table: str, month: date) -> bool:
+    """
+    Создать партицию месяца (если её нет)
+
+    Строки этого месяца, уже попавшие в DEFAULT, переносятся в новую партицию:
+    иначе Postgres не даст создать пересекающийся диапазон.
+    """
+    name = partition_name(table, month)
+    if await _table_exists(conn, name):
+        return False
+
+    start, end = month.isoformat(), _add_months(month, 1).isoformat()
+    default = f"{table}_default"
+    bounds = {"start": start, "end": end}
+
+    stray = 0
+    if await _table_exists(conn, default):
+        result = await conn.execute(
+            text(f'SELECT count(*) FROM "{default}" WHERE created_at >= :start AND created_at < :end'),
+            bounds
+        )
+        stray = result.scalar()
+
+    if stray:
+        await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+
+    await conn.execute(text(
+        f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (\'{start}\') TO (\'{end}\')'
+    ))
+
+    if stray:
+        await conn.execute(
+            text(f'INSERT INTO "{table}" SELECT * FROM "{default}" WHERE created_at >= :start AND created_at < :end'),
+            bounds
+        )
+        await conn.execute(
+            text(f'DELETE FROM "{default}" WHERE created_at >= :start AND created_at < :end'),
+            bounds
+        )
+        await conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT'))
+        logger.warning(f"[PARTITIONS] Moved {stray} rows from {default} to {name}")
+
+    logger.info(f"[PARTITIONS] Created {name}")
+    return True
+
+
+async def ensure_partitions(conn: AsyncConnection, table: str, today: Optional[date] = None) -> int:
+    """
+    Партиции с текущего месяца на PARTITION_MONTHS_AHEAD вперёд + DEFAULT
+
+    Returns:
+        Количество созданных партиций
+    """
+    if not await is_partitioned(conn, table):
+        logger.warning(f"[PARTITIONS] {table} is not partitioned, set PARTITION_MIGRATE=true to convert it")
+        return 0
+
+    await conn.execute(text(f"SET LOCAL lock_timeout = '{_LOCK_TIMEOUT}'"))
+    await conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+    current = _month_start(today or datetime.utcnow().date())
+    created = 0
+    for i in range(config.PARTITION_MONTHS_AHEAD + 1):
+        created += await _create_partition(conn, table, _add_months(current, i))
+    return created
+
+
+async def ensure_partitions_for(conn: AsyncConnection, table: str, source: str) -> int:
+    """
+    Партиции table под весь диапазон created_at таблицы source (перед переносом старых данных)
+
+    Returns:
+        Количество созданных партиций
+    """
+    result = await conn.execute(text(f'SELECT min(created_at), max(created_at) FROM "{source}"'))
+    oldest, newest = result.one()
+    if oldest is None:
+        return 0
+
+    created = 0
+    month, last = _month_start(oldest.date()), _month_start(newest.date())
+    while month <= last:
+        created += await _create_partition(conn, table, month)
+        month = _add_months(month, 1)
+    return created
+
+
+# ============================================================================
+# Срок хранения
+# ============================================================================
+
+async def apply_retention(conn: AsyncConnection, table: str, today: Optional[date] = None) -> list[str]:
+    """
+    Отсоединить или удалить партиции старше срока хранения таблицы
+
+    Партиция уходит целиком, когда весь её месяц старше
+    PARTITION_RETENTION[table] месяцев; DEFAULT не трогаем.
+
+    Returns:
+        Имена обработанных партиций
+    """
+    months = config.PARTITION_RETENTION.get(table, 0)
+    if months <= 0:
+        return []
+
+    cutoff = _add_months(_month_start(today or datetime.utcnow().date()), -months)
+    expired = []
+    for name in await _partitions(conn, table):
+        m = _PARTITION_RE.match(name)
+        if not m or m.group("table") != table:
+            continue
+        month = date(int(m.group("year")), int(m.group("month")), 1)
+        if _add_months(month, 1) <= cutoff:
+            expired.append(name)
+
+    if not expired:
+        return []
+
+    await conn.execute(text(f"SET LOCAL lock_timeout = '{_LOCK_TIMEOUT}'"))
+    for name in sorted(expired):
+        await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        if config.PARTITION_RETENTION_ACTION == "drop":
+            await conn.execute(text(f'DROP TABLE "{name}"'))
+            logger.info(f"[PARTITIONS] Dropped {name}")
+        else:
+            # Отсоединённая таблица остаётся как архив (выгрузить и удалить вручную)
+            logger.info(f"[PARTITIONS] Detached {name} (archive)")
+    return expired
+
+
+# ============================================================================
+# Перевод существующих таблиц
+# ============================================================================
+
+async def migrate_table(conn: AsyncConnection, table: str) -> bool:
+    """
+    Перевести обычную таблицу в партиционированную
+
+    Старая таблица переименовывается в <table>_legacy (без FK на users,
+    чтобы не мешать удалению пользователей), данные копируются в новую.
+    Legacy удаляется вручную после проверки.
+
+    Returns:
+        True, если таблица переведена
+    """
+    if not await _table_exists(conn, table) or await is_partitioned(conn, table):
+        return False
+
+    legacy = f"{table}_legacy"
+    logger.warning(f"[PARTITIONS] Migrating {table} → partitioned (old data kept in {legacy})")
+
+    await conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+    await conn.execute(text(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy}_pkey"'))
+    await conn.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT IF EXISTS "{table}_user_id_fkey"'))
+
+    model_table = Base.metadata.tables[table]
+    await conn.run_sync(lambda sync_conn: model_table.create(sync_conn))
+    await conn.execute(text(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+    # Партиции под весь диапазон старых данных
+    await ensure_partitions_for(conn, table, legacy)
+
+    columns = [c.name for c in model_table.columns]
+    select_list = ", ".join(
+        "COALESCE(created_at, timezone('utc', now()))" if c == "created_at" else f'"{c}"' for c in columns
+    )
+    result = await conn.execute(text(
+        f'INSERT INTO "{table}" ({", ".join(columns)}) SELECT {select_list} FROM "{legacy}"'
+    ))
+    await conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f'COALESCE((SELECT max(id) FROM "{table}"), 0) + 1, false)'
+    ))
+    logger.warning(f"[PARTITIONS] Copied {result.rowcount} rows into {table}; drop {legacy} when verified")
+    return True
+
+
+async def maintain_partitions():
+    """Ежедневное обслуживание: будущие партиции и срок хранения (каждая таблица — своя транзакция)"""
+    # Импорт здесь: db импортирует этот модуль из init_db
+    from database.db import engine
+
+    for table in PARTITIONED_TABLES:
+        try:
+            async with engine.begin() as conn:
+                await ensure_partitions(conn, table)
+            async with engine.begin() as conn:
+                await apply_retention(conn, table)
+        except Exception as e:
+            logger.error(f"[PARTITIONS] Maintenance failed for {table}: {e}")
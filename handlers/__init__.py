@@ -2,6 +2,7 @@ from aiogram import Router
 
 # Импортируем все роутеры
 from handlers.onboarding import router as onboarding_router
+from handlers.commands import router as commands_router
 from handlers.chat import router as chat_router
 from handlers.photo import router as photo_router
 from handlers.callbacks import router as callbacks_router
@@ -24,10 +25,14 @@ def setup_routers() -> Router:
     # 2. Фото - обрабатывает фото еды
     main_router.include_router(photo_router)
 
-    # 3. Callbacks - все inline кнопки
+    # 3. Callbacks - inline кнопки без своего раздела (подтверждение еды, сон)
     main_router.include_router(callbacks_router)
 
-    # 4. Специфические handlers для кнопок и команд
+    # 4. Команды и кнопки меню - один поиск по индексу (handlers/commands.py),
+    #    хендлеры регистрируются через @command в своих модулях
+    main_router.include_router(commands_router)
+
+    # 5. Специфические handlers: свои inline кнопки и состояния ввода
     main_router.include_router(water_router)
     main_router.include_router(stats_router)
     main_router.include_router(settings_router)
@@ -35,7 +40,7 @@ def setup_routers() -> Router:
     main_router.include_router(activity_router)
     main_router.include_router(health_router)
 
-    # 5. Chat - главный AI handler для текста (должен быть последним!)
+    # 6. Chat - главный AI handler для текста (должен быть последним!)
     main_router.include_router(chat_router)
 
     return main_router
@@ -1,5 +1,5 @@
 from datetime import datetime
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -8,6 +8,8 @@ from sqlalchemy import select, func
 from database.db import async_session
 from database.models import User, ActivityEntry
 from services.ai import estimate_activity_calories
+from services.llm_scheduler import llm_requester, queue_notice
+from handlers.commands import command
 
 router = Router()
 
@@ -16,7 +18,7 @@ class ActivityStates(StatesGroup):
     waiting_for_activity = State()
 
 
-@router.message(F.text == "🏃 Активность")
+@command("🏃 Активность")
 async def handle_activity_button(message: Message, state: FSMContext):
     """Кнопка активности"""
     user_id = message.from_user.id
@@ -65,7 +67,7 @@ async def handle_activity_button(message: Message, state: FSMContext):
     await state.set_state(ActivityStates.waiting_for_activity)
 
 
-@router.message(F.text.lower().startswith("/activity"))
+@command("/activity")
 async def cmd_activity(message: Message):
     """Команда /activity [тип] [минуты]"""
     text = message.text.replace("/activity", "").strip()
@@ -135,7 +137,8 @@ async def process_activity(message: Message, text: str):
             weight = user.current_weight if user and user.current_weight else 70
 
         # Оцениваем калории через AI
-        result = await estimate_activity_calories(activity_type, duration, weight)
+        with llm_requester(user_id, queue_notice(processing_msg, "🔄 Рассчитываю калории...")):
+            result = await estimate_activity_calories(activity_type, duration, weight)
         calories = result.get("calories_burned", 0)
 
         # Сохраняем в базу
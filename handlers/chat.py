@@ -3,18 +3,20 @@ Chat Handler - Главный обработчик текстовых сообщ
 Все текстовые сообщения идут через AI коуча
 """
 import logging
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Filter
 from sqlalchemy import select
 
-from database.db import async_session
+from database.db import session_scope, release_connection
 from database.models import User
 from services.coach import handle_message, get_user_context
-from services.ai import generate_meal_plan
+from services.meal_plans import get_meal_plan
+from services.llm_scheduler import llm_requester, queue_notice
 from services.memory import get_memories
 from keyboards.main import get_main_keyboard
+from handlers.commands import command
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -43,7 +45,7 @@ class ChatTextFilter(Filter):
         return True
 
 
-@router.message(F.text == "🍽 План питания")
+@command("🍽 План питания")
 async def handle_meal_plan_button(message: Message):
     """Кнопка плана питания"""
     user_id = message.from_user.id
@@ -51,25 +53,31 @@ async def handle_meal_plan_button(message: Message):
     processing_msg = await message.answer("🍽 Составляю план питания...")
 
     try:
-        async with async_session() as session:
+        async with session_scope() as session:
             result = await session.execute(select(User).where(User.id == user_id))
             user = result.scalar_one_or_none()
-            calorie_goal = user.calorie_goal if user else 2000
+            calorie_goal = (user.calorie_goal if user else None) or 2000
+            goal = user.goal if user else None
+            country = user.country if user else None
 
-        # Получаем ограничения из памяти
-        memories = await get_memories(user_id, category="restriction")
-        restrictions = ", ".join([m["content"] for m in memories]) if memories else None
+        # Получаем ограничения и предпочтения из памяти
+        restrictions = [m["content"] for m in await get_memories(user_id, category="restriction")]
+        preferences = [m["content"] for m in await get_memories(user_id, category="preference")]
 
-        # Получаем предпочтения
-        preferences_mem = await get_memories(user_id, category="preference")
-        preferences = ", ".join([m["content"] for m in preferences_mem]) if preferences_mem else None
+        await release_connection()
+        # Типовой профиль — готовый план из кэша, с предпочтениями — новый
+        with llm_requester(user_id, queue_notice(processing_msg, "🍽 Составляю план питания...")):
+            plan, plan_calories = await get_meal_plan(calorie_goal, goal, restrictions, country, preferences)
 
-        plan = await generate_meal_plan(calorie_goal, preferences, restrictions)
+        # Типовой план считается на округлённую калорийность — цель показываем настоящую
+        target = f"🎯 Цель: {calorie_goal} ккал"
+        if plan_calories != calorie_goal:
+            target += f" (план примерно на {plan_calories} ккал)"
 
         await processing_msg.delete()
         await message.answer(
             f"🍽 **План питания на день**\n"
-            f"🎯 Цель: {calorie_goal} ккал\n\n"
+            f"{target}\n\n"
             f"{plan}",
             parse_mode="Markdown"
         )
@@ -79,13 +87,13 @@ async def handle_meal_plan_button(message: Message):
         await processing_msg.edit_text(f"❌ Ошибка: {str(e)[:100]}")
 
 
-@router.message(F.text.lower().startswith("/plan"))
+@command("/plan")
 async def cmd_plan(message: Message):
     """Команда /plan"""
     await handle_meal_plan_button(message)
 
 
-@router.message(F.text.lower().startswith("/help"))
+@command("/help")
 async def cmd_help(message: Message):
     """Команда /help"""
     await message.answer(
@@ -106,6 +114,7 @@ async def cmd_help(message: Message):
         "/stats — статистика за сегодня\n"
         "/stats 1 — статистика за вчера\n"
         "/history — история за неделю\n"
+        "/chart — графики прогресса\n"
         "/plan — план питания\n"
         "/weight 75.5 — записать вес\n"
         "/water 250 — записать воду\n\n"
@@ -147,7 +156,7 @@ async def handle_text_message(message: Message, state: FSMContext):
             return
 
     # Проверяем существование пользователя
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -159,14 +168,14 @@ async def handle_text_message(message: Message, state: FSMContext):
                 first_name=message.from_user.first_name
             )
             session.add(user)
-            await session.commit()
 
     # Отправляем индикатор обработки
     processing_msg = await message.answer("💭 Думаю...")
 
     try:
         # Обрабатываем через AI коуча
-        response = await handle_message(user_id, text)
+        with llm_requester(user_id, queue_notice(processing_msg, "💭 Думаю...")):
+            response = await handle_message(user_id, text)
 
         # Удаляем индикатор и отправляем ответ
         await processing_msg.delete()
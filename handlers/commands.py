@@ -0,0 +1,80 @@
+"""
+Commands - индекс текстовых команд и кнопок меню
+Вместо фильтра F.text.lower().startswith(...) в каждом роутере — один поиск в словаре на апдейт:
+точный текст (кнопка меню) или первое слово (/команда). Хендлеры регистрируются через @command
+"""
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from aiogram import Router
+from aiogram.filters import Filter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+Handler = Callable[..., Awaitable[Any]]
+
+# "/stats" или "📊 Статистика" → (хендлер, нужен ли ему state)
+_index: dict[str, tuple[Handler, bool]] = {}
+
+# Состояния ввода, которые команда или кнопка меню отменяет
+# (их хендлеры сами очищают состояние, получив «/...» или кнопку)
+_CANCELLED_STATES = ("SettingsStates:", "WeightStates:", "ActivityStates:")
+
+
+def command(*keys: str) -> Callable[[Handler], Handler]:
+    """
+    Зарегистрировать хендлер команды или кнопки меню
+
+    Args:
+        keys: "/команда" (без учёта регистра, совпадение по первому слову)
+              или точный текст кнопки
+    """
+    def decorator(handler: Handler) -> Handler:
+        needs_state = "state" in inspect.signature(handler).parameters
+        for key in keys:
+            key = key.lower() if key.startswith("/") else key
+            if key in _index:
+                raise ValueError(f"Command {key!r} is already registered by {_index[key][0].__qualname__}")
+            _index[key] = (handler, needs_state)
+        return handler
+    return decorator
+
+
+def lookup(text: Optional[str]) -> Optional[tuple[Handler, bool]]:
+    """Хендлер для текста сообщения (None — не команда и не кнопка)"""
+    if not text:
+        return None
+    if not text.startswith("/"):
+        return _index.get(text)
+
+    first = text.split(maxsplit=1)[0].lower()
+    # /stats@my_bot — команда из группы
+    return _index.get(first.split("@", 1)[0])
+
+
+class CommandIndexFilter(Filter):
+    """Пропускает только команды и кнопки из индекса; найденный хендлер передаёт дальше"""
+
+    async def __call__(self, message: Message) -> bool | dict[str, Any]:
+        found = lookup(message.text)
+        if found is None:
+            return False
+        return {"command_handler": found}
+
+
+@router.message(CommandIndexFilter())
+async def dispatch_command(message: Message, state: FSMContext, command_handler: tuple[Handler, bool]):
+    """Выполнить команду из индекса"""
+    handler, needs_state = command_handler
+
+    current_state = await state.get_state()
+    if current_state and current_state.startswith(_CANCELLED_STATES):
+        logger.info(f"[COMMANDS] user={message.from_user.id} | {message.text.split()[0]} cancels {current_state}")
+        await state.clear()
+
+    if needs_state:
+        return await handler(message, state=state)
+    return await handler(message)
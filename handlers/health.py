@@ -7,12 +7,14 @@
 /health калории 450
 """
 from datetime import datetime
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
 from sqlalchemy import select
 
 from database.db import async_session
 from database.models import User, ActivityEntry
+from services.health_metrics import record_sample
+from handlers.commands import command
 
 router = Router()
 
@@ -20,7 +22,7 @@ router = Router()
 CALORIES_PER_STEP = 0.045
 
 
-@router.message(F.text.lower().startswith("/health"))
+@command("/health")
 async def cmd_health(message: Message):
     """Обработка данных из Apple Health"""
     user_id = message.from_user.id
@@ -61,6 +63,8 @@ async def cmd_health(message: Message):
             await session.flush()
 
         response = ""
+        # Метрика для таблицы замеров (пишем после commit — нужен User для FK)
+        metric_sample = None
 
         if data_type in ["шаги", "steps"]:
             steps = int(value)
@@ -78,12 +82,12 @@ async def cmd_health(message: Message):
 
         elif data_type in ["пульс", "heart", "hr"]:
             hr = int(value)
-            # Сохраняем как заметку в последнюю запись активности или создаём новую
-            response = f"❤️ Пульс: **{hr}** уд/мин"
-            # Можно добавить отдельную таблицу для пульса если нужно
+            metric_sample = ("heart_rate", hr)
+            response = f"❤️ Пульс: **{hr}** уд/мин записан"
 
         elif data_type in ["сон", "sleep"]:
             hours = value
+            metric_sample = ("sleep_hours", hours)
             response = f"😴 Сон: **{hours}** часов"
             if hours < 6:
                 response += "\n⚠️ Маловато! Рекомендуется 7-9 часов"
@@ -132,11 +136,16 @@ async def cmd_health(message: Message):
             return
 
         await session.commit()
+        timezone = user.timezone
+
+    if metric_sample:
+        metric, metric_value = metric_sample
+        await record_sample(user_id, metric, metric_value, timezone=timezone)
 
     await message.answer(response, parse_mode="Markdown")
 
 
-@router.message(F.text.lower().startswith("/sync"))
+@command("/sync")
 async def cmd_sync(message: Message):
     """Массовый импорт данных из Apple Health"""
     user_id = message.from_user.id
@@ -150,12 +159,14 @@ async def cmd_sync(message: Message):
             "шаги:8500\n"
             "калории:450\n"
             "сон:7.5\n"
+            "пульс:72\n"
             "```",
             parse_mode="Markdown"
         )
         return
 
     results = []
+    metric_samples = []
     lines = text.strip().split("\n")
 
     async with async_session() as session:
@@ -203,9 +214,18 @@ async def cmd_sync(message: Message):
                 results.append(f"🔥 {calories} активных ккал")
 
             elif key in ["сон", "sleep"]:
+                metric_samples.append(("sleep_hours", value))
                 results.append(f"😴 {value} ч сна")
 
+            elif key in ["пульс", "heart", "hr"]:
+                metric_samples.append(("heart_rate", int(value)))
+                results.append(f"❤️ Пульс {int(value)} уд/мин")
+
         await session.commit()
+        timezone = user.timezone
+
+    for metric, metric_value in metric_samples:
+        await record_sample(user_id, metric, metric_value, timezone=timezone)
 
     if results:
         await message.answer(
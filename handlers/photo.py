@@ -4,29 +4,26 @@ Photo Handler - Обработка фото (еда и фитнес-трекер
 """
 import asyncio
 import logging
-from typing import Dict, List, Tuple
+from functools import partial
+from io import BytesIO
 from aiogram import Router, F, Bot
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select
 
-from database.db import async_session
+from database.db import session_scope, release_connection, use_own_sessions
 from database.models import User
-from services.ai import analyze_food_image, analyze_food_images_batch
-from services.coach import format_food_analysis, handle_fitness_photo, handle_medical_photo, get_user_context
+from services.ai import analyze_food_image, analyze_food_album, correct_food_analysis
+from services.coach import format_food_analysis, handle_fitness_photo, handle_medical_photo, get_day_snapshot
+from services.food_corrections import apply_correction
+from services.albums import Album, AlbumCollector
+from services.llm_scheduler import llm_requester, queue_notice
 from keyboards.main import get_main_keyboard, get_food_confirm_keyboard
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Хранилище для альбомов: {media_group_id: {"photos": [...], "user_id": ..., "message": ..., "state": ...}}
-_album_storage: Dict[str, dict] = {}
-_album_locks: Dict[str, asyncio.Lock] = {}
-
-# Время ожидания всех фото альбома (секунды)
-ALBUM_COLLECT_TIMEOUT = 1.5
-
 
 class PhotoStates(StatesGroup):
     """Состояния для обработки фото"""
@@ -34,40 +31,50 @@ class PhotoStates(StatesGroup):
     waiting_food_correction = State()  # Ожидание исправления
 
 
-async def _get_album_lock(media_group_id: str) -> asyncio.Lock:
-    """Получить блокировку для конкретного альбома"""
-    if media_group_id not in _album_locks:
-        _album_locks[media_group_id] = asyncio.Lock()
-    return _album_locks[media_group_id]
+async def _download_photo(bot: Bot, file_id: str) -> bytes:
+    """Скачать фото (для альбома — задачей, параллельно с остальными фото)"""
+    file = await bot.get_file(file_id)
+    buffer = BytesIO()
+    await bot.download_file(file.file_path, destination=buffer)
+    # getvalue() отдаёт буфер без копии (read() копирует)
+    return buffer.getvalue()
 
 
-async def _process_album(media_group_id: str, bot: Bot):
+async def _process_album(album: Album):
     """
-    Обрабатывает собранный альбом после таймаута
+    Обрабатывает собранный альбом (вызывается сборщиком, когда альбом «затих»)
     """
-    # Ждём пока соберутся все фото
-    await asyncio.sleep(ALBUM_COLLECT_TIMEOUT)
-
-    lock = await _get_album_lock(media_group_id)
-    async with lock:
-        if media_group_id not in _album_storage:
-            return
+    # Фоновая задача живёт дольше апдейта — сессия апдейта ей не подходит
+    use_own_sessions()
 
-        album_data = _album_storage.pop(media_group_id)
-        # Очищаем lock
-        _album_locks.pop(media_group_id, None)
+    user_id = album.user_id
+    first_message = album.message
+    state = album.state
 
-    photos_data = album_data["photos"]
-    user_id = album_data["user_id"]
-    first_message = album_data["message"]
-    state = album_data["state"]
-    processing_msg = album_data.get("processing_msg")
+    photos_data = await album.photos()
+    processing_msg = await album.notice_message()
+    if not photos_data:
+        text = "❌ Не удалось загрузить фото. Попробуй отправить ещё раз."
+        if processing_msg:
+            await processing_msg.edit_text(text)
+        else:
+            await first_message.answer(text)
+        return
 
     logger.info(f"[ALBUM] user={user_id} | Processing {len(photos_data)} photos")
 
+    # Часть фото не влезла в бюджет памяти или не скачалась — анализ будет по неполному альбому
+    skipped = album.size + album.dropped - len(photos_data)
+    if skipped:
+        await first_message.answer(
+            f"⚠️ {skipped} из {album.size + album.dropped} фото не удалось обработать — "
+            f"анализирую остальные. Пропущенные можно отправить отдельно."
+        )
+
     try:
-        # Анализируем все фото вместе
-        photo_data = await analyze_food_images_batch(photos_data)
+        # Фото анализируются параллельно и складываются (общий запрос — только если нужно)
+        with llm_requester(user_id, queue_notice(processing_msg, "🔍 Анализирую альбом...")):
+            photo_data = await analyze_food_album(photos_data)
         photo_type = photo_data.get("type", "food")
 
         if photo_type == "fitness":
@@ -88,7 +95,8 @@ async def _process_album(media_group_id: str, bot: Bot):
 
         elif photo_type == "food":
             # Еда - показываем анализ и просим подтвердить
-            response = await format_food_analysis(user_id, photo_data, saved=False)
+            snapshot = await get_day_snapshot(user_id)
+            response = await format_food_analysis(user_id, photo_data, snapshot, saved=False)
             response += "\n\n_Нажми «Записать» или напиши уточнение_"
 
             items = photo_data.get("items", [])
@@ -98,9 +106,9 @@ async def _process_album(media_group_id: str, bot: Bot):
                 f"{total_cal} ккал | waiting confirm"
             )
 
-            # Сохраняем данные в FSM для подтверждения
+            # Сохраняем данные и снимок дня в FSM для подтверждения
             await state.set_state(PhotoStates.waiting_food_confirm)
-            await state.update_data(pending_food=photo_data)
+            await state.update_data(pending_food=photo_data, day_snapshot=snapshot)
 
             if processing_msg:
                 try:
@@ -164,12 +172,28 @@ async def _process_album(media_group_id: str, bot: Bot):
                 )
 
 
+_albums = AlbumCollector(_process_album)
+
+
+async def _skip_late_photo(message: Message, late: int):
+    """Фото альбома, который уже анализируется: сообщаем один раз на альбом"""
+    logger.info(f"[PHOTO] user={message.from_user.id} | Late album photo skipped, group={message.media_group_id}")
+    if late == 1:
+        await message.answer("⚠️ Часть фото альбома пришла позже и не вошла в анализ. Отправь их отдельно.")
+
+
 @router.message(F.photo)
 async def handle_photo(message: Message, state: FSMContext):
     """Обработка фото (еда или фитнес-трекер, включая альбомы)"""
     user_id = message.from_user.id
     media_group_id = message.media_group_id
 
+    # Фото альбома, который уже анализируется: не начинаем второй анализ
+    # и не сбрасываем ожидание подтверждения первого
+    if media_group_id and (late := _albums.late(media_group_id)):
+        await _skip_late_photo(message, late)
+        return
+
     # Проверяем состояние FSM
     current_state = await state.get_state()
 
@@ -186,8 +210,8 @@ async def handle_photo(message: Message, state: FSMContext):
         logger.info(f"[PHOTO] user={user_id} | Skip: user in state {current_state}")
         return
 
-    # Проверяем/создаём пользователя
-    async with async_session() as session:
+    # Проверяем/создаём пользователя (в сессии апдейта — снимок дня прочитается через неё же)
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -198,39 +222,35 @@ async def handle_photo(message: Message, state: FSMContext):
                 first_name=message.from_user.first_name
             )
             session.add(user)
-            await session.commit()
+
+    # Скачивание и анализ фото долгие — соединение возвращаем в пул
+    await release_connection()
 
     # Получаем фото максимального размера
     photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)
-    file_data = await message.bot.download_file(file.file_path)
-    image_bytes = file_data.read()
 
     # Если это альбом (несколько фото)
     if media_group_id:
         logger.info(f"[PHOTO] user={user_id} | Album photo, group={media_group_id}")
 
-        lock = await _get_album_lock(media_group_id)
-        async with lock:
-            if media_group_id not in _album_storage:
-                # Первое фото в альбоме - инициализируем хранилище
-                _album_storage[media_group_id] = {
-                    "photos": [],
-                    "user_id": user_id,
-                    "message": message,
-                    "state": state,
-                    "processing_msg": None
-                }
-                # Отправляем сообщение о начале анализа
-                processing_msg = await message.answer("🔍 Анализирую альбом...")
-                _album_storage[media_group_id]["processing_msg"] = processing_msg
-
-                # Запускаем таймер обработки
-                asyncio.create_task(_process_album(media_group_id, message.bot))
-
-            # Добавляем фото в альбом
-            _album_storage[media_group_id]["photos"].append((image_bytes, "image/jpeg"))
-
+        # Скачивание стартует сразу; анализ — когда альбом «затихнет»
+        album = _albums.add(
+            media_group_id, user_id, message, state,
+            partial(_download_photo, message.bot, photo.file_id),
+            size_hint=photo.file_size
+        )
+        if isinstance(album, int):
+            # Альбом ушёл в обработку, пока шёл этот апдейт
+            await _skip_late_photo(message, album)
+            return
+        if album.rejected:
+            # Отвечаем один раз на альбом
+            if album.dropped == 1:
+                await message.answer("⏳ Сейчас слишком много фото в обработке. Отправь альбом через минуту.")
+            return
+        if album.size == 1:
+            # Отправка не задерживает обработчик: альбом может «затихнуть» раньше
+            album.notice = asyncio.ensure_future(message.answer("🔍 Анализирую альбом..."))
         return
 
     # Одиночное фото - обрабатываем сразу
@@ -239,8 +259,11 @@ async def handle_photo(message: Message, state: FSMContext):
     processing_msg = await message.answer("🔍 Анализирую фото...")
 
     try:
+        image_bytes = await _download_photo(message.bot, photo.file_id)
+
         # Анализируем через AI
-        photo_data = await analyze_food_image(image_bytes)
+        with llm_requester(user_id, queue_notice(processing_msg, "🔍 Анализирую фото...")):
+            photo_data = await analyze_food_image(image_bytes)
         photo_type = photo_data.get("type", "food")
 
         # Обрабатываем в зависимости от типа
@@ -258,7 +281,8 @@ async def handle_photo(message: Message, state: FSMContext):
 
         elif photo_type == "food":
             # Еда - показываем анализ и просим подтвердить
-            response = await format_food_analysis(user_id, photo_data, saved=False)
+            snapshot = await get_day_snapshot(user_id)
+            response = await format_food_analysis(user_id, photo_data, snapshot, saved=False)
             response += "\n\n_Нажми «Записать» или напиши уточнение_"
 
             logger.info(
@@ -266,9 +290,9 @@ async def handle_photo(message: Message, state: FSMContext):
                 f"{photo_data.get('total', {}).get('calories', 0)} ккал | waiting confirm"
             )
 
-            # Сохраняем данные в FSM для подтверждения
+            # Сохраняем данные и снимок дня в FSM для подтверждения
             await state.set_state(PhotoStates.waiting_food_confirm)
-            await state.update_data(pending_food=photo_data)
+            await state.update_data(pending_food=photo_data, day_snapshot=snapshot)
 
             await processing_msg.delete()
             await message.answer(
@@ -339,21 +363,28 @@ async def handle_food_correction_text(message: Message, state: FSMContext):
         await message.answer("❌ Данные о еде не найдены. Отправь фото заново.")
         return
 
-    processing_msg = await message.answer("🔄 Уточняю...")
+    processing_msg = None
 
     try:
-        # Вызываем AI для корректировки данных
-        from services.ai import correct_food_analysis
-        corrected_food = await correct_food_analysis(pending_food, text)
+        # Простые правки («без соуса», «порция 300г», «плюс кофе») — локально, без LLM
+        corrected_food = apply_correction(pending_food, text)
+        if corrected_food is None:
+            processing_msg = await message.answer("🔄 Уточняю...")
+            with llm_requester(user_id, queue_notice(processing_msg, "🔄 Уточняю...")):
+                corrected_food = await correct_food_analysis(pending_food, text)
+
+        # Снимок дня из FSM — без запросов к БД, если он ещё свежий
+        snapshot = await get_day_snapshot(user_id, data.get("day_snapshot"))
 
         # Обновляем данные в FSM
-        await state.update_data(pending_food=corrected_food)
+        await state.update_data(pending_food=corrected_food, day_snapshot=snapshot)
 
         # Показываем обновлённый анализ
-        response = await format_food_analysis(user_id, corrected_food, saved=False)
+        response = await format_food_analysis(user_id, corrected_food, snapshot, saved=False)
         response += "\n\n_Нажми «Записать» или напиши ещё уточнение_"
 
-        await processing_msg.delete()
+        if processing_msg:
+            await processing_msg.delete()
         await message.answer(
             response,
             parse_mode="Markdown",
@@ -362,6 +393,8 @@ async def handle_food_correction_text(message: Message, state: FSMContext):
 
     except Exception as e:
         logger.error(f"[PHOTO] user={user_id} | Correction error: {e}")
-        await processing_msg.edit_text(
-            f"❌ Ошибка при корректировке. Попробуй записать как есть или отправь новое фото."
-        )
+        error_text = "❌ Ошибка при корректировке. Попробуй записать как есть или отправь новое фото."
+        if processing_msg:
+            await processing_msg.edit_text(error_text)
+        else:
+            await message.answer(error_text)
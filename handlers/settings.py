@@ -7,6 +7,7 @@ from sqlalchemy import select
 from database.db import async_session
 from database.models import User
 from keyboards.main import get_settings_keyboard, get_reminders_keyboard
+from handlers.commands import command
 
 router = Router()
 
@@ -24,14 +25,23 @@ MENU_BUTTONS = {
     "🍽 План питания", "⚙️ Настройки"
 }
 
+REMINDERS_TEXT = "🔔 **Настройки напоминаний**\n\nВключи/выключи нужные напоминания:"
 
-@router.message(F.text == "⚙️ Настройки")
+# Тип напоминания из callback_data → (поле User, «о чём» для ответа)
+REMINDER_FIELDS = {
+    "water": ("remind_water", "воде"),
+    "food": ("remind_food", "еде"),
+    "weight": ("remind_weight", "весе"),
+}
+
+
+@command("⚙️ Настройки")
 async def handle_settings_button(message: Message):
     """Кнопка настроек"""
     await show_settings(message)
 
 
-@router.message(F.text.lower().startswith("/settings"))
+@command("/settings")
 async def cmd_settings(message: Message):
     """Команда /settings"""
     await show_settings(message)
@@ -71,10 +81,10 @@ async def show_settings(message: Message):
 
 @router.callback_query(F.data == "set_calories")
 async def set_calories_callback(callback: CallbackQuery, state: FSMContext):
-    """Установка цели калорий"""
+    """Начать изменение цели калорий"""
     await callback.message.edit_text(
-        "🎯 **Цель калорий**\n\n"
-        "Отправь число (например: 2000)",
+        "🎯 **Цель по калориям**\n\n"
+        "Введи новое значение (500-10000 ккал):",
         parse_mode="Markdown"
     )
     await state.set_state(SettingsStates.waiting_for_calories)
@@ -112,10 +122,10 @@ async def process_calories_input(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "set_water")
 async def set_water_callback(callback: CallbackQuery, state: FSMContext):
-    """Установка цели воды"""
+    """Начать изменение цели воды"""
     await callback.message.edit_text(
-        "💧 **Цель воды**\n\n"
-        "Отправь число в мл (например: 2500)",
+        "💧 **Цель по воде**\n\n"
+        "Введи новое значение (500-10000 мл):",
         parse_mode="Markdown"
     )
     await state.set_state(SettingsStates.waiting_for_water)
@@ -194,10 +204,10 @@ async def process_current_weight_input(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "set_target_weight")
 async def set_target_weight_callback(callback: CallbackQuery, state: FSMContext):
-    """Установка целевого веса"""
+    """Начать изменение целевого веса"""
     await callback.message.edit_text(
         "⚖️ **Целевой вес**\n\n"
-        "Отправь вес в кг (например: 70)",
+        "Введи новое значение (30-300 кг):",
         parse_mode="Markdown"
     )
     await state.set_state(SettingsStates.waiting_for_target_weight)
@@ -235,10 +245,10 @@ async def process_target_weight_input(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "set_height")
 async def set_height_callback(callback: CallbackQuery, state: FSMContext):
-    """Установка роста"""
+    """Начать изменение роста"""
     await callback.message.edit_text(
         "📏 **Рост**\n\n"
-        "Отправь рост в см (например: 175)",
+        "Введи новое значение (100-250 см):",
         parse_mode="Markdown"
     )
     await state.set_state(SettingsStates.waiting_for_height)
@@ -276,7 +286,7 @@ async def process_height_input(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "set_reminders")
 async def set_reminders_callback(callback: CallbackQuery):
-    """Настройки напоминаний"""
+    """Показать настройки напоминаний"""
     user_id = callback.from_user.id
 
     async with async_session() as session:
@@ -285,8 +295,7 @@ async def set_reminders_callback(callback: CallbackQuery):
 
     if user:
         await callback.message.edit_text(
-            "🔔 **Напоминания**\n\n"
-            "Нажми, чтобы включить/выключить:",
+            REMINDERS_TEXT,
             reply_markup=get_reminders_keyboard(user),
             parse_mode="Markdown"
         )
@@ -295,37 +304,44 @@ async def set_reminders_callback(callback: CallbackQuery):
 
 @router.callback_query(F.data.startswith("toggle_"))
 async def toggle_reminder(callback: CallbackQuery):
-    """Переключение напоминаний"""
+    """Переключить напоминание (toggle_water_reminder, toggle_food_reminder, toggle_weight_reminder)"""
     user_id = callback.from_user.id
     reminder_type = callback.data.replace("toggle_", "").replace("_reminder", "")
+    field, name = REMINDER_FIELDS.get(reminder_type, (None, None))
+
+    if field is None:
+        await callback.answer()
+        return
 
     async with async_session() as session:
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one_or_none()
 
-        if user:
-            if reminder_type == "water":
-                user.remind_water = not user.remind_water
-            elif reminder_type == "food":
-                user.remind_food = not user.remind_food
-            elif reminder_type == "weight":
-                user.remind_weight = not user.remind_weight
+        if not user:
+            await callback.answer("Сначала напиши /start")
+            return
 
-            await session.commit()
+        enabled = not getattr(user, field)
+        setattr(user, field, enabled)
+        await session.commit()
 
-            await callback.message.edit_reply_markup(
-                reply_markup=get_reminders_keyboard(user)
-            )
-
-    await callback.answer("Настройки обновлены")
+    await callback.message.edit_text(
+        REMINDERS_TEXT,
+        reply_markup=get_reminders_keyboard(user),
+        parse_mode="Markdown"
+    )
+    status = "включены" if enabled else "выключены"
+    await callback.answer(f"Напоминания о {name} {status}")
 
 
 @router.callback_query(F.data == "back_to_settings")
 async def back_to_settings(callback: CallbackQuery):
-    """Назад к настройкам"""
+    """Вернуться к настройкам"""
     await callback.message.edit_text(
-        "⚙️ Выбери настройку:",
-        reply_markup=get_settings_keyboard()
+        "⚙️ **Настройки**\n\n"
+        "Выбери что хочешь изменить:",
+        reply_markup=get_settings_keyboard(),
+        parse_mode="Markdown"
     )
     await callback.answer()
 
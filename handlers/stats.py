@@ -1,11 +1,15 @@
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from sqlalchemy import select, func
 
-from database.db import async_session
-from database.models import User, FoodEntry, WaterEntry, WeightEntry, ActivityEntry
+from database.db import read_scope
+from database.models import User, FoodEntry, WaterEntry, ActivityEntry
+from keyboards.main import get_charts_keyboard, CHART_BUTTONS
+from services.charts import CHART_TYPES, get_chart
+from services.reports import get_or_build_report, format_weekly_report
+from handlers.commands import command
 
 router = Router()
 
@@ -30,13 +34,13 @@ def get_day_bounds(timezone: str = "Europe/Moscow", days_ago: int = 0):
     return day_start_utc, day_end_utc, day_start_local.date()
 
 
-@router.message(F.text == "📊 Статистика")
+@command("📊 Статистика")
 async def handle_stats_button(message: Message):
     """Кнопка статистики"""
     await show_daily_stats(message)
 
 
-@router.message(F.text.lower().startswith("/stats"))
+@command("/stats")
 async def cmd_stats(message: Message):
     """Команда /stats или /stats N (где N - дней назад)"""
     text = message.text.strip()
@@ -50,23 +54,62 @@ async def cmd_stats(message: Message):
     await show_daily_stats(message, days_ago=days_ago)
 
 
-@router.message(F.text.lower().startswith("/week"))
+@command("/week")
 async def cmd_week_stats(message: Message):
     """Статистика за неделю"""
     await show_weekly_stats(message)
 
 
-@router.message(F.text.lower().startswith("/history"))
+@command("/history")
 async def cmd_history(message: Message):
     """История за последние 7 дней"""
     await show_history(message)
 
 
+@command("/chart")
+async def cmd_chart(message: Message):
+    """Команда /chart [weight|calories|macros|water]"""
+    parts = message.text.strip().split()
+    chart = parts[1].lower() if len(parts) > 1 else None
+
+    if chart not in CHART_TYPES:
+        await message.answer(
+            "📈 **Графики прогресса**\n\nВыбери график:",
+            reply_markup=get_charts_keyboard(),
+            parse_mode="Markdown"
+        )
+        return
+
+    await send_chart(message, message.from_user.id, chart)
+
+
+@router.callback_query(F.data.startswith("chart_"))
+async def handle_chart_callback(callback: CallbackQuery):
+    """Кнопки графиков под статистикой"""
+    chart = callback.data.replace("chart_", "")
+    await callback.answer()
+    await send_chart(callback.message, callback.from_user.id, chart)
+
+
+async def send_chart(message: Message, user_id: int, chart: str):
+    """Отрендерить (или взять из кэша) и отправить график"""
+    png = await get_chart(user_id, chart)
+
+    if png is None:
+        await message.answer("📈 Пока недостаточно данных для графика.")
+        return
+
+    await message.answer_photo(
+        BufferedInputFile(png, filename=f"{chart}.png"),
+        caption=f"📈 {CHART_BUTTONS.get(chart, chart)}"
+    )
+
+
 async def show_daily_stats(message: Message, days_ago: int = 0):
     """Показать статистику за день"""
     user_id = message.from_user.id
 
-    async with async_session() as session:
+    async with read_scope(user_id) as session:
         # Получаем пользователя
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
@@ -181,86 +224,44 @@ async def show_daily_stats(message: Message, days_ago: int = 0):
 
     # Подсказка о командах
     if days_ago == 0:
-        response += "\n\n_/stats 1 — вчера, /history — неделя_"
+        response += "\n\n_/stats 1 — вчера, /history — неделя, /chart — графики_"
 
-    await message.answer(response, parse_mode="Markdown")
+    await message.answer(
+        response,
+        parse_mode="Markdown",
+        reply_markup=get_charts_keyboard(["calories", "macros"]) if days_ago == 0 else None
+    )
 
 
 async def show_weekly_stats(message: Message):
-    """Показать статистику за неделю"""
+    """Показать статистику за неделю (готовый отчёт из пакетного расчёта)"""
     user_id = message.from_user.id
-    week_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=7)
 
-    async with async_session() as session:
+    async with read_scope(user_id) as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
-        if not user:
-            await message.answer("Сначала добавь данные.")
-            return
-
-        # Калории за неделю
-        calories_result = await session.execute(
-            select(func.sum(FoodEntry.calories))
-            .where(FoodEntry.user_id == user_id)
-            .where(FoodEntry.created_at >= week_start)
-        )
-        total_calories = calories_result.scalar_one() or 0
+    if not user:
+        await message.answer("Сначала добавь данные.")
+        return
 
-        # Вода за неделю
-        water_result = await session.execute(
-            select(func.sum(WaterEntry.amount))
-            .where(WaterEntry.user_id == user_id)
-            .where(WaterEntry.created_at >= week_start)
-        )
-        total_water = water_result.scalar_one() or 0
+    report = await get_or_build_report(user_id, user.timezone)
+    if not report:
+        await message.answer("За последние 7 дней пока нет записей.")
+        return
 
-        # Активность за неделю
-        activity_result = await session.execute(
-            select(func.sum(ActivityEntry.calories_burned))
-            .where(ActivityEntry.user_id == user_id)
-            .where(ActivityEntry.created_at >= week_start)
-        )
-        total_activity = activity_result.scalar_one() or 0
-
-        # Изменение веса
-        weight_result = await session.execute(
-            select(WeightEntry)
-            .where(WeightEntry.user_id == user_id)
-            .where(WeightEntry.created_at >= week_start)
-            .order_by(WeightEntry.created_at)
-        )
-        weights = weight_result.scalars().all()
-
-    avg_calories = int(total_calories / 7) if total_calories else 0
-    avg_water = int(total_water / 7) if total_water else 0
-
-    response = (
-        f"📊 **Статистика за неделю**\n\n"
-        f"🔥 Калорий всего: {total_calories} ккал\n"
-        f"   В среднем: {avg_calories} ккал/день\n\n"
-        f"💧 Воды всего: {total_water / 1000:.1f} л\n"
-        f"   В среднем: {avg_water} мл/день\n\n"
-        f"🏃 Сожжено: {total_activity} ккал\n"
+    await message.answer(
+        format_weekly_report(report, user.water_goal),
+        parse_mode="Markdown",
+        reply_markup=get_charts_keyboard(["calories", "water", "weight"])
     )
 
-    if len(weights) >= 2:
-        weight_diff = weights[-1].weight - weights[0].weight
-        if weight_diff > 0:
-            response += f"\n⚖️ Вес: +{weight_diff:.1f} кг за неделю"
-        elif weight_diff < 0:
-            response += f"\n⚖️ Вес: {weight_diff:.1f} кг за неделю"
-        else:
-            response += "\n⚖️ Вес не изменился"
-
-    await message.answer(response, parse_mode="Markdown")
-
 
 async def show_history(message: Message):
     """Показать краткую историю за 7 дней"""
     user_id = message.from_user.id
 
-    async with async_session() as session:
+    async with read_scope(user_id) as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -308,4 +309,8 @@ async def show_history(message: Message):
         response += f"\n🎯 Цель: {user.calorie_goal} ккал, {user.water_goal} мл"
         response += "\n\n_/stats N — подробности за N дней назад_"
 
-    await message.answer(response, parse_mode="Markdown")
+    await message.answer(
+        response,
+        parse_mode="Markdown",
+        reply_markup=get_charts_keyboard(["calories", "water"])
+    )
@@ -1,62 +1,22 @@
-from datetime import datetime, timedelta
+"""
+Water Handler - Кнопка «Вода», /water и inline-кнопки воды (включая напоминания)
+Запись и итог за день — services/water.py
+"""
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from sqlalchemy import select, func
 
-from database.db import async_session
-from database.models import User, WaterEntry
 from keyboards.main import get_water_keyboard
+from services.water import add_water, get_today_water
+from handlers.commands import command
 
 router = Router()
 
 
-async def get_today_water(user_id: int) -> int:
-    """Получить количество воды за сегодня"""
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    async with async_session() as session:
-        result = await session.execute(
-            select(func.sum(WaterEntry.amount))
-            .where(WaterEntry.user_id == user_id)
-            .where(WaterEntry.created_at >= today_start)
-        )
-        total = result.scalar_one_or_none()
-        return total or 0
-
-
-async def add_water(user_id: int, amount: int) -> tuple[int, int]:
-    """Добавить воду и вернуть (всего сегодня, цель)"""
-    async with async_session() as session:
-        # Получаем пользователя
-        user_result = await session.execute(select(User).where(User.id == user_id))
-        user = user_result.scalar_one_or_none()
-
-        if not user:
-            user = User(id=user_id)
-            session.add(user)
-            await session.flush()
-
-        # Добавляем запись
-        entry = WaterEntry(user_id=user_id, amount=amount)
-        session.add(entry)
-        await session.commit()
-
-        water_goal = user.water_goal
-
-    total = await get_today_water(user_id)
-    return total, water_goal
-
-
-@router.message(F.text == "💧 Вода")
+@command("💧 Вода")
 async def handle_water_button(message: Message):
     """Кнопка воды - показать клавиатуру"""
     user_id = message.from_user.id
-    total = await get_today_water(user_id)
-
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        goal = user.water_goal if user else 2000
+    total, goal = await get_today_water(user_id)
 
     progress = min(100, int(total / goal * 100))
     bar = "█" * (progress // 10) + "░" * (10 - progress // 10)
@@ -71,7 +31,7 @@ async def handle_water_button(message: Message):
     )
 
 
-@router.message(F.text.lower().startswith("/water"))
+@command("/water")
 async def cmd_water(message: Message):
     """Команда /water [количество]"""
     user_id = message.from_user.id
@@ -164,25 +124,3 @@ async def handle_remind_water_callback(callback: CallbackQuery):
         parse_mode="Markdown"
     )
     await callback.answer(f"+{amount} мл 👍")
-
-
-@router.callback_query(F.data.startswith("sleep_"))
-async def handle_sleep_callback(callback: CallbackQuery):
-    """Обработка кнопок из напоминания о сне"""
-    action = callback.data.replace("sleep_", "")
-
-    if action == "going":
-        await callback.message.edit_text(
-            "😴 **Спокойной ночи!**\n\n"
-            "Хорошего отдыха! Увидимся завтра 🌅",
-            parse_mode="Markdown"
-        )
-        await callback.answer("Спокойной ночи! 🌙")
-    elif action == "later":
-        await callback.message.edit_text(
-            "⏰ Хорошо, ещё 30 минут!\n\n"
-            "Но не засиживайся допоздна 😉\n"
-            "Здоровый сон = здоровое тело 💪",
-            parse_mode="Markdown"
-        )
-        await callback.answer("Не забудь лечь спать!")
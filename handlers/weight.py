@@ -1,12 +1,14 @@
 from datetime import datetime, timedelta
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select, desc
 
-from database.db import async_session
+from database.db import async_session, read_scope
 from database.models import User, WeightEntry
+from keyboards.main import get_charts_keyboard
+from handlers.commands import command
 
 router = Router()
 
@@ -15,12 +17,12 @@ class WeightStates(StatesGroup):
     waiting_for_weight = State()
 
 
-@router.message(F.text == "⚖️ Вес")
+@command("⚖️ Вес")
 async def handle_weight_button(message: Message, state: FSMContext):
     """Кнопка веса"""
     user_id = message.from_user.id
 
-    async with async_session() as session:
+    async with read_scope(user_id) as session:
         # Получаем последние записи веса
         result = await session.execute(
             select(WeightEntry)
@@ -56,18 +58,20 @@ async def handle_weight_button(message: Message, state: FSMContext):
 
         response += f"\n📊 История:\n{history}\n\n"
         response += "Отправь новый вес (например: 75.5)"
+        reply_markup = get_charts_keyboard(["weight"]) if len(entries) >= 2 else None
     else:
         response = (
             "⚖️ **Вес**\n\n"
             "У тебя пока нет записей.\n"
             "Отправь свой вес (например: 75.5)"
         )
+        reply_markup = None
 
-    await message.answer(response, parse_mode="Markdown")
+    await message.answer(response, parse_mode="Markdown", reply_markup=reply_markup)
     await state.set_state(WeightStates.waiting_for_weight)
 
 
-@router.message(F.text.lower().startswith("/weight"))
+@command("/weight")
 async def cmd_weight(message: Message):
     """Команда /weight [вес]"""
     user_id = message.from_user.id
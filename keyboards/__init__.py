@@ -2,12 +2,14 @@ from keyboards.main import (
     get_main_keyboard,
     get_water_keyboard,
     get_settings_keyboard,
-    get_confirm_keyboard
+    get_confirm_keyboard,
+    get_charts_keyboard
 )
 
 __all__ = [
     "get_main_keyboard",
     "get_water_keyboard",
     "get_settings_keyboard",
-    "get_confirm_keyboard"
+    "get_confirm_keyboard",
+    "get_charts_keyboard"
 ]
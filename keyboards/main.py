@@ -115,3 +115,24 @@ def get_reminders_keyboard(user) -> InlineKeyboardMarkup:
         ]
     )
     return keyboard
+
+
+CHART_BUTTONS = {
+    "weight": "📉 Вес",
+    "calories": "🔥 Калории",
+    "macros": "🥗 БЖУ",
+    "water": "💧 Вода"
+}
+
+
+def get_charts_keyboard(charts: list[str] | None = None) -> InlineKeyboardMarkup:
+    """Кнопки графиков прогресса (по умолчанию — все)"""
+    charts = charts or list(CHART_BUTTONS)
+    buttons = [
+        InlineKeyboardButton(text=f"📈 {CHART_BUTTONS[c]}", callback_data=f"chart_{c}")
+        for c in charts
+    ]
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    )
+    return keyboard
@@ -0,0 +1,5 @@
+from middlewares.db import DbSessionMiddleware
+
+__all__ = [
+    "DbSessionMiddleware"
+]
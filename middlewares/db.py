@@ -0,0 +1,21 @@
+"""
+Middleware: одна сессия БД на апдейт (unit of work)
+Helper-функции получают её через database.db.session_scope(), коммит — один раз в конце
+"""
+from typing import Any, Awaitable, Callable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database.db import unit_of_work
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        async with unit_of_work() as session:
+            data["session"] = session
+            return await handler(event, data)
@@ -2,252 +2,60 @@
 AI Coach Service
 Использует Claude API с tool calling для интеллектуального трекинга здоровья
 """
+import asyncio
 import json
-import base64
-import httpx
 import logging
+import time
+from collections import Counter
 from typing import Optional
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 import config
+from services import metrics, providers
+from services.llm_transport import Base64Blob
+from services.llm_scheduler import get_lane
+from services.images import prepare_image, image_key, get_cached_analysis, cache_analysis
+from services.nutrition_db import normalize
+from services.tools import api_tools
 
 logger = logging.getLogger(__name__)
 
+
+async def _call_llm(
+    payload: dict,
+    timeout: float,
+    hedge: bool = False,
+    lane: str = "chat",
+    deadline: Optional[float] = None
+) -> dict:
+    """
+    Запрос к LLM через провайдеров (Claude → Z.AI fallback, circuit breaker)
+
+    Args:
+        lane: Полоса планировщика — chat, vision или background
+        deadline: Общий лимит на запрос со всеми fallback, сек — отсчитывается
+                  с момента, когда запрос получил место в полосе (ожидание в очереди не считается)
+
+    Returns:
+        Ответ в формате Anthropic Messages API
+    """
+    try:
+        async with get_lane(lane).slot():
+            request = providers.complete(payload, timeout=timeout, hedge=hedge)
+            if deadline is not None:
+                return await asyncio.wait_for(request, timeout=deadline)
+            return await request
+    except Exception as e:
+        logger.error(f"[AI] LLM request failed: {e}")
+        raise
+
 # ============================================================================
 # COACH TOOLS - инструменты для AI
 # ============================================================================
 
-COACH_TOOLS = [
-    {
-        "name": "log_food",
-        "description": "Записать приём пищи. Используй когда пользователь говорит что съел.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "description": {"type": "string", "description": "Что съел (название блюда)"},
-                "calories": {"type": "integer", "description": "Калории"},
-                "protein": {"type": "number", "description": "Белки в граммах"},
-                "carbs": {"type": "number", "description": "Углеводы в граммах"},
-                "fat": {"type": "number", "description": "Жиры в граммах"},
-                "fiber": {"type": "number", "description": "Клетчатка в граммах"},
-                "meal_type": {
-                    "type": "string",
-                    "enum": ["breakfast", "lunch", "dinner", "snack"],
-                    "description": "Тип приёма пищи"
-                }
-            },
-            "required": ["description", "calories"]
-        }
-    },
-    {
-        "name": "log_water",
-        "description": "Записать воду. Используй когда пользователь говорит что выпил воду/чай/кофе/напиток.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "amount_ml": {"type": "integer", "description": "Количество в мл"}
-            },
-            "required": ["amount_ml"]
-        }
-    },
-    {
-        "name": "log_weight",
-        "description": "Записать вес пользователя.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "weight_kg": {"type": "number", "description": "Вес в килограммах"}
-            },
-            "required": ["weight_kg"]
-        }
-    },
-    {
-        "name": "log_activity",
-        "description": "Записать активность/тренировку.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "activity_type": {"type": "string", "description": "Тип активности (бег, ходьба, тренировка и т.д.)"},
-                "duration_minutes": {"type": "integer", "description": "Длительность в минутах"},
-                "calories_burned": {"type": "integer", "description": "Сожжённые калории (если известно)"}
-            },
-            "required": ["activity_type", "duration_minutes"]
-        }
-    },
-    {
-        "name": "get_today_stats",
-        "description": "Получить статистику за сегодня. Используй когда нужно узнать сколько съедено/выпито.",
-        "input_schema": {
-            "type": "object",
-            "properties": {}
-        }
-    },
-    {
-        "name": "get_weight_history",
-        "description": "Получить историю веса за последние N дней.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "days": {"type": "integer", "description": "Количество дней", "default": 7}
-            }
-        }
-    },
-    {
-        "name": "remember_fact",
-        "description": "Запомнить важный факт о пользователе (привычка, предпочтение, ограничение в питании, цель).",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "category": {
-                    "type": "string",
-                    "enum": ["preference", "habit", "restriction", "goal", "fact"],
-                    "description": "Категория: preference (предпочтение), habit (привычка), restriction (ограничение), goal (цель), fact (факт)"
-                },
-                "content": {"type": "string", "description": "Текст факта (например: 'не ест молочку', 'вегетарианец')"}
-            },
-            "required": ["category", "content"]
-        }
-    },
-    {
-        "name": "update_profile",
-        "description": "Обновить профиль пользователя (имя, возраст, рост, вес, цель и т.д.)",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "first_name": {"type": "string", "description": "Имя пользователя"},
-                "age": {"type": "integer", "description": "Возраст"},
-                "gender": {"type": "string", "enum": ["male", "female"], "description": "Пол"},
-                "height_cm": {"type": "integer", "description": "Рост в сантиметрах"},
-                "current_weight_kg": {"type": "number", "description": "Текущий вес"},
-                "target_weight_kg": {"type": "number", "description": "Целевой вес"},
-                "calorie_goal": {"type": "integer", "description": "Цель по калориям"},
-                "water_goal": {"type": "integer", "description": "Цель по воде в мл"},
-                "goal": {
-                    "type": "string",
-                    "enum": ["lose", "gain", "maintain", "health"],
-                    "description": "Цель: lose (похудеть), gain (набрать), maintain (поддерживать), health (здоровье)"
-                }
-            }
-        }
-    },
-    {
-        "name": "check_profile_complete",
-        "description": "Проверить, заполнен ли профиль пользователя (есть ли рост/вес для расчётов)",
-        "input_schema": {
-            "type": "object",
-            "properties": {}
-        }
-    },
-    {
-        "name": "get_today_activities",
-        "description": "Получить список активностей за сегодня. Используй чтобы узнать что уже записано.",
-        "input_schema": {
-            "type": "object",
-            "properties": {}
-        }
-    },
-    {
-        "name": "update_daily_activity",
-        "description": "Обновить или установить дневную активность (сожжённые калории). Используй когда пользователь хочет исправить калории активности или указывает что данные неверные.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "calories_burned": {"type": "integer", "description": "Правильное количество сожжённых калорий"},
-                "activity_type": {"type": "string", "description": "Тип активности (ходьба, бег, тренировка)"},
-                "reason": {"type": "string", "description": "Почему меняем (например: 'пользователь указал на ошибку')"}
-            },
-            "required": ["calories_burned"]
-        }
-    },
-    {
-        "name": "clear_today_activities",
-        "description": "Удалить все активности за сегодня. Используй если пользователь говорит что данные неверные и нужно сбросить.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
-            },
-            "required": ["confirm"]
-        }
-    },
-    {
-        "name": "list_today_food",
-        "description": "Показать все записи еды за сегодня с номерами. Используй когда пользователь хочет посмотреть что записано или исправить.",
-        "input_schema": {
-            "type": "object",
-            "properties": {}
-        }
-    },
-    {
-        "name": "delete_food_entry",
-        "description": "Удалить запись еды. Используй когда пользователь говорит удалить конкретную еду (по номеру или описанию).",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "entry_number": {"type": "integer", "description": "Номер записи из списка (1, 2, 3...)"},
-                "description_match": {"type": "string", "description": "Часть описания для поиска (например 'яичница' или 'мороженое')"}
-            }
-        }
-    },
-    {
-        "name": "update_food_entry",
-        "description": "Изменить запись еды. Используй когда пользователь хочет исправить калории или описание конкретной еды.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "entry_number": {"type": "integer", "description": "Номер записи из списка"},
-                "description_match": {"type": "string", "description": "Часть описания для поиска"},
-                "new_description": {"type": "string", "description": "Новое описание"},
-                "new_calories": {"type": "integer", "description": "Новые калории"},
-                "new_protein": {"type": "number", "description": "Новый белок"},
-                "new_carbs": {"type": "number", "description": "Новые углеводы"},
-                "new_fat": {"type": "number", "description": "Новые жиры"}
-            }
-        }
-    },
-    {
-        "name": "clear_today_food",
-        "description": "Удалить ВСЕ записи еды за сегодня. Используй ТОЛЬКО если пользователь явно просит сбросить всё.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
-            },
-            "required": ["confirm"]
-        }
-    },
-    {
-        "name": "list_today_water",
-        "description": "Показать все записи воды за сегодня.",
-        "input_schema": {
-            "type": "object",
-            "properties": {}
-        }
-    },
-    {
-        "name": "clear_today_water",
-        "description": "Удалить ВСЕ записи воды за сегодня. Используй если пользователь хочет сбросить воду.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
-            },
-            "required": ["confirm"]
-        }
-    },
-    {
-        "name": "set_today_water",
-        "description": "Установить конкретное количество воды за сегодня (сбросить и записать новое значение).",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "amount_ml": {"type": "integer", "description": "Количество воды в мл"}
-            },
-            "required": ["amount_ml"]
-        }
-    }
-]
+# Схемы инструментов объявлены в реестре services/tools.py
+COACH_TOOLS = api_tools()
 
 
 # ============================================================================
@@ -400,78 +208,62 @@ async def process_message(
         "tools": COACH_TOOLS
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
     tool_calls = []
     final_response = ""
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        # Первый вызов API
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        if response.status_code != 200:
-            error_text = response.text
-            logger.error(f"[AI] API Error {response.status_code}: {error_text}")
-            raise Exception(f"API Error: {error_text}")
-        result = response.json()
-
-        # Обрабатываем ответ и возможные tool_use
-        while True:
-            stop_reason = result.get("stop_reason")
-            content_blocks = result.get("content", [])
-
-            # Собираем текстовые блоки
-            text_parts = []
-            tool_use_blocks = []
-
-            for block in content_blocks:
-                if block.get("type") == "text":
-                    text_parts.append(block.get("text", ""))
-                elif block.get("type") == "tool_use":
-                    tool_use_blocks.append(block)
-
-            # Если есть текст — добавляем к ответу
-            if text_parts:
-                final_response += "".join(text_parts)
-
-            # Если нет tool_use — выходим
-            if stop_reason != "tool_use" or not tool_use_blocks:
-                break
-
-            # Обрабатываем tool_use
-            tool_results = []
-            for tool_block in tool_use_blocks:
-                tool_name = tool_block.get("name")
-                tool_id = tool_block.get("id")
-                tool_input = tool_block.get("input", {})
-
-                logger.info(f"[AI] Tool call: {tool_name} | input: {tool_input}")
-
-                # Выполняем инструмент (фактическое выполнение будет в coach.py)
-                # Здесь только сохраняем информацию о вызове
-                tool_calls.append({
-                    "name": tool_name,
-                    "input": tool_input,
-                    "id": tool_id
-                })
-
-                # Формируем результат для Claude (будет заполнен в coach.py)
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": tool_id,
-                    "content": json.dumps({"status": "pending"})
-                })
-
-            # Если есть tool calls — выходим из цикла, результаты обработает coach.py
+    # Чат — latency-critical: хеджируем запрос на запасного провайдера
+    result = await _call_llm(payload, timeout=60.0, hedge=True)
+
+    # Обрабатываем ответ и возможные tool_use
+    while True:
+        stop_reason = result.get("stop_reason")
+        content_blocks = result.get("content", [])
+
+        # Собираем текстовые блоки
+        text_parts = []
+        tool_use_blocks = []
+
+        for block in content_blocks:
+            if block.get("type") == "text":
+                text_parts.append(block.get("text", ""))
+            elif block.get("type") == "tool_use":
+                tool_use_blocks.append(block)
+
+        # Если есть текст — добавляем к ответу
+        if text_parts:
+            final_response += "".join(text_parts)
+
+        # Если нет tool_use — выходим
+        if stop_reason != "tool_use" or not tool_use_blocks:
             break
 
+        # Обрабатываем tool_use
+        tool_results = []
+        for tool_block in tool_use_blocks:
+            tool_name = tool_block.get("name")
+            tool_id = tool_block.get("id")
+            tool_input = tool_block.get("input", {})
+
+            logger.info(f"[AI] Tool call: {tool_name} | input: {tool_input}")
+
+            # Выполняем инструмент (фактическое выполнение будет в coach.py)
+            # Здесь только сохраняем информацию о вызове
+            tool_calls.append({
+                "name": tool_name,
+                "input": tool_input,
+                "id": tool_id
+            })
+
+            # Формируем результат для Claude (будет заполнен в coach.py)
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": tool_id,
+                "content": json.dumps({"status": "pending"})
+            })
+
+        # Если есть tool calls — выходим из цикла, результаты обработает coach.py
+        break
+
     return {
         "response": final_response.strip(),
         "tool_calls": tool_calls
@@ -513,20 +305,7 @@ async def process_message_with_tool_results(
         "tools": COACH_TOOLS
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        result = response.json()
+    result = await _call_llm(payload, timeout=60.0, hedge=True)
 
     # Собираем текстовый ответ
     content_blocks = result.get("content", [])
@@ -700,7 +479,8 @@ async def analyze_food_images_batch(images_data: list[tuple[bytes, str]]) -> dic
     # Формируем контент с несколькими изображениями
     content = []
     for i, (image_bytes, mime_type) in enumerate(images_data, 1):
-        base64_image = base64.b64encode(image_bytes).decode("utf-8")
+        image_bytes, mime_type = await prepare_image(image_bytes, mime_type)
+        base64_image = Base64Blob(image_bytes)
         content.append({
             "type": "text",
             "text": f"--- ФОТО {i} из {photo_count} ---"
@@ -727,20 +507,7 @@ async def analyze_food_images_batch(images_data: list[tuple[bytes, str]]) -> dic
         "messages": [{"role": "user", "content": content}]
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
-    async with httpx.AsyncClient(timeout=90.0) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        result = response.json()
+    result = await _call_llm(payload, timeout=90.0, lane="vision")
 
     content_text = result["content"][0]["text"]
 
@@ -775,7 +542,11 @@ async def analyze_food_images_batch(images_data: list[tuple[bytes, str]]) -> dic
         }
 
 
-async def analyze_food_image(image_data: bytes, mime_type: str = "image/jpeg") -> dict:
+async def analyze_food_image(
+    image_data: bytes,
+    mime_type: str = "image/jpeg",
+    deadline: Optional[float] = None
+) -> dict:
     """
     Анализирует фото через Claude Vision API
     Может распознавать еду И фитнес-трекеры
@@ -783,11 +554,19 @@ async def analyze_food_image(image_data: bytes, mime_type: str = "image/jpeg") -
     Args:
         image_data: Бинарные данные изображения
         mime_type: MIME тип изображения
+        deadline: Лимит на сам запрос к LLM, сек (без ожидания в очереди vision)
 
     Returns:
         Словарь с информацией (type: food/fitness/other)
     """
-    base64_image = base64.b64encode(image_data).decode("utf-8")
+    # То же фото уже разбирали — ответ из кэша
+    key = image_key(image_data)
+    cached = get_cached_analysis(key)
+    if cached is not None:
+        return cached
+
+    image_data, mime_type = await prepare_image(image_data, mime_type)
+    base64_image = Base64Blob(image_data)
 
     payload = {
         "model": "claude-sonnet-4-20250514",
@@ -813,20 +592,7 @@ async def analyze_food_image(image_data: bytes, mime_type: str = "image/jpeg") -
         ]
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        result = response.json()
+    result = await _call_llm(payload, timeout=60.0, lane="vision", deadline=deadline)
 
     content = result["content"][0]["text"]
 
@@ -840,7 +606,9 @@ async def analyze_food_image(image_data: bytes, mime_type: str = "image/jpeg") -
             content = content[:-3]
         content = content.strip()
 
-        return json.loads(content)
+        analysis = json.loads(content)
+        cache_analysis(key, analysis)
+        return analysis
     except json.JSONDecodeError:
         return {
             "description": content[:200],
@@ -857,6 +625,120 @@ async def analyze_food_image(image_data: bytes, mime_type: str = "image/jpeg") -
         }
 
 
+def _cross_photo_reason(results: list[Optional[dict]]) -> Optional[str]:
+    """
+    Почему поштучные анализы нельзя просто сложить (None — можно)
+
+    Общий запрос нужен, если какое-то фото не разобрано, альбом не только про еду
+    или одно блюдо снято с нескольких ракурсов (одинаковые позиции на разных фото).
+    """
+    if any(r is None for r in results):
+        return "failed"
+    if any(r.get("type", "food") != "food" for r in results):
+        return "not_food"
+    if any(not r.get("items") or "raw_response" in r for r in results):
+        return "unparsed"
+
+    seen = set()
+    for r in results:
+        names = {normalize(item.get("name", "")) for item in r["items"]}
+        if names & seen:
+            return "duplicate"
+        seen |= names
+    return None
+
+
+def merge_food_analyses(results: list[dict]) -> dict:
+    """
+    Сложить анализы отдельных фото альбома в один приём пищи
+
+    Позиции идут в порядке фото (с photo_number), итоги — суммы,
+    тип приёма пищи — самый частый, оценка полезности — средняя по калориям.
+    """
+    items = []
+    for number, r in enumerate(results, 1):
+        for item in r.get("items", []):
+            items.append({"photo_number": number, **item})
+
+    total = {}
+    for key in ("calories", "protein", "carbs", "fat", "fiber"):
+        value = sum(r.get("total", {}).get(key) or 0 for r in results)
+        total[key] = int(round(value)) if key == "calories" else round(value, 1)
+
+    meal_types = Counter(r.get("meal_type") for r in results if r.get("meal_type"))
+    # При равенстве побеждает тип с первого фото (Counter сохраняет порядок вставки)
+    meal_type = meal_types.most_common(1)[0][0] if meal_types else "snack"
+
+    weights = [max(r.get("total", {}).get("calories") or 0, 1) for r in results]
+    scores = [r.get("health_score") or 5 for r in results]
+    health_score = round(sum(w * s for w, s in zip(weights, scores)) / sum(weights))
+
+    notes = [r["health_notes"] for r in results if r.get("health_notes")]
+    alternatives = list(dict.fromkeys(alt for r in results for alt in r.get("healthy_alternatives", [])))
+
+    return {
+        "type": "food",
+        "description": ", ".join(r.get("description", "?") for r in results),
+        "items": items,
+        "total": total,
+        "meal_type": meal_type,
+        "health_notes": " ".join(notes),
+        "health_score": health_score,
+        "healthy_alternatives": alternatives[:3]
+    }
+
+
+async def analyze_food_album(images_data: list[tuple[bytes, str]]) -> dict:
+    """
+    Анализирует альбом: каждое фото отдельно и параллельно, затем складывает в Python
+
+    Фото идут через analyze_food_image (уменьшение, кэш), не больше
+    ALBUM_ANALYSIS_CONCURRENCY одновременно. Если поштучные результаты нельзя
+    сложить (см. _cross_photo_reason) — общий запрос analyze_food_images_batch.
+
+    Args:
+        images_data: Список кортежей (image_bytes, mime_type)
+
+    Returns:
+        Объединённый анализ всех фото
+    """
+    if len(images_data) == 1:
+        return await analyze_food_image(images_data[0][0], images_data[0][1])
+
+    semaphore = asyncio.Semaphore(config.ALBUM_ANALYSIS_CONCURRENCY)
+
+    async def analyze_one(number: int, image_bytes: bytes, mime_type: str) -> Optional[dict]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # Лимит — на сам запрос: в очереди vision при нагрузке фото ждёт дольше,
+                # и таймаут там отправил бы альбом в ещё более тяжёлый общий запрос
+                return await analyze_food_image(image_bytes, mime_type, deadline=config.ALBUM_PHOTO_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"[AI] Album photo {number} failed: {type(e).__name__}: {e}")
+                return None
+            finally:
+                metrics.observe("album.photo_seconds", time.perf_counter() - started)
+
+    with metrics.timer("album.parallel_seconds"):
+        results = await asyncio.gather(*(
+            analyze_one(number, image_bytes, mime_type)
+            for number, (image_bytes, mime_type) in enumerate(images_data, 1)
+        ))
+
+    reason = _cross_photo_reason(results)
+    if reason:
+        metrics.inc("album.combined")
+        metrics.inc(f"album.combined.{reason}")
+        logger.info(f"[AI] Album of {len(images_data)} photos needs combined analysis: {reason}")
+        return await analyze_food_images_batch(images_data)
+
+    metrics.inc("album.parallel")
+    merged = merge_food_analyses(results)
+    logger.info(f"[AI] Album merged: {len(merged['items'])} items from {len(images_data)} photos")
+    return merged
+
+
 async def correct_food_analysis(original_data: dict, correction_text: str) -> dict:
     """
     Корректирует анализ еды на основе уточнения пользователя
@@ -872,7 +754,7 @@ async def correct_food_analysis(original_data: dict, correction_text: str) -> di
 Теперь пользователь даёт уточнение. Скорректируй данные.
 
 ОРИГИНАЛЬНЫЙ АНАЛИЗ:
-{json.dumps(original_data, ensure_ascii=False, indent=2)}
+{json.dumps(original_data, ensure_ascii=False, separators=(",", ":"))}
 
 УТОЧНЕНИЕ ПОЛЬЗОВАТЕЛЯ: {correction_text}
 
@@ -880,6 +762,7 @@ async def correct_food_analysis(original_data: dict, correction_text: str) -> di
 {{
     "type": "food",
     "description": "обновлённое описание",
+    "items": [{{"name": "...", "portion": "...", "calories": число, "protein": число, "carbs": число, "fat": число}}],
     "total": {{
         "calories": число,
         "protein": число,
@@ -896,8 +779,9 @@ async def correct_food_analysis(original_data: dict, correction_text: str) -> di
 - Если пользователь уточняет напиток - добавь его калории
 - Пересчитай КБЖУ с учётом изменений
 - Сохрани остальные данные из оригинала если они не затронуты
+- Позиции items пересчитай так, чтобы их сумма совпадала с total
 
-Ответь ТОЛЬКО JSON, без markdown."""
+Ответь ТОЛЬКО компактным JSON в одну строку, без markdown."""
 
     payload = {
         "model": "claude-sonnet-4-20250514",
@@ -905,20 +789,7 @@ async def correct_food_analysis(original_data: dict, correction_text: str) -> di
         "messages": [{"role": "user", "content": prompt}]
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        result = response.json()
+    result = await _call_llm(payload, timeout=60.0)
 
     content = result["content"][0]["text"]
 
@@ -944,7 +815,7 @@ async def correct_food_analysis(original_data: dict, correction_text: str) -> di
 
 
 # ============================================================================
-# Вспомогательные функции для Z.AI (fallback)
+# Вспомогательные функции
 # ============================================================================
 
 async def estimate_activity_calories(activity: str, duration_minutes: int, weight_kg: float = 70) -> dict:
@@ -973,20 +844,7 @@ async def estimate_activity_calories(activity: str, duration_minutes: int, weigh
             "messages": [{"role": "user", "content": prompt}]
         }
 
-        headers = {
-            "x-api-key": config.CLAUDE_API_KEY,
-            "Content-Type": "application/json",
-            "anthropic-version": "2023-06-01"
-        }
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            result = response.json()
+        result = await _call_llm(payload, timeout=30.0)
 
         content = result["content"][0]["text"]
         content = content.strip()
@@ -998,38 +856,54 @@ async def estimate_activity_calories(activity: str, duration_minutes: int, weigh
 
     except Exception:
         # Фолбэк на расчёт по MET
-        met_values = {
-            "ходьба": 3.5, "бег": 8.0, "плавание": 6.0,
-            "велосипед": 5.0, "тренировка": 5.0, "йога": 2.5,
-            "фитнес": 5.5, "танцы": 4.5
-        }
-        activity_lower = activity.lower()
-        met = 4.0  # default
-        for key, value in met_values.items():
-            if key in activity_lower:
-                met = value
-                break
-
-        calories = int(met * weight_kg * (duration_minutes / 60))
         return {
             "activity_type": activity,
-            "calories_burned": calories,
+            "calories_burned": estimate_calories_by_met(activity, duration_minutes, weight_kg),
             "intensity": "medium",
             "notes": "Примерный расчёт"
         }
 
 
+MET_VALUES = {
+    "ходьба": 3.5, "бег": 8.0, "плавание": 6.0,
+    "велосипед": 5.0, "тренировка": 5.0, "йога": 2.5,
+    "фитнес": 5.5, "танцы": 4.5
+}
+
+
+def estimate_calories_by_met(activity: str, duration_minutes: int, weight_kg: float = 70) -> int:
+    """Расчёт сожжённых калорий по MET (без LLM)"""
+    activity_lower = activity.lower()
+    met = 4.0  # default
+    for key, value in MET_VALUES.items():
+        if key in activity_lower:
+            met = value
+            break
+    return int(met * (weight_kg or 70) * (duration_minutes / 60))
+
+
 async def generate_meal_plan(
     calorie_goal: int,
     preferences: Optional[str] = None,
-    restrictions: Optional[str] = None
+    restrictions: Optional[str] = None,
+    goal: Optional[str] = None,
+    country: Optional[str] = None
 ) -> str:
     """
     Генерирует план питания на день
     """
+    goal_text = {
+        "lose": "похудение",
+        "gain": "набор мышечной массы",
+        "maintain": "поддержание веса",
+        "health": "здоровый образ жизни"
+    }.get(goal, "здоровое питание")
+
     prompt = f"""Составь план питания на день.
 
 Цель по калориям: {calorie_goal} ккал
+Цель: {goal_text}
+Страна (продукты из местных магазинов): {country or 'Россия'}
 Предпочтения: {preferences or 'нет особых'}
 Ограничения: {restrictions or 'нет'}
 
@@ -1043,19 +917,6 @@ async def generate_meal_plan(
         "messages": [{"role": "user", "content": prompt}]
     }
 
-    headers = {
-        "x-api-key": config.CLAUDE_API_KEY,
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01"
-    }
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        result = response.json()
+    result = await _call_llm(payload, timeout=60.0, lane="background")
 
     return result["content"][0]["text"]
@@ -0,0 +1,253 @@
+"""
+Сборка альбомов Telegram (media_group) из отдельных апдейтов
+- Debounce: альбом обрабатывается через ALBUM_QUIET_SECONDS после последнего фото,
+  но не позже ALBUM_MAX_WAIT с первого
+- Скачивание фото стартует сразу при получении апдейта, параллельно с остальными
+- Обработчик получает фото в порядке сообщений
+- Фото, пришедшее после того, как альбом ушёл в обработку (в течение ALBUM_LATE_WINDOW),
+  не начинает второй альбом — обработчик фото его пропускает (см. late())
+- Память ограничена: общий бюджет байтов ALBUM_MAX_BYTES, альбомы старше ALBUM_TTL
+  (зависшие на сборке или обработке) вычищает фоновая задача
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, Union
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Оценка размера фото, если Telegram не прислал file_size
+DEFAULT_PHOTO_BYTES = 200_000
+
+
+class Album:
+    """Собираемый альбом: первое сообщение, FSM и задачи скачивания фото"""
+
+    def __init__(self, media_group_id: str, user_id: int, message: Any, state: Any):
+        self.media_group_id = media_group_id
+        self.user_id = user_id
+        self.message = message
+        self.state = state
+        # Отправка сообщения «Анализирую альбом...» (задача)
+        self.notice: Optional[asyncio.Future] = None
+        self.started = time.monotonic()
+        # Не влез в бюджет с первого фото — весь альбом отклонён
+        self.rejected = False
+        # Фото, не принятые из-за бюджета
+        self.dropped = 0
+        # (message_id, задача скачивания, оценка размера) — сортируем при выдаче
+        self._downloads: list[tuple[int, asyncio.Task, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, message: Any, download: asyncio.Task, size_hint: int):
+        self._downloads.append((message.message_id, download, size_hint))
+        # Отвечаем на самое раннее сообщение альбома
+        if message.message_id < self.message.message_id:
+            self.message = message
+
+    @property
+    def size(self) -> int:
+        return len(self._downloads)
+
+    @property
+    def bytes_held(self) -> int:
+        """Скачанные байты (для ещё не скачанных — оценка)"""
+        total = 0
+        for _, task, size_hint in self._downloads:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                total += len(task.result())
+            else:
+                total += size_hint
+        return total
+
+    async def notice_message(self) -> Any:
+        """Отправленное сообщение «Анализирую альбом...» (None, если не отправилось)"""
+        if self.notice is None:
+            return None
+        try:
+            return await self.notice
+        except Exception:
+            return None
+
+    async def photos(self) -> list[tuple[bytes, str]]:
+        """Дождаться скачивания; фото, которые не скачались, пропускаются"""
+        ordered = [task for _, task, _ in sorted(self._downloads, key=lambda d: d[0])]
+        results = await asyncio.gather(*ordered, return_exceptions=True)
+        photos = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning(f"[ALBUM] user={self.user_id} | Download failed: {result}")
+                continue
+            photos.append((result, "image/jpeg"))
+        return photos
+
+    def release(self):
+        """Отменить таймер и скачивания, отпустить байты, сообщения и FSM"""
+        if self._timer:
+            self._timer.cancel()
+        for _, task, _ in self._downloads:
+            task.cancel()
+        self._downloads.clear()
+        self.message = None
+        self.state = None
+        self.notice = None
+
+
+class AlbumCollector:
+    """Альбомы в процессе сборки и обработки: media_group_id → Album"""
+
+    def __init__(self, on_ready: Callable[[Album], Awaitable[None]]):
+        self._on_ready = on_ready
+        self._albums: dict[str, Album] = {}
+        # Обрабатываемые альбомы: задача → альбом
+        self._processing: dict[asyncio.Task, Album] = {}
+        # Ушедшие в обработку альбомы: media_group_id → (время, сколько фото опоздало)
+        self._fired: dict[str, list] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        metrics.set_gauge("album.in_flight", lambda: len(self._albums) + len(self._processing))
+        metrics.set_gauge("album.bytes_held", self.bytes_held)
+
+    def bytes_held(self) -> int:
+        albums = [*self._albums.values(), *self._processing.values()]
+        return sum(album.bytes_held for album in albums)
+
+    def late(self, media_group_id: str) -> int:
+        """
+        Отметить фото альбома, который уже ушёл в обработку
+
+        Returns:
+            Номер опоздавшего фото этого альбома (1, 2, ...) или 0 — альбом ещё собирается
+        """
+        fired = self._fired.get(media_group_id)
+        if fired is None or time.monotonic() - fired[0] > config.ALBUM_LATE_WINDOW:
+            return 0
+        fired[1] += 1
+        metrics.inc("album.late_photos")
+        return fired[1]
+
+    def add(
+        self,
+        media_group_id: str,
+        user_id: int,
+        message: Any,
+        state: Any,
+        download: Callable[[], Awaitable[bytes]],
+        size_hint: Optional[int] = None
+    ) -> Union[Album, int]:
+        """
+        Добавить фото альбома: скачивание стартует сразу, таймер тишины перезапускается
+
+        Если фото не влезает в ALBUM_MAX_BYTES, оно не скачивается (album.dropped);
+        если это первое фото — альбом помечается rejected и обработан не будет.
+
+        Returns:
+            Альбом (album.size == 1 — это первое принятое фото) или номер опоздавшего
+            фото (см. late()) — альбом уже ушёл в обработку
+        """
+        late = self.late(media_group_id)
+        if late:
+            return late
+        self._ensure_sweeper()
+        size_hint = size_hint or DEFAULT_PHOTO_BYTES
+
+        album = self._albums.get(media_group_id)
+        if album is None:
+            album = Album(media_group_id, user_id, message, state)
+            self._albums[media_group_id] = album
+
+        if album.rejected or self.bytes_held() + size_hint > config.ALBUM_MAX_BYTES:
+            album.dropped += 1
+            album.rejected = album.rejected or album.size == 0
+            metrics.inc("album.dropped_photos")
+            logger.warning(f"[ALBUM] user={user_id} | Byte budget exceeded, photo dropped (group={media_group_id})")
+        else:
+            album.add(message, asyncio.ensure_future(download()), size_hint)
+
+        self._schedule(album)
+        return album
+
+    def _schedule(self, album: Album):
+        if album._timer:
+            album._timer.cancel()
+        left = config.ALBUM_MAX_WAIT - (time.monotonic() - album.started)
+        delay = max(0.0, min(config.ALBUM_QUIET_SECONDS, left))
+        album._timer = asyncio.get_running_loop().call_later(delay, self._fire, album.media_group_id)
+
+    def _fire(self, media_group_id: str):
+        album = self._albums.pop(media_group_id, None)
+        if album is None:
+            return
+        if album.rejected:
+            metrics.inc("album.rejected")
+            album.release()
+            return
+        self._forget_fired()
+        self._fired[media_group_id] = [time.monotonic(), 0]
+
+        metrics.observe("album.collect_seconds", time.monotonic() - album.started)
+        metrics.observe("album.size", album.size)
+
+        task = asyncio.create_task(self._on_ready(album))
+        self._processing[task] = album
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        # Байты и ссылки отпускаем при любом исходе обработки
+        album = self._processing.pop(task, None)
+        if album is not None:
+            album.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"[ALBUM] Processing failed: {task.exception()}")
+
+    # ========================================================================
+    # Очистка зависших альбомов
+    # ========================================================================
+
+    def _forget_fired(self):
+        cutoff = time.monotonic() - config.ALBUM_LATE_WINDOW
+        for media_group_id in [m for m, (fired_at, _) in self._fired.items() if fired_at < cutoff]:
+            del self._fired[media_group_id]
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        # Живёт, пока есть альбомы; следующий add() запустит заново
+        while True:
+            await asyncio.sleep(config.ALBUM_SWEEP_INTERVAL)
+            self.sweep()
+            self._forget_fired()
+            if not self._albums and not self._processing and not self._fired:
+                return
+
+    def sweep(self) -> int:
+        """
+        Выселить альбомы старше ALBUM_TTL (сборка или обработка зависли)
+
+        Returns:
+            Количество выселенных альбомов
+        """
+        cutoff = time.monotonic() - config.ALBUM_TTL
+        evicted = 0
+
+        for media_group_id, album in list(self._albums.items()):
+            if album.started < cutoff:
+                del self._albums[media_group_id]
+                album.release()
+                evicted += 1
+
+        for task, album in list(self._processing.items()):
+            if album.started < cutoff:
+                # _done отпустит альбом после отмены
+                task.cancel()
+                evicted += 1
+
+        if evicted:
+            metrics.inc("album.evicted", evicted)
+            logger.warning(f"[ALBUM] Evicted {evicted} stale albums")
+        return evicted
@@ -0,0 +1,281 @@
+"""
+Графики прогресса (matplotlib, backend Agg)
+- Рендер в пуле процессов, чтобы не блокировать event loop
+- Кэш PNG по (user_id, тип графика, версия данных)
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import select
+
+import config
+from database.db import read_scope
+from database.models import User, FoodEntry, WaterEntry, WeightEntry
+
+logger = logging.getLogger(__name__)
+
+CHART_TYPES = ("weight", "calories", "macros", "water")
+
+# Пул процессов создаётся лениво при первом рендере
+_pool: Optional[ProcessPoolExecutor] = None
+
+# LRU-кэш готовых PNG: {(user_id, chart, data_version): bytes}
+_png_cache: "OrderedDict[tuple[int, str, str], bytes]" = OrderedDict()
+
+
+# ============================================================================
+# Рендер (выполняется в дочерних процессах — только чистые функции)
+# ============================================================================
+
+def _new_figure():
+    """Figure без pyplot: не трогает глобальное состояние и всегда рендерит через Agg"""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(8, 4.5), dpi=100)
+    ax = fig.subplots()
+    ax.grid(True, alpha=0.3)
+    return fig, ax
+
+
+def _to_png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def render_weight_chart(data: dict) -> bytes:
+    """Линия веса + целевой вес"""
+    fig, ax = _new_figure()
+    labels = [p["date"] for p in data["points"]]
+    values = [p["weight"] for p in data["points"]]
+
+    ax.plot(labels, values, marker="o", color="#4c72b0", label="Вес")
+    if data.get("target"):
+        ax.axhline(data["target"], color="#55a868", linestyle="--", label=f"Цель {data['target']} кг")
+    ax.set_title("Вес, кг")
+    ax.legend(loc="best")
+    ax.tick_params(axis="x", rotation=45)
+    return _to_png(fig)
+
+
+def render_calories_chart(data: dict) -> bytes:
+    """Столбцы калорий по дням против цели"""
+    fig, ax = _new_figure()
+    labels = [d["date"] for d in data["days"]]
+    values = [d["calories"] for d in data["days"]]
+    goal = data["goal"]
+    colors = ["#c44e52" if v > goal * 1.1 else "#55a868" if v >= goal * 0.8 else "#8c8c8c" for v in values]
+
+    ax.bar(labels, values, color=colors)
+    ax.axhline(goal, color="#4c72b0", linestyle="--", label=f"Цель {goal} ккал")
+    ax.set_title("Калории по дням")
+    ax.legend(loc="best")
+    return _to_png(fig)
+
+
+def render_macros_chart(data: dict) -> bytes:
+    """Круговая диаграмма БЖУ в калориях"""
+    fig, ax = _new_figure()
+    ax.grid(False)
+    kcal = [data["protein"] * 4, data["carbs"] * 4, data["fat"] * 9]
+    labels = [
+        f"Белки {data['protein']:.0f} г",
+        f"Углеводы {data['carbs']:.0f} г",
+        f"Жиры {data['fat']:.0f} г"
+    ]
+
+    if sum(kcal) > 0:
+        ax.pie(kcal, labels=labels, autopct="%1.0f%%", colors=["#c44e52", "#dd8452", "#ccb974"])
+        ax.axis("equal")
+    else:
+        ax.text(0.5, 0.5, "Нет данных за сегодня", ha="center", va="center")
+        ax.axis("off")
+    ax.set_title("БЖУ за сегодня (доля калорий)")
+    return _to_png(fig)
+
+
+def render_water_chart(data: dict) -> bytes:
+    """Столбцы воды по дням против цели"""
+    fig, ax = _new_figure()
+    labels = [d["date"] for d in data["days"]]
+    values = [d["water"] for d in data["days"]]
+    goal = data["goal"]
+
+    ax.bar(labels, values, color=["#4c72b0" if v >= goal else "#a1c9f4" for v in values])
+    ax.axhline(goal, color="#55a868", linestyle="--", label=f"Цель {goal} мл")
+    ax.set_title("Вода по дням, мл")
+    ax.legend(loc="best")
+    return _to_png(fig)
+
+
+_RENDERERS = {
+    "weight": render_weight_chart,
+    "calories": render_calories_chart,
+    "macros": render_macros_chart,
+    "water": render_water_chart,
+}
+
+
+# ============================================================================
+# Данные для графиков
+# ============================================================================
+
+def _user_tz(user: User) -> ZoneInfo:
+    try:
+        return ZoneInfo(user.timezone or "Europe/Moscow")
+    except Exception:
+        return ZoneInfo("Europe/Moscow")
+
+
+def _local_date(ts_utc: datetime, tz: ZoneInfo):
+    return ts_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz).date()
+
+
+async def load_chart_data(user_id: int, chart: str, days: int = 7) -> Optional[dict]:
+    """
+    Собрать данные для графика одним-двумя запросами
+
+    Returns:
+        Словарь для рендера или None, если пользователя нет / нечего рисовать
+    """
+    async with read_scope(user_id) as session:
+        user_result = await session.execute(select(User).where(User.id == user_id))
+        user = user_result.scalar_one_or_none()
+        if not user:
+            return None
+
+        tz = _user_tz(user)
+        today_local = datetime.now(tz).date()
+        first_day = today_local - timedelta(days=days - 1)
+        # Небольшой запас: границы дня фильтруем уже по локальной дате
+        since_utc = datetime.utcnow() - timedelta(days=days + 1)
+
+        if chart == "weight":
+            result = await session.execute(
+                select(WeightEntry.created_at, WeightEntry.weight)
+                .where(WeightEntry.user_id == user_id)
+                .where(WeightEntry.created_at >= datetime.utcnow() - timedelta(days=30))
+                .order_by(WeightEntry.created_at)
+            )
+            points = [
+                {"date": _local_date(ts, tz).strftime("%d.%m"), "weight": weight}
+                for ts, weight in result.all()
+            ]
+            if not points:
+                return None
+            return {"points": points, "target": user.target_weight}
+
+        if chart == "macros":
+            day_start_utc = datetime.combine(today_local, datetime.min.time(), tz) \
+                .astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
+            result = await session.execute(
+                select(FoodEntry.protein, FoodEntry.carbs, FoodEntry.fat)
+                .where(FoodEntry.user_id == user_id)
+                .where(FoodEntry.created_at >= day_start_utc)
+            )
+            rows = result.all()
+            return {
+                "protein": round(sum(r[0] or 0 for r in rows), 1),
+                "carbs": round(sum(r[1] or 0 for r in rows), 1),
+                "fat": round(sum(r[2] or 0 for r in rows), 1)
+            }
+
+        if chart == "calories":
+            column, model, goal = FoodEntry.calories, FoodEntry, user.calorie_goal
+        elif chart == "water":
+            column, model, goal = WaterEntry.amount, WaterEntry, user.water_goal
+        else:
+            return None
+
+        result = await session.execute(
+            select(model.created_at, column)
+            .where(model.user_id == user_id)
+            .where(model.created_at >= since_utc)
+        )
+        totals: dict = {}
+        for ts, value in result.all():
+            day = _local_date(ts, tz)
+            if day >= first_day:
+                totals[day] = totals.get(day, 0) + (value or 0)
+
+    key = "calories" if chart == "calories" else "water"
+    return {
+        "goal": goal,
+        "days": [
+            {"date": (first_day + timedelta(days=i)).strftime("%d.%m"),
+             key: totals.get(first_day + timedelta(days=i), 0)}
+            for i in range(days)
+        ]
+    }
+
+
+# ============================================================================
+# Рендер с кэшем
+# ============================================================================
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=config.CHART_WORKERS)
+    return _pool
+
+
+def _data_version(data: dict) -> str:
+    """Версия данных — хэш содержимого: изменились данные → новый ключ кэша"""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+async def render_chart(user_id: int, chart: str, data: dict) -> bytes:
+    """
+    Получить PNG графика: из кэша или рендером в пуле процессов
+
+    Args:
+        user_id: ID пользователя
+        chart: Тип графика из CHART_TYPES
+        data: Данные из load_chart_data()
+    """
+    key = (user_id, chart, _data_version(data))
+    cached = _png_cache.get(key)
+    if cached is not None:
+        _png_cache.move_to_end(key)
+        logger.info(f"[CHART] user={user_id} | {chart}: cache hit")
+        return cached
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(_get_pool(), _RENDERERS[chart], data)
+
+    # Старые версии графика этого пользователя больше не нужны
+    for old_key in [k for k in _png_cache if k[0] == user_id and k[1] == chart]:
+        del _png_cache[old_key]
+    _png_cache[key] = png
+    while len(_png_cache) > config.CHART_CACHE_SIZE:
+        _png_cache.popitem(last=False)
+
+    logger.info(f"[CHART] user={user_id} | {chart}: rendered {len(png)} bytes")
+    return png
+
+
+async def get_chart(user_id: int, chart: str) -> Optional[bytes]:
+    """Загрузить данные и вернуть PNG графика (None — нет данных)"""
+    if chart not in CHART_TYPES:
+        return None
+    data = await load_chart_data(user_id, chart)
+    if data is None:
+        return None
+    return await render_chart(user_id, chart, data)
+
+
+def shutdown_chart_pool():
+    """Остановить пул процессов рендера (при завершении бота)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -2,24 +2,36 @@
 Coach Service - Оркестрация AI коуча
 Выполняет инструменты и управляет диалогом
 """
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from zoneinfo import ZoneInfo
 from sqlalchemy import select, func, delete
+from sqlalchemy.orm import load_only
 
-from database.db import async_session
+from database.db import (
+    session_scope, read_scope, release_connection, use_own_sessions, mark_user_write, written_since
+)
 from database.models import (
-    User, FoodEntry, WaterEntry, WeightEntry, ActivityEntry
+    User, FoodEntry, FoodAnalysis, WaterEntry, WeightEntry, ActivityEntry
 )
 from services.memory import (
     save_message, get_recent_messages, save_memory, get_memories_as_text
 )
 from services.ai import (
     process_message, process_message_with_tool_results,
-    estimate_activity_calories
+    estimate_activity_calories, estimate_calories_by_met
 )
+from services.health_metrics import METRICS, METRIC_UNITS, get_metric_trend, record_sample
+from services.nutrition_db import check_estimate
+from services.fast_path import match_fast_path, render_reply
+from services.response_policy import needs_followup, render_template
+from services.tools import handler, get_tool, ToolInputError
+from services import metrics
+from services.water import add_water
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +44,7 @@ async def get_user_context(user_id: int) -> dict:
     """
     Собирает полный контекст пользователя для AI
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         # Получаем пользователя
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one_or_none()
@@ -57,12 +69,13 @@ async def get_user_context(user_id: int) -> dict:
         day_start_utc = day_start_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
 
         # Еда за сегодня
+        # Только числовые колонки и описание — без ORM-объектов
         food_result = await session.execute(
-            select(FoodEntry)
+            select(FoodEntry.calories, FoodEntry.protein, FoodEntry.carbs, FoodEntry.fat, FoodEntry.description)
             .where(FoodEntry.user_id == user_id)
             .where(FoodEntry.created_at >= day_start_utc)
         )
-        foods = food_result.scalars().all()
+        foods = food_result.all()
 
         calories_today = sum(f.calories or 0 for f in foods)
         protein_today = sum(f.protein or 0 for f in foods)
@@ -116,86 +129,159 @@ async def get_user_context(user_id: int) -> dict:
         }
 
 
-# ============================================================================
-# Выполнение инструментов
-# ============================================================================
+# Поля контекста, которые нужны превью фото еды
+_SNAPSHOT_FIELDS = (
+    "calorie_goal", "protein_goal", "water_goal",
+    "calories_today", "protein_today", "carbs_today", "fat_today", "water_today"
+)
+# Сколько секунд снимок дня в FSM считается свежим
+DAY_SNAPSHOT_TTL = 900
 
-async def execute_tool(user_id: int, tool_name: str, tool_input: dict) -> dict:
-    """
-    Выполняет инструмент и возвращает результат
 
-    Returns:
-        {"success": bool, "data": dict, "message": str}
-    """
+def _local_today(timezone: Optional[str]) -> str:
     try:
-        if tool_name == "log_food":
-            return await _log_food(user_id, tool_input)
-
-        elif tool_name == "log_water":
-            return await _log_water(user_id, tool_input)
+        tz = ZoneInfo(timezone or "Europe/Moscow")
+    except Exception:
+        tz = ZoneInfo("Europe/Moscow")
+    return datetime.now(tz).date().isoformat()
 
-        elif tool_name == "log_weight":
-            return await _log_weight(user_id, tool_input)
 
-        elif tool_name == "log_activity":
-            return await _log_activity(user_id, tool_input)
-
-        elif tool_name == "get_today_stats":
-            return await _get_today_stats(user_id)
-
-        elif tool_name == "get_weight_history":
-            return await _get_weight_history(user_id, tool_input)
-
-        elif tool_name == "remember_fact":
-            return await _remember_fact(user_id, tool_input)
+def _snapshot_fresh(user_id: int, snapshot: dict) -> bool:
+    return (
+        snapshot.get("day") == _local_today(snapshot.get("timezone"))
+        and time.monotonic() - snapshot.get("built_at", 0) < DAY_SNAPSHOT_TTL
+        and not written_since(user_id, snapshot.get("built_at", 0))
+    )
 
-        elif tool_name == "update_profile":
-            return await _update_profile(user_id, tool_input)
 
-        elif tool_name == "check_profile_complete":
-            return await _check_profile_complete(user_id)
+async def get_day_snapshot(user_id: int, snapshot: Optional[dict] = None) -> dict:
+    """
+    Снимок «сегодня» для фото-потока: цели и съеденное за день
 
-        elif tool_name == "get_today_activities":
-            return await _get_today_activities(user_id)
+    Переданный снимок (из FSM) возвращается без запросов к БД, пока он свежий:
+    тот же день, моложе DAY_SNAPSHOT_TTL и у пользователя не было записей после него.
 
-        elif tool_name == "update_daily_activity":
-            return await _update_daily_activity(user_id, tool_input)
+    Args:
+        user_id: ID пользователя
+        snapshot: Ранее сохранённый снимок (опционально)
 
-        elif tool_name == "clear_today_activities":
-            return await _clear_today_activities(user_id, tool_input)
+    Returns:
+        Словарь с полями контекста для format_food_analysis
+    """
+    if snapshot and _snapshot_fresh(user_id, snapshot):
+        metrics.inc("photo.snapshot.reused")
+        return snapshot
 
-        elif tool_name == "list_today_food":
-            return await _list_today_food(user_id)
+    metrics.inc("photo.snapshot.built")
+    context = await get_user_context(user_id)
+    snapshot = {field: context.get(field) or 0 for field in _SNAPSHOT_FIELDS}
+    snapshot["timezone"] = context.get("timezone")
+    snapshot["day"] = _local_today(snapshot["timezone"])
+    snapshot["built_at"] = time.monotonic()
+    return snapshot
 
-        elif tool_name == "delete_food_entry":
-            return await _delete_food_entry(user_id, tool_input)
 
-        elif tool_name == "update_food_entry":
-            return await _update_food_entry(user_id, tool_input)
+def apply_meal_to_snapshot(snapshot: dict, food_data: dict) -> dict:
+    """Снимок после записи блюда — арифметикой, без повторного чтения из БД"""
+    total = food_data.get("total", {})
+    updated = dict(snapshot)
+    for field, key in (
+        ("calories_today", "calories"), ("protein_today", "protein"),
+        ("carbs_today", "carbs"), ("fat_today", "fat")
+    ):
+        updated[field] = (snapshot.get(field) or 0) + (total.get(key) or 0)
+    # Наша же запись — снимок её уже учитывает
+    updated["built_at"] = time.monotonic()
+    return updated
 
-        elif tool_name == "clear_today_food":
-            return await _clear_today_food(user_id, tool_input)
 
-        elif tool_name == "list_today_water":
-            return await _list_today_water(user_id)
+# ============================================================================
+# Выполнение инструментов
+# ============================================================================
 
-        elif tool_name == "clear_today_water":
-            return await _clear_today_water(user_id, tool_input)
+async def execute_tool(user_id: int, tool_name: str, tool_input: dict) -> dict:
+    """
+    Выполняет инструмент и возвращает результат
 
-        elif tool_name == "set_today_water":
-            return await _set_today_water(user_id, tool_input)
+    Returns:
+        {"success": bool, "data": dict, "message": str}
+    """
+    spec = get_tool(tool_name)
+    if not spec or not spec.handler:
+        return {"success": False, "message": f"Unknown tool: {tool_name}"}
 
-        else:
-            return {"success": False, "message": f"Unknown tool: {tool_name}"}
+    try:
+        data = spec.validate(tool_input or {})
+    except ToolInputError as e:
+        logger.warning(f"[COACH] user={user_id} | Invalid tool input: {e}")
+        metrics.inc(f"tool.{tool_name}.invalid")
+        return {"success": False, "message": str(e)}
 
+    try:
+        with metrics.timer(f"tool.{tool_name}"):
+            result = await spec.handler(user_id, data)
+        if not spec.read_only:
+            # Массовые delete/update не видны after_flush — отмечаем запись по классификации инструмента
+            mark_user_write(user_id)
+        return result
     except Exception as e:
         logger.error(f"Tool execution error: {tool_name} | {e}")
+        metrics.inc(f"tool.{tool_name}.errors")
         return {"success": False, "message": str(e)}
 
 
+async def execute_tools(user_id: int, tool_calls: list[dict]) -> list[dict]:
+    """
+    Выполнить несколько инструментов с сохранением порядка результатов
+
+    Подряд идущие read-only инструменты выполняются параллельно,
+    пишущие — строго по очереди (порядок записи важен для пользователя)
+    """
+    results: list[Optional[dict]] = [None] * len(tool_calls)
+    batch: list[int] = []
+
+    async def run_isolated(tool: dict) -> dict:
+        # Параллельные задачи не могут делить одну AsyncSession апдейта
+        use_own_sessions()
+        return await execute_tool(user_id, tool["name"], tool["input"])
+
+    async def flush_batch():
+        if len(batch) == 1:
+            i = batch.pop()
+            results[i] = await execute_tool(user_id, tool_calls[i]["name"], tool_calls[i]["input"])
+        elif batch:
+            batch_results = await asyncio.gather(*(run_isolated(tool_calls[i]) for i in batch))
+            for i, result in zip(batch, batch_results):
+                results[i] = result
+            batch.clear()
+
+    for i, tool in enumerate(tool_calls):
+        spec = get_tool(tool["name"])
+        if spec and spec.read_only:
+            batch.append(i)
+            continue
+        await flush_batch()
+        results[i] = await execute_tool(user_id, tool["name"], tool["input"])
+    await flush_batch()
+
+    return results
+
+
+@handler("log_food")
 async def _log_food(user_id: int, data: dict) -> dict:
     """Записать приём пищи"""
-    async with async_session() as session:
+    # Сверяем оценку со справочником: при большом расхождении берём справочные КБЖУ
+    note = ""
+    reference = check_estimate(data)
+    if reference:
+        logger.warning(
+            f"[COACH] user={user_id} | log_food estimate {data.get('calories')} kcal "
+            f"vs reference {reference['calories']} kcal ({reference['name']} {reference['grams']:g} г)"
+        )
+        data = {**data, **{k: reference[k] for k in ("calories", "protein", "carbs", "fat")}}
+        note = " — скорректировано по справочнику"
+
+    async with session_scope() as session:
         food_entry = FoodEntry(
             user_id=user_id,
             description=data.get("description", "Еда"),
@@ -207,7 +293,6 @@ async def _log_food(user_id: int, data: dict) -> dict:
             fiber=data.get("fiber", 0)
         )
         session.add(food_entry)
-        await session.commit()
 
     return {
         "success": True,
@@ -218,39 +303,17 @@ async def _log_food(user_id: int, data: dict) -> dict:
             "carbs": data.get("carbs", 0),
             "fat": data.get("fat", 0)
         },
-        "message": f"Записано: {data.get('description')} ({data.get('calories', 0)} ккал)"
+        "message": f"Записано: {data.get('description')} ({data.get('calories', 0)} ккал){note}"
     }
 
 
+@handler("log_water")
 async def _log_water(user_id: int, data: dict) -> dict:
     """Записать воду"""
-    amount = data.get("amount_ml", 250)
-
-    async with async_session() as session:
-        entry = WaterEntry(user_id=user_id, amount=amount)
-        session.add(entry)
-        await session.commit()
-
-        # Получаем общее количество за сегодня
-        user_result = await session.execute(select(User).where(User.id == user_id))
-        user = user_result.scalar_one_or_none()
-
-        try:
-            tz = ZoneInfo(user.timezone if user else "Europe/Moscow")
-        except Exception:
-            tz = ZoneInfo("Europe/Moscow")
-
-        now_local = datetime.now(tz)
-        day_start = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_start_utc = day_start.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
-
-        total_result = await session.execute(
-            select(func.sum(WaterEntry.amount))
-            .where(WaterEntry.user_id == user_id)
-            .where(WaterEntry.created_at >= day_start_utc)
-        )
-        total = total_result.scalar_one() or 0
-        goal = user.water_goal if user else 2000
+    amount = data["amount_ml"]
+    # Писатель воды работает в своей транзакции — фиксируем изменения апдейта (новый пользователь)
+    await release_connection()
+    total, goal = await add_water(user_id, amount)
 
     return {
         "success": True,
@@ -259,11 +322,12 @@ async def _log_water(user_id: int, data: dict) -> dict:
     }
 
 
+@handler("log_weight")
 async def _log_weight(user_id: int, data: dict) -> dict:
     """Записать вес"""
-    weight = data.get("weight_kg")
+    weight = data["weight_kg"]
 
-    async with async_session() as session:
+    async with session_scope() as session:
         # Сохраняем в историю
         entry = WeightEntry(user_id=user_id, weight=weight)
         session.add(entry)
@@ -273,7 +337,6 @@ async def _log_weight(user_id: int, data: dict) -> dict:
         user = user_result.scalar_one_or_none()
         if user:
             user.current_weight = weight
-        await session.commit()
 
     return {
         "success": True,
@@ -282,15 +345,16 @@ async def _log_weight(user_id: int, data: dict) -> dict:
     }
 
 
+@handler("log_activity")
 async def _log_activity(user_id: int, data: dict) -> dict:
     """Записать активность"""
-    activity_type = data.get("activity_type", "тренировка")
-    duration = data.get("duration_minutes", 30)
+    activity_type = data["activity_type"]
+    duration = data["duration_minutes"]
     calories_burned = data.get("calories_burned")
 
     # Если калории не указаны — рассчитываем
     if calories_burned is None:
-        async with async_session() as session:
+        async with session_scope() as session:
             user_result = await session.execute(select(User).where(User.id == user_id))
             user = user_result.scalar_one_or_none()
             weight = user.current_weight if user else 70
@@ -298,7 +362,7 @@ async def _log_activity(user_id: int, data: dict) -> dict:
         activity_result = await estimate_activity_calories(activity_type, duration, weight)
         calories_burned = activity_result.get("calories_burned", 0)
 
-    async with async_session() as session:
+    async with session_scope() as session:
         entry = ActivityEntry(
             user_id=user_id,
             activity_type=activity_type,
@@ -306,7 +370,6 @@ async def _log_activity(user_id: int, data: dict) -> dict:
             calories_burned=calories_burned
         )
         session.add(entry)
-        await session.commit()
 
     return {
         "success": True,
@@ -319,7 +382,8 @@ async def _log_activity(user_id: int, data: dict) -> dict:
     }
 
 
-async def _get_today_stats(user_id: int) -> dict:
+@handler("get_today_stats")
+async def _get_today_stats(user_id: int, data: dict = None) -> dict:
     """Получить статистику за сегодня"""
     context = await get_user_context(user_id)
 
@@ -339,12 +403,13 @@ async def _get_today_stats(user_id: int) -> dict:
     }
 
 
+@handler("get_weight_history")
 async def _get_weight_history(user_id: int, data: dict) -> dict:
     """Получить историю веса"""
     days = data.get("days", 7)
     cutoff = datetime.utcnow() - timedelta(days=days)
 
-    async with async_session() as session:
+    async with read_scope(user_id) as session:
         result = await session.execute(
             select(WeightEntry)
             .where(WeightEntry.user_id == user_id)
@@ -372,6 +437,38 @@ async def _get_weight_history(user_id: int, data: dict) -> dict:
     }
 
 
+@handler("get_health_trend")
+async def _get_health_trend(user_id: int, data: dict) -> dict:
+    """Получить тренд пульса/сна по дневным агрегатам"""
+    metric = data.get("metric", "heart_rate")
+    days = data.get("days", 7)
+
+    if metric not in METRICS:
+        return {"success": False, "message": f"Неизвестная метрика: {metric}"}
+
+    async with read_scope(user_id) as session:
+        result = await session.execute(select(User.timezone).where(User.id == user_id))
+        timezone = result.scalar_one_or_none()
+
+    trend = await get_metric_trend(user_id, metric, days, timezone or "Europe/Moscow")
+    unit = METRIC_UNITS.get(metric, "")
+
+    if trend["avg"] is None:
+        message = f"Нет данных за {days} дней"
+    else:
+        message = (
+            f"За {days} дней: в среднем {trend['avg']} {unit} "
+            f"(мин {trend['min']}, макс {trend['max']}), {trend['trend']}"
+        )
+
+    return {
+        "success": True,
+        "data": trend,
+        "message": message
+    }
+
+
+@handler("remember_fact")
 async def _remember_fact(user_id: int, data: dict) -> dict:
     """Запомнить факт о пользователе"""
     category = data.get("category", "fact")
@@ -386,9 +483,10 @@ async def _remember_fact(user_id: int, data: dict) -> dict:
     }
 
 
+@handler("update_profile")
 async def _update_profile(user_id: int, data: dict) -> dict:
     """Обновить профиль пользователя"""
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one_or_none()
 
@@ -457,7 +555,6 @@ async def _update_profile(user_id: int, data: dict) -> dict:
             # Белок: 1.6г на кг
             user.protein_goal = int(user.current_weight * 1.6)
 
-        await session.commit()
 
     return {
         "success": True,
@@ -466,9 +563,10 @@ async def _update_profile(user_id: int, data: dict) -> dict:
     }
 
 
-async def _check_profile_complete(user_id: int) -> dict:
+@handler("check_profile_complete")
+async def _check_profile_complete(user_id: int, data: dict = None) -> dict:
     """Проверить заполненность профиля"""
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one_or_none()
 
@@ -501,9 +599,10 @@ async def _check_profile_complete(user_id: int) -> dict:
         }
 
 
-async def _get_today_activities(user_id: int) -> dict:
+@handler("get_today_activities")
+async def _get_today_activities(user_id: int, data: dict = None) -> dict:
     """Получить список активностей за сегодня"""
-    async with async_session() as session:
+    async with session_scope() as session:
         # Получаем пользователя для timezone
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
@@ -542,13 +641,14 @@ async def _get_today_activities(user_id: int) -> dict:
         }
 
 
+@handler("update_daily_activity")
 async def _update_daily_activity(user_id: int, data: dict) -> dict:
     """Обновить или создать дневную активность"""
     calories_burned = data.get("calories_burned", 0)
     activity_type = data.get("activity_type", "дневная активность")
     reason = data.get("reason", "обновление по запросу")
 
-    async with async_session() as session:
+    async with session_scope() as session:
         # Получаем пользователя для timezone
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
@@ -577,7 +677,6 @@ async def _update_daily_activity(user_id: int, data: dict) -> dict:
             calories_burned=calories_burned
         )
         session.add(new_entry)
-        await session.commit()
 
         logger.info(f"[ACTIVITY] user={user_id} | Updated to {calories_burned} ккал | reason: {reason}")
 
@@ -591,12 +690,13 @@ async def _update_daily_activity(user_id: int, data: dict) -> dict:
         }
 
 
+@handler("clear_today_activities")
 async def _clear_today_activities(user_id: int, data: dict) -> dict:
     """Удалить все активности за сегодня"""
     if not data.get("confirm"):
         return {"success": False, "message": "Требуется подтверждение (confirm: true)"}
 
-    async with async_session() as session:
+    async with session_scope() as session:
         # Получаем пользователя для timezone
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
@@ -624,7 +724,6 @@ async def _clear_today_activities(user_id: int, data: dict) -> dict:
             .where(ActivityEntry.user_id == user_id)
             .where(ActivityEntry.created_at >= day_start_utc)
         )
-        await session.commit()
 
         logger.info(f"[ACTIVITY] user={user_id} | Cleared {count} activities")
 
@@ -635,9 +734,16 @@ async def _clear_today_activities(user_id: int, data: dict) -> dict:
         }
 
 
-async def _list_today_food(user_id: int) -> dict:
+# Колонки для правки/удаления еды (id и created_at грузятся всегда как PK)
+_FOOD_EDIT_COLUMNS = load_only(
+    FoodEntry.user_id, FoodEntry.description, FoodEntry.calories, FoodEntry.protein, FoodEntry.carbs, FoodEntry.fat
+)
+
+
+@handler("list_today_food")
+async def _list_today_food(user_id: int, data: dict = None) -> dict:
     """Показать все записи еды за сегодня"""
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -651,12 +757,15 @@ async def _list_today_food(user_id: int) -> dict:
         day_start_utc = day_start.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
 
         result = await session.execute(
-            select(FoodEntry)
+            select(
+                FoodEntry.id, FoodEntry.description, FoodEntry.calories,
+                FoodEntry.protein, FoodEntry.carbs, FoodEntry.fat, FoodEntry.created_at
+            )
             .where(FoodEntry.user_id == user_id)
             .where(FoodEntry.created_at >= day_start_utc)
             .order_by(FoodEntry.created_at)
         )
-        entries = result.scalars().all()
+        entries = result.all()
 
         if not entries:
             return {
@@ -687,12 +796,13 @@ async def _list_today_food(user_id: int) -> dict:
         }
 
 
+@handler("delete_food_entry")
 async def _delete_food_entry(user_id: int, data: dict) -> dict:
     """Удалить запись еды"""
     entry_number = data.get("entry_number")
     description_match = data.get("description_match", "").lower()
 
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -707,6 +817,7 @@ async def _delete_food_entry(user_id: int, data: dict) -> dict:
 
         result = await session.execute(
             select(FoodEntry)
+            .options(_FOOD_EDIT_COLUMNS)
             .where(FoodEntry.user_id == user_id)
             .where(FoodEntry.created_at >= day_start_utc)
             .order_by(FoodEntry.created_at)
@@ -732,8 +843,18 @@ async def _delete_food_entry(user_id: int, data: dict) -> dict:
         description = entry_to_delete.description
         calories = entry_to_delete.calories
 
-        await session.delete(entry_to_delete)
-        await session.commit()
+        # Мимо ORM-каскада: session.delete() загрузил бы разбор AI (JSONB из TOAST) только чтобы удалить
+        await session.execute(
+            delete(FoodAnalysis)
+            .where(FoodAnalysis.food_entry_id == entry_to_delete.id)
+            .where(FoodAnalysis.created_at == entry_to_delete.created_at)
+        )
+        await session.execute(
+            delete(FoodEntry)
+            .where(FoodEntry.id == entry_to_delete.id)
+            .where(FoodEntry.created_at == entry_to_delete.created_at)
+        )
+        session.expunge(entry_to_delete)
 
         logger.info(f"[FOOD] user={user_id} | Deleted: {description} ({calories} ккал)")
 
@@ -744,12 +865,13 @@ async def _delete_food_entry(user_id: int, data: dict) -> dict:
         }
 
 
+@handler("update_food_entry")
 async def _update_food_entry(user_id: int, data: dict) -> dict:
     """Изменить запись еды"""
     entry_number = data.get("entry_number")
     description_match = data.get("description_match", "").lower()
 
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -764,6 +886,7 @@ async def _update_food_entry(user_id: int, data: dict) -> dict:
 
         result = await session.execute(
             select(FoodEntry)
+            .options(_FOOD_EDIT_COLUMNS)
             .where(FoodEntry.user_id == user_id)
             .where(FoodEntry.created_at >= day_start_utc)
             .order_by(FoodEntry.created_at)
@@ -801,7 +924,6 @@ async def _update_food_entry(user_id: int, data: dict) -> dict:
         if data.get("new_fat") is not None:
             entry_to_update.fat = data["new_fat"]
 
-        await session.commit()
 
         logger.info(f"[FOOD] user={user_id} | Updated: {old_desc} -> {entry_to_update.description}")
 
@@ -815,12 +937,13 @@ async def _update_food_entry(user_id: int, data: dict) -> dict:
         }
 
 
+@handler("clear_today_food")
 async def _clear_today_food(user_id: int, data: dict) -> dict:
     """Удалить все записи еды за сегодня"""
     if not data.get("confirm"):
         return {"success": False, "message": "Требуется подтверждение (confirm: true)"}
 
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -840,12 +963,17 @@ async def _clear_today_food(user_id: int, data: dict) -> dict:
         )
         count = count_result.scalar_one() or 0
 
+        # Массовое удаление мимо ORM-каскада — разборы AI чистим сами
+        await session.execute(
+            delete(FoodAnalysis)
+            .where(FoodAnalysis.user_id == user_id)
+            .where(FoodAnalysis.created_at >= day_start_utc)
+        )
         await session.execute(
             delete(FoodEntry)
             .where(FoodEntry.user_id == user_id)
             .where(FoodEntry.created_at >= day_start_utc)
         )
-        await session.commit()
 
         logger.info(f"[FOOD] user={user_id} | Cleared {count} food entries")
 
@@ -856,9 +984,10 @@ async def _clear_today_food(user_id: int, data: dict) -> dict:
         }
 
 
-async def _list_today_water(user_id: int) -> dict:
+@handler("list_today_water")
+async def _list_today_water(user_id: int, data: dict = None) -> dict:
     """Показать все записи воды за сегодня"""
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -892,12 +1021,13 @@ async def _list_today_water(user_id: int) -> dict:
         }
 
 
+@handler("clear_today_water")
 async def _clear_today_water(user_id: int, data: dict) -> dict:
     """Удалить все записи воды за сегодня"""
     if not data.get("confirm"):
         return {"success": False, "message": "Требуется подтверждение (confirm: true)"}
 
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -922,7 +1052,6 @@ async def _clear_today_water(user_id: int, data: dict) -> dict:
             .where(WaterEntry.user_id == user_id)
             .where(WaterEntry.created_at >= day_start_utc)
         )
-        await session.commit()
 
         logger.info(f"[WATER] user={user_id} | Cleared {count} water entries")
 
@@ -933,11 +1062,12 @@ async def _clear_today_water(user_id: int, data: dict) -> dict:
         }
 
 
+@handler("set_today_water")
 async def _set_today_water(user_id: int, data: dict) -> dict:
     """Установить конкретное количество воды за сегодня"""
     amount = data.get("amount_ml", 0)
 
-    async with async_session() as session:
+    async with session_scope() as session:
         user_result = await session.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -962,7 +1092,6 @@ async def _set_today_water(user_id: int, data: dict) -> dict:
             entry = WaterEntry(user_id=user_id, amount=amount)
             session.add(entry)
 
-        await session.commit()
 
         logger.info(f"[WATER] user={user_id} | Set water to {amount} ml")
 
@@ -990,11 +1119,19 @@ async def handle_message(user_id: int, message_text: str) -> str:
     """
     logger.info(f"[COACH] user={user_id} | message: {message_text[:100]}")
 
+    # 0. Простые записи (вода, вес, активность, еда из справочника) — без LLM
+    fast = match_fast_path(message_text)
+    if fast:
+        return await _handle_fast_path(user_id, message_text, *fast)
+
     # 1. Загружаем контекст
     user_context = await get_user_context(user_id)
     memories_text = await get_memories_as_text(user_id)
     conversation = await get_recent_messages(user_id, limit=10)
 
+    # Не держим соединение с БД, пока ждём LLM
+    await release_connection()
+
     # 2. Отправляем в AI
     result = await process_message(
         user_id=user_id,
@@ -1007,24 +1144,21 @@ async def handle_message(user_id: int, message_text: str) -> str:
     response_text = result.get("response", "")
     tool_calls = result.get("tool_calls", [])
 
-    # 3. Выполняем инструменты если есть
+    # 3. Выполняем инструменты если есть (read-only — параллельно)
+    exec_results = await execute_tools(user_id, tool_calls)
     tool_results_data = []
-    for tool in tool_calls:
-        tool_name = tool["name"]
-        tool_input = tool["input"]
-        tool_id = tool["id"]
-
-        exec_result = await execute_tool(user_id, tool_name, tool_input)
-        logger.info(f"[COACH] Tool result: {tool_name} | {exec_result.get('message', '')}")
-
+    for tool, exec_result in zip(tool_calls, exec_results):
+        logger.info(f"[COACH] Tool result: {tool['name']} | {exec_result.get('message', '')}")
         tool_results_data.append({
             "type": "tool_result",
-            "tool_use_id": tool_id,
+            "tool_use_id": tool["id"],
             "content": json.dumps(exec_result, ensure_ascii=False)
         })
 
-    # 4. Если были инструменты — получаем финальный ответ
-    if tool_calls:
+    # 4. Если были инструменты — финальный ответ: шаблон или второй запрос к LLM
+    if tool_calls and not needs_followup(tool_calls, exec_results):
+        response_text = render_template(response_text, tool_calls, exec_results)
+    elif tool_calls:
         # Формируем assistant_content для продолжения
         assistant_content = []
         if response_text:
@@ -1039,6 +1173,7 @@ async def handle_message(user_id: int, message_text: str) -> str:
 
         # Обновляем контекст после выполнения инструментов
         user_context = await get_user_context(user_id)
+        await release_connection()
 
         final_response = await process_message_with_tool_results(
             user_id=user_id,
@@ -1081,6 +1216,33 @@ async def handle_message(user_id: int, message_text: str) -> str:
     return response_text
 
 
+async def _handle_fast_path(user_id: int, message_text: str, rule: str, tool_name: str, tool_input: dict) -> str:
+    """Выполнить инструмент, найденный быстрым путём, и ответить шаблоном"""
+    if tool_name == "log_activity":
+        # Калории по MET — без отдельного запроса к LLM
+        async with session_scope() as session:
+            weight_result = await session.execute(select(User.current_weight).where(User.id == user_id))
+            weight = weight_result.scalar_one_or_none() or 70
+        tool_input["calories_burned"] = estimate_calories_by_met(
+            tool_input["activity_type"], tool_input["duration_minutes"], weight
+        )
+
+    exec_result = await execute_tool(user_id, tool_name, tool_input)
+    if not exec_result.get("success"):
+        response_text = f"❌ {exec_result.get('message', 'Не удалось записать')}"
+    else:
+        stats = (await _get_today_stats(user_id))["data"] if tool_name == "log_food" else None
+        response_text = render_reply(tool_name, tool_input, exec_result, stats)
+        if tool_name == "log_food":
+            response_text += "\n_Посчитано по справочнику. Если порция другая — просто напиши._"
+
+    await save_message(user_id, "user", message_text)
+    await save_message(user_id, "assistant", response_text)
+
+    logger.info(f"[COACH] user={user_id} | fast path ({rule}): {exec_result.get('message', '')}")
+    return response_text
+
+
 async def format_food_analysis(
     user_id: int,
     food_data: dict,
@@ -1093,7 +1255,7 @@ async def format_food_analysis(
     Args:
         user_id: ID пользователя
         food_data: Результат анализа от AI
-        user_context: Контекст (опционально, загрузится автоматически)
+        user_context: Контекст или снимок дня get_day_snapshot() (опционально, загрузится автоматически)
         saved: Показывать что уже сохранено
 
     Returns:
@@ -1217,7 +1379,8 @@ async def save_food_entry(user_id: int, food_data: dict) -> bool:
     total = food_data.get("total", {})
     description = food_data.get("description", "Еда")
 
-    async with async_session() as session:
+    created_at = datetime.utcnow()
+    async with session_scope() as session:
         food_entry = FoodEntry(
             user_id=user_id,
             description=description,
@@ -1227,10 +1390,11 @@ async def save_food_entry(user_id: int, food_data: dict) -> bool:
             carbs=total.get("carbs", 0),
             fat=total.get("fat", 0),
             fiber=total.get("fiber", 0),
-            ai_raw_response=json.dumps(food_data, ensure_ascii=False)
+            created_at=created_at,
+            # Полный разбор — в food_analyses, в той же партиции по времени
+            analysis=FoodAnalysis(user_id=user_id, created_at=created_at, data=food_data)
         )
         session.add(food_entry)
-        await session.commit()
 
     return True
 
@@ -1247,12 +1411,13 @@ async def handle_photo_message(
     - format_food_analysis() - только форматирование
     - save_food_entry() - только сохранение
     """
+    snapshot = await get_day_snapshot(user_id, user_context)
+
     # Сохраняем
     await save_food_entry(user_id, food_data)
 
-    # Обновляем контекст и форматируем
-    user_context = await get_user_context(user_id)
-    return await format_food_analysis(user_id, food_data, user_context, saved=True)
+    # Итог за день — арифметикой по снимку
+    return await format_food_analysis(user_id, food_data, apply_meal_to_snapshot(snapshot, food_data), saved=True)
 
 
 async def handle_fitness_photo(user_id: int, fitness_data: dict) -> str:
@@ -1294,6 +1459,13 @@ async def handle_fitness_photo(user_id: int, fitness_data: dict) -> str:
     if activity.get("floors"):
         response += f"🏢 Этажи: {activity['floors']}\n"
 
+    # Пульс с экрана часов — в хранилище метрик
+    if activity.get("heart_rate"):
+        try:
+            await record_sample(user_id, "heart_rate", float(activity["heart_rate"]))
+        except Exception as e:
+            logger.error(f"[FITNESS] user={user_id} | Failed to record heart rate: {e}")
+
     # Определяем что сохранять
     workout_type = activity.get("workout_type")
     workout_duration = activity.get("workout_duration_min") or activity.get("active_minutes")
@@ -1334,7 +1506,7 @@ async def handle_fitness_photo(user_id: int, fitness_data: dict) -> str:
             activity_name = "дневная активность"
 
         # Ищем существующую запись "дневная активность" за сегодня и ОБНОВЛЯЕМ
-        async with async_session() as session:
+        async with session_scope() as session:
             # Получаем пользователя для timezone
             user_result = await session.execute(select(User).where(User.id == user_id))
             user = user_result.scalar_one_or_none()
@@ -1365,7 +1537,6 @@ async def handle_fitness_photo(user_id: int, fitness_data: dict) -> str:
                 existing.activity_type = activity_name
                 existing.calories_burned = calories_burned
                 existing.duration = workout_duration or 0
-                await session.commit()
 
                 response += f"\n🔄 **Обновлено: {activity_name}**"
                 response += f"\n🔥 Было: {old_calories} ккал → Стало: {calories_burned} ккал"
@@ -1380,7 +1551,6 @@ async def handle_fitness_photo(user_id: int, fitness_data: dict) -> str:
                     calories_burned=calories_burned
                 )
                 session.add(activity_entry)
-                await session.commit()
 
                 response += f"\n✅ **Записано: {activity_name}**"
                 response += f"\n🔥 Сожжено: -{calories_burned} ккал"
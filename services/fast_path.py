@@ -0,0 +1,197 @@
+"""
+Быстрый путь без LLM для простых сообщений-записей
+- Упорядоченная таблица правил: вода, вес, активность, еда из справочника
+- Правило возвращает (инструмент, параметры, уверенность); ниже порога — обычный путь через LLM
+- Ответ рендерится шаблоном по результату инструмента
+"""
+import logging
+import re
+from typing import Callable, Optional
+
+import config
+from services import metrics
+from services.nutrition_db import match_food_message
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+
+def _num(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+# ============================================================================
+# Правила
+# ============================================================================
+
+_WATER_RE = re.compile(
+    rf"^(?:\+\s*)?(?:(?:я\s+)?выпил[аи]?\s+)?(?:вода|воды|водички)\s*[:\-]?\s*{_NUMBER}\s*(мл|ml|л|литра?)?$"
+    rf"|^(?:\+\s*)?(?:(?:я\s+)?выпил[аи]?\s+)?{_NUMBER}\s*(мл|ml|л|литра?)\s+(?:воды|водички)$"
+)
+
+
+def _match_water(text: str) -> Optional[tuple[str, dict, float]]:
+    m = _WATER_RE.match(text)
+    if not m:
+        return None
+    amount, unit = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+    ml = _num(amount)
+    if unit and unit.startswith("л"):
+        ml *= 1000
+    if not 50 <= ml <= 3000:
+        return None
+    # «вода 300» без единицы — почти наверняка мл, но уверенность ниже
+    return "log_water", {"amount_ml": int(ml)}, 1.0 if unit else 0.9
+
+
+_WEIGHT_RE = re.compile(rf"^(?:мой\s+)?вес\s*[:\-]?\s*{_NUMBER}\s*(кг)?$|^{_NUMBER}\s*кг$")
+
+
+def _match_weight(text: str) -> Optional[tuple[str, dict, float]]:
+    m = _WEIGHT_RE.match(text)
+    if not m:
+        return None
+    weight = _num(m.group(1) or m.group(3))
+    if not 30 <= weight <= 300:
+        return None
+    # «72 кг» без слова «вес» может быть и целевым весом
+    return "log_weight", {"weight_kg": weight}, 1.0 if m.group(1) else 0.7
+
+
+_ACTIVITIES = {
+    "бег": "бег", "бегал": "бег", "бегала": "бег", "пробежка": "бег",
+    "ходьба": "ходьба", "гулял": "ходьба", "гуляла": "ходьба", "прогулка": "ходьба",
+    "плавание": "плавание", "плавал": "плавание", "плавала": "плавание", "бассейн": "плавание",
+    "велосипед": "велосипед", "велик": "велосипед",
+    "йога": "йога", "танцы": "танцы",
+    "тренировка": "тренировка", "зал": "тренировка", "фитнес": "фитнес",
+}
+
+_ACTIVITY_RE = re.compile(
+    rf"^(?:({'|'.join(_ACTIVITIES)})\s+{_NUMBER}\s*(мин|минут[аы]?|ч|час|часа|часов)?"
+    rf"|{_NUMBER}\s*(мин|минут[аы]?|ч|час|часа|часов)\s+({'|'.join(_ACTIVITIES)}))$"
+)
+
+
+def _match_activity(text: str) -> Optional[tuple[str, dict, float]]:
+    m = _ACTIVITY_RE.match(text)
+    if not m:
+        return None
+    if m.group(1):
+        word, amount, unit = m.group(1), m.group(2), m.group(3)
+    else:
+        amount, unit, word = m.group(4), m.group(5), m.group(6)
+
+    minutes = _num(amount)
+    if unit and unit.startswith("ч"):
+        minutes *= 60
+    if not 5 <= minutes <= 300:
+        return None
+    # «бег 10» без единицы — скорее километры, чем минуты: пусть уточнит LLM
+    return (
+        "log_activity",
+        {"activity_type": _ACTIVITIES[word], "duration_minutes": int(minutes)},
+        0.95 if unit else 0.6
+    )
+
+
+def _match_food(text: str) -> Optional[tuple[str, dict, float]]:
+    found = match_food_message(text)
+    if not found:
+        return None
+    data, score = found
+    return "log_food", data, score
+
+
+# Порядок важен: первое сработавшее правило побеждает
+RULES: list[tuple[str, Callable[[str], Optional[tuple[str, dict, float]]]]] = [
+    ("water", _match_water),
+    ("weight", _match_weight),
+    ("activity", _match_activity),
+    ("food", _match_food),
+]
+
+
+def match_fast_path(message_text: str) -> Optional[tuple[str, str, dict]]:
+    """
+    Подобрать правило для сообщения
+
+    Returns:
+        (правило, инструмент, параметры) или None — сообщение идёт в LLM
+    """
+    text = " ".join(message_text.lower().replace("ё", "е").split()).rstrip(".!")
+    if len(text) > 80:
+        metrics.inc("fast_path.miss")
+        return None
+
+    for rule, matcher in RULES:
+        found = matcher(text)
+        if not found:
+            continue
+        tool_name, tool_input, confidence = found
+        if confidence < config.FAST_PATH_THRESHOLD:
+            metrics.inc("fast_path.low_confidence")
+            logger.info(f"[FAST_PATH] '{text}' → {rule} ({confidence:.2f}) below threshold")
+            break
+        metrics.inc("fast_path.hit")
+        metrics.inc(f"fast_path.hit.{rule}")
+        return rule, tool_name, tool_input
+
+    metrics.inc("fast_path.miss")
+    return None
+
+
+def _hit_rate() -> float:
+    hits = metrics.get_counter("fast_path.hit")
+    total = hits + metrics.get_counter("fast_path.miss") + metrics.get_counter("fast_path.low_confidence")
+    return round(hits / total, 3) if total else 0.0
+
+
+metrics.set_gauge("fast_path.hit_rate", _hit_rate)
+
+
+# ============================================================================
+# Шаблоны ответов
+# ============================================================================
+
+def render_reply(tool_name: str, tool_input: dict, result: dict, stats: Optional[dict] = None) -> str:
+    """
+    Ответ пользователю по результату инструмента
+
+    Args:
+        tool_name: Выполненный инструмент
+        tool_input: Параметры инструмента
+        result: Результат execute_tool
+        stats: Статистика за сегодня (_get_today_stats()["data"]) — для еды
+    """
+    data = result.get("data") or {}
+
+    if tool_name == "log_water":
+        total, goal = data.get("total_today", 0), data.get("goal", 2000)
+        progress = min(100, int(total / goal * 100)) if goal else 0
+        text = f"💧 +{data.get('amount_ml')} мл воды\n📊 Сегодня: {total} / {goal} мл ({progress}%)"
+        if total >= goal:
+            text += "\n\n🎉 Норма воды выполнена!"
+        return text
+
+    if tool_name == "log_weight":
+        return f"⚖️ Вес записан: *{data.get('weight_kg')} кг*"
+
+    if tool_name == "log_activity":
+        return (
+            f"🏃 Записал: *{data.get('activity_type')}*, {data.get('duration_minutes')} мин\n"
+            f"🔥 Сожжено ≈ {data.get('calories_burned')} ккал"
+        )
+
+    if tool_name == "log_food":
+        text = (
+            f"✅ Записал: *{tool_input['description']}*\n"
+            f"🔥 {data.get('calories')} ккал | Б {data.get('protein'):g} г | "
+            f"Ж {data.get('fat'):g} г | У {data.get('carbs'):g} г"
+        )
+        if stats:
+            text += f"\n\n📊 Сегодня: {stats['calories']} / {stats['calorie_goal']} ккал"
+        return text
+
+    return result.get("message") or "✅ Готово!"
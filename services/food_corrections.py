@@ -0,0 +1,239 @@
+"""
+Правки анализа фото еды без LLM
+- «без соуса», «убери хлеб» — удалить позицию
+- «порция 300г», «рис 150г», «половина», «в 2 раза больше» — пересчитать порцию
+- «плюс кофе с молоком», «ещё банан» — добавить позицию из справочника
+- Итоги пересчитываются по позициям; всё остальное — через correct_food_analysis (LLM)
+"""
+import copy
+import logging
+import re
+from typing import Optional
+
+from services import metrics
+from services.nutrition_db import normalize, nutrition_for, portion_unit, resolve_food
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_GRAMS = r"\s*(?:г|гр|грамм\w*|мл|ml|g)"
+
+_REMOVE_RE = re.compile(r"^(?:без|убери|убрать|удали|удалить|не было|нет)\s+(.+)$")
+_ADD_RE = re.compile(r"^(?:(?:плюс|еще|добавь|добавить|и еще)\s+|\+\s*)(.+)$")
+_MEAL_GRAMS_RE = re.compile(rf"^(?:порция|порции|вес|всего|было)?\s*{_NUMBER}{_GRAMS}$")
+_ITEM_GRAMS_RE = re.compile(rf"^(.+?)\s*[:\-]?\s*{_NUMBER}{_GRAMS}$")
+_TIMES_RE = re.compile(rf"^в\s+{_NUMBER}\s+раза?\s+(больше|меньше)$")
+_HALF = {"половина", "половину", "пол порции", "полпорции", "съел половину", "съела половину"}
+_DOUBLE = {"двойная порция", "две порции", "2 порции"}
+
+# Граммы в описании порции от AI: «200 г», «~150г», «1 шт (50 г)», «250 мл»
+_PORTION_GRAMS_RE = re.compile(rf"{_NUMBER}{_GRAMS}(?!\w)")
+_PORTION_ML_RE = re.compile(r"\d\s*(?:мл|ml)(?!\w)")
+_LIST_SPLIT_RE = re.compile(r"\s*(?:,|\bи\b)\s*")
+
+_NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+
+def _num(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+# ============================================================================
+# Позиции
+# ============================================================================
+
+def _stem(word: str) -> str:
+    return word[:max(3, len(word) - 2)]
+
+
+def _find_items(items: list[dict], query: str) -> list[int]:
+    """Индексы позиций, в названии которых есть все слова запроса (с точностью до окончания)"""
+    words = [_stem(w) for w in normalize(query).split() if len(w) >= 3]
+    if not words:
+        return []
+    found = []
+    for i, item in enumerate(items):
+        name_words = normalize(item.get("name", "")).split()
+        if all(any(n.startswith(w) for n in name_words) for w in words):
+            found.append(i)
+    return found
+
+
+# Слова-связки в названии блюда: «курица в соусе», «паста с соусом» — составное блюдо
+_LINK_WORDS = {"в", "во", "с", "со", "и", "под", "на", "из"}
+
+
+def _whole_item(item: dict, query: str) -> bool:
+    """
+    Запрос называет позицию целиком: всё название или её главное слово («хлеб» ~ «Хлеб белый»)
+
+    «соус» в «Курица в соусе терияки» — часть блюда: удалять всю позицию нельзя
+    """
+    name_words = normalize(item.get("name", "")).split()
+    words = [_stem(w) for w in normalize(query).split() if len(w) >= 3]
+    if not name_words or not words:
+        return False
+
+    significant = [n for n in name_words if len(n) >= 3]
+    if all(any(n.startswith(w) for w in words) for n in significant):
+        return True
+    return (
+        not _LINK_WORDS & set(name_words)
+        and name_words[0].startswith(words[0])
+    )
+
+
+def _item_grams(item: dict) -> Optional[float]:
+    m = _PORTION_GRAMS_RE.search((item.get("portion") or "").lower())
+    return _num(m.group(1)) if m else None
+
+
+def _scale_item(item: dict, factor: float) -> dict:
+    scaled = dict(item)
+    for key in _NUTRIENTS:
+        value = (item.get(key) or 0) * factor
+        scaled[key] = int(round(value)) if key == "calories" else round(value, 1)
+    grams = _item_grams(item)
+    if grams:
+        unit = "мл" if _PORTION_ML_RE.search((item.get("portion") or "").lower()) else "г"
+        scaled["portion"] = f"{round(grams * factor)} {unit}"
+    return scaled
+
+
+def _recompute(food_data: dict, items: list[dict]) -> dict:
+    """Новые позиции и итоги; клетчатка масштабируется по калориям"""
+    result = copy.deepcopy(food_data)
+    old_total = food_data.get("total", {})
+
+    total = {key: sum(item.get(key) or 0 for item in items) for key in _NUTRIENTS}
+    total["calories"] = int(round(total["calories"]))
+    for key in ("protein", "carbs", "fat"):
+        total[key] = round(total[key], 1)
+    if old_total.get("fiber"):
+        old_cal = old_total.get("calories") or 0
+        total["fiber"] = round(old_total["fiber"] * total["calories"] / old_cal, 1) if old_cal else old_total["fiber"]
+
+    result["items"] = items
+    result["total"] = {**old_total, **total}
+    return result
+
+
+def _describe(items: list[dict]) -> str:
+    return ", ".join(item.get("name", "?") for item in items).capitalize()
+
+
+# ============================================================================
+# Правки
+# ============================================================================
+
+def _remove(food_data: dict, items: list[dict], text: str) -> Optional[dict]:
+    m = _REMOVE_RE.match(text)
+    if not m:
+        return None
+
+    to_remove = set()
+    for part in _LIST_SPLIT_RE.split(m.group(1)):
+        found = _find_items(items, part)
+        # Не нашли, неоднозначно или это часть блюда («без соуса» у курицы в соусе) — пусть разбирается модель
+        if len(found) != 1 or not _whole_item(items[found[0]], part):
+            return None
+        to_remove.add(found[0])
+
+    left = [item for i, item in enumerate(items) if i not in to_remove]
+    if not left:
+        return None
+
+    result = _recompute(food_data, left)
+    result["description"] = _describe(left)
+    return result
+
+
+def _add(food_data: dict, items: list[dict], text: str) -> Optional[dict]:
+    m = _ADD_RE.match(text)
+    if not m:
+        return None
+
+    found = resolve_food(m.group(1))
+    if not found:
+        return None
+    entry, grams = found
+
+    portion = f"{round(grams)} {portion_unit(entry, m.group(1))}"
+    item = {"name": entry["name"], "portion": portion, **nutrition_for(entry, grams)}
+    result = _recompute(food_data, items + [item])
+    result["description"] = f"{food_data.get('description', 'Еда')} + {entry['name']}"
+    return result
+
+
+def _scale(food_data: dict, items: list[dict], text: str) -> Optional[dict]:
+    factor = None
+    target = None  # индекс позиции или None — вся порция
+
+    if text in _HALF:
+        factor = 0.5
+    elif text in _DOUBLE:
+        factor = 2.0
+    elif m := _TIMES_RE.match(text):
+        times = _num(m.group(1))
+        factor = times if m.group(2) == "больше" else 1 / times if times else None
+    elif m := _MEAL_GRAMS_RE.match(text):
+        grams = [_item_grams(item) for item in items]
+        if not all(grams):
+            return None
+        factor = _num(m.group(1)) / sum(grams)
+    elif m := _ITEM_GRAMS_RE.match(text):
+        found = _find_items(items, m.group(1))
+        if len(found) != 1:
+            return None
+        target = found[0]
+        grams = _item_grams(items[target])
+        if not grams:
+            return None
+        factor = _num(m.group(2)) / grams
+
+    if not factor or not 0.05 <= factor <= 10:
+        return None
+
+    scaled = [
+        _scale_item(item, factor) if target is None or i == target else item
+        for i, item in enumerate(items)
+    ]
+    return _recompute(food_data, scaled)
+
+
+_CORRECTIONS = [
+    ("remove", _remove),
+    ("add", _add),
+    ("scale", _scale),
+]
+
+
+def apply_correction(food_data: dict, correction_text: str) -> Optional[dict]:
+    """
+    Применить уточнение пользователя к анализу еды локально
+
+    Args:
+        food_data: Текущий анализ (с позициями items)
+        correction_text: Текст уточнения
+
+    Returns:
+        Новый анализ или None — уточнение свободное, нужен LLM
+    """
+    items = food_data.get("items") or []
+    text = " ".join(correction_text.lower().replace("ё", "е").split()).rstrip(".!")
+    if not items or not text:
+        metrics.inc("food_correction.llm")
+        return None
+
+    for kind, correct in _CORRECTIONS:
+        result = correct(food_data, items, text)
+        if result is not None:
+            metrics.inc(f"food_correction.local.{kind}")
+            logger.info(
+                f"[CORRECTION] '{text[:60]}' → {kind}: "
+                f"{food_data.get('total', {}).get('calories', 0)} → {result['total']['calories']} ккал"
+            )
+            return result
+
+    metrics.inc("food_correction.llm")
+    return None
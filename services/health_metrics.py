@@ -0,0 +1,198 @@
+"""
+Хранилище метрик здоровья (пульс, сон)
+- Сырые замеры в узкой таблице health_metric_samples
+- Дневные агрегаты min/avg/max в health_metric_daily для трендов
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from database.db import async_session, read_scope
+from database.models import HealthMetricSample, HealthMetricDaily
+
+logger = logging.getLogger(__name__)
+
+# Коды метрик (SmallInteger в БД). Новые метрики только добавлять, коды не менять!
+METRICS = {
+    "heart_rate": 1,   # уд/мин
+    "sleep_hours": 2,  # часы
+}
+METRIC_NAMES = {metric_id: name for name, metric_id in METRICS.items()}
+
+METRIC_UNITS = {
+    "heart_rate": "уд/мин",
+    "sleep_hours": "ч",
+}
+
+
+def _local_day(ts_utc: datetime, timezone: str) -> date:
+    """Локальная дата пользователя для UTC-времени замера"""
+    try:
+        tz = ZoneInfo(timezone or "Europe/Moscow")
+    except Exception:
+        tz = ZoneInfo("Europe/Moscow")
+    return ts_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz).date()
+
+
+async def record_samples(
+    user_id: int,
+    metric: str,
+    samples: list[tuple[datetime, float]],
+    timezone: str = "Europe/Moscow"
+) -> int:
+    """
+    Записать пачку замеров и обновить дневные агрегаты
+
+    Args:
+        user_id: ID пользователя
+        metric: Название метрики из METRICS
+        samples: Список (ts в UTC без tzinfo, значение)
+        timezone: Часовой пояс пользователя (для границ дня)
+
+    Returns:
+        Количество реально добавленных замеров (дубликаты по ts пропускаются)
+    """
+    metric_id = METRICS[metric]
+    if not samples:
+        return 0
+
+    async with async_session() as session:
+        # Дубликаты (повторная синхронизация с часов) игнорируем,
+        # RETURNING отдаёт только вставленные строки — агрегаты не задваиваются
+        result = await session.execute(
+            insert(HealthMetricSample)
+            .values([
+                {"user_id": user_id, "metric_id": metric_id, "ts": ts, "value": value}
+                for ts, value in samples
+            ])
+            .on_conflict_do_nothing(index_elements=["user_id", "metric_id", "ts"])
+            .returning(HealthMetricSample.ts, HealthMetricSample.value)
+        )
+        inserted = result.all()
+
+        # Группируем по локальным дням
+        per_day: dict[date, list[float]] = defaultdict(list)
+        for ts, value in inserted:
+            per_day[_local_day(ts, timezone)].append(value)
+
+        if per_day:
+            stmt = insert(HealthMetricDaily).values([
+                {
+                    "user_id": user_id,
+                    "metric_id": metric_id,
+                    "day": day,
+                    "min_value": min(values),
+                    "max_value": max(values),
+                    "sum_value": sum(values),
+                    "sample_count": len(values)
+                }
+                for day, values in per_day.items()
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "metric_id", "day"],
+                set_={
+                    "min_value": func.least(HealthMetricDaily.min_value, stmt.excluded.min_value),
+                    "max_value": func.greatest(HealthMetricDaily.max_value, stmt.excluded.max_value),
+                    "sum_value": HealthMetricDaily.sum_value + stmt.excluded.sum_value,
+                    "sample_count": HealthMetricDaily.sample_count + stmt.excluded.sample_count
+                }
+            )
+            await session.execute(stmt)
+
+        await session.commit()
+
+    logger.info(f"[METRICS] user={user_id} | {metric}: +{len(inserted)}/{len(samples)} samples")
+    return len(inserted)
+
+
+async def record_sample(
+    user_id: int,
+    metric: str,
+    value: float,
+    ts: Optional[datetime] = None,
+    timezone: str = "Europe/Moscow"
+) -> int:
+    """Записать один замер (по умолчанию — текущее время)"""
+    return await record_samples(user_id, metric, [(ts or datetime.utcnow(), value)], timezone)
+
+
+async def get_daily_rollups(
+    user_id: int,
+    metric: str,
+    days: int = 14,
+    timezone: str = "Europe/Moscow"
+) -> list[dict]:
+    """
+    Получить дневные агрегаты метрики за последние N локальных дней пользователя (включая сегодня)
+
+    Returns:
+        Список {"day": date, "min": float, "avg": float, "max": float, "count": int}
+        в хронологическом порядке
+    """
+    metric_id = METRICS[metric]
+    # Агрегаты лежат по локальным дням (см. record_samples) — границу считаем так же
+    since = _local_day(datetime.utcnow(), timezone) - timedelta(days=days - 1)
+
+    async with read_scope(user_id) as session:
+        result = await session.execute(
+            select(HealthMetricDaily)
+            .where(HealthMetricDaily.user_id == user_id)
+            .where(HealthMetricDaily.metric_id == metric_id)
+            .where(HealthMetricDaily.day >= since)
+            .order_by(HealthMetricDaily.day)
+        )
+        rows = result.scalars().all()
+
+    return [
+        {
+            "day": r.day,
+            "min": round(r.min_value, 1),
+            "avg": round(r.avg_value, 1),
+            "max": round(r.max_value, 1),
+            "count": r.sample_count
+        }
+        for r in rows
+    ]
+
+
+async def get_metric_trend(user_id: int, metric: str, days: int = 7, timezone: str = "Europe/Moscow") -> dict:
+    """
+    Тренд метрики за период по дневным агрегатам (без чтения сырых замеров)
+
+    Returns:
+        {"days": [...], "avg": float|None, "min": float|None, "max": float|None,
+         "change": float|None, "trend": str}
+    """
+    rollups = await get_daily_rollups(user_id, metric, days, timezone)
+
+    if not rollups:
+        return {"days": [], "avg": None, "min": None, "max": None, "change": None, "trend": "нет данных"}
+
+    total_sum = sum(r["avg"] * r["count"] for r in rollups)
+    total_count = sum(r["count"] for r in rollups)
+
+    # Сравниваем первую и вторую половину периода
+    change = None
+    trend = "недостаточно данных"
+    if len(rollups) >= 2:
+        half = len(rollups) // 2
+        first = sum(r["avg"] for r in rollups[:half]) / half
+        second = sum(r["avg"] for r in rollups[half:]) / (len(rollups) - half)
+        change = round(second - first, 1)
+        trend = "растёт" if change > 0 else "снижается" if change < 0 else "стабильно"
+
+    return {
+        "days": [
+            {"date": r["day"].strftime("%d.%m"), "min": r["min"], "avg": r["avg"], "max": r["max"]}
+            for r in rollups
+        ],
+        "avg": round(total_sum / total_count, 1) if total_count else None,
+        "min": min(r["min"] for r in rollups),
+        "max": max(r["max"] for r in rollups),
+        "change": change,
+        "trend": trend
+    }
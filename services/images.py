@@ -0,0 +1,88 @@
+"""
+Подготовка фото для vision-запросов
+- Уменьшение до IMAGE_MAX_SIDE по длинной стороне и пережатие в JPEG (меньше токенов и трафика)
+- Кэш результатов анализа по sha256 исходных байтов: то же фото повторно — без LLM
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# sha256 → (время записи, результат анализа)
+_analysis_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+def image_key(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+# ============================================================================
+# Уменьшение
+# ============================================================================
+
+def _downscale(image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    max_side = config.IMAGE_MAX_SIDE
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            if max(img.size) <= max_side and mime_type == "image/jpeg":
+                return image_bytes, mime_type
+
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            out = BytesIO()
+            img.save(out, "JPEG", quality=config.IMAGE_JPEG_QUALITY, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        # Не смогли разобрать — отправляем как есть, пусть решает модель
+        logger.warning(f"[IMAGES] Downscale failed: {e}")
+        return image_bytes, mime_type
+
+
+async def prepare_image(image_bytes: bytes, mime_type: str = "image/jpeg") -> tuple[bytes, str]:
+    """
+    Уменьшить фото перед отправкой в vision API (в потоке — Pillow блокирует)
+
+    Returns:
+        (байты, mime_type) — исходные, если фото уже достаточно маленькое
+    """
+    with metrics.timer("images.prepare"):
+        prepared, prepared_mime = await asyncio.to_thread(_downscale, image_bytes, mime_type)
+    if len(prepared) < len(image_bytes):
+        metrics.inc("images.bytes_saved", len(image_bytes) - len(prepared))
+    return prepared, prepared_mime
+
+
+# ============================================================================
+# Кэш анализов
+# ============================================================================
+
+def get_cached_analysis(key: str) -> Optional[dict]:
+    """Копия сохранённого анализа (вызывающий может менять её свободно) или None"""
+    cached = _analysis_cache.get(key)
+    if cached is None or time.monotonic() - cached[0] > config.IMAGE_CACHE_TTL:
+        metrics.inc("images.cache.miss")
+        return None
+    _analysis_cache.move_to_end(key)
+    metrics.inc("images.cache.hit")
+    return copy.deepcopy(cached[1])
+
+
+def cache_analysis(key: str, analysis: dict):
+    _analysis_cache[key] = (time.monotonic(), copy.deepcopy(analysis))
+    _analysis_cache.move_to_end(key)
+    while len(_analysis_cache) > config.IMAGE_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
@@ -0,0 +1,234 @@
+"""
+Планировщик LLM-запросов
+- Полосы с отдельными лимитами параллельности: chat (диалог), vision (фото),
+  background (планы питания, сводки) — поток фото не забивает чат
+- Внутри полосы очередь честная: пользователи обслуживаются по кругу,
+  альбом из 10 фото не задерживает одиночное фото соседа
+- Пользователь запроса и колбэк позиции в очереди задаются через llm_requester()
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+LANES = ("chat", "vision", "background")
+
+
+class _Requester:
+    """Кто ждёт ответа LLM: пользователь и колбэк позиции в очереди (общий на все его запросы)"""
+    __slots__ = ("user_id", "on_queue", "position", "notified_at")
+
+    def __init__(self, user_id: Optional[int], on_queue: Optional[Callable[[int], Awaitable[Any]]]):
+        self.user_id = user_id
+        self.on_queue = on_queue
+        # Последняя показанная позиция (0 — не в очереди)
+        self.position = 0
+        self.notified_at = 0.0
+
+
+# Запросы без пользователя (планировщик, фоновые задачи) — одна общая очередь
+_SYSTEM = _Requester(None, None)
+
+# Пользователь текущего запроса (наследуется задачами, созданными внутри)
+_requester: ContextVar[_Requester] = ContextVar("llm_requester", default=_SYSTEM)
+
+
+@contextmanager
+def llm_requester(user_id: Optional[int], on_queue: Optional[Callable[[int], Awaitable[Any]]] = None):
+    """
+    Привязать LLM-запросы внутри блока к пользователю
+
+    Args:
+        user_id: ID пользователя (для честной очереди)
+        on_queue: async-колбэк позиции в очереди; 0 — запрос пошёл в работу
+    """
+    token = _requester.set(_Requester(user_id, on_queue))
+    try:
+        yield
+    finally:
+        _requester.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "requester")
+
+    def __init__(self, requester: _Requester):
+        self.future = asyncio.get_running_loop().create_future()
+        self.requester = requester
+
+
+class Lane:
+    """Полоса: не больше limit запросов одновременно, остальные ждут по кругу пользователей"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        # Ключ пользователя → его ожидающие запросы; порядок ключей — очередь обхода
+        self._queues: OrderedDict[Any, deque[_Waiter]] = OrderedDict()
+        # Кому сейчас показана позиция в очереди
+        self._shown: dict[int, _Requester] = {}
+
+        metrics.set_gauge(f"llm.lane.{name}.active", lambda: self.active)
+        metrics.set_gauge(f"llm.lane.{name}.waiting", self.waiting)
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занять место в полосе (ждать своей очереди, если полоса заполнена)"""
+        requester = _requester.get()
+
+        if self.active < self.limit and not self._queues:
+            self.active += 1
+            metrics.inc(f"llm.lane.{self.name}.immediate")
+        else:
+            await self._wait(requester)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _wait(self, requester: _Requester):
+        waiter = _Waiter(requester)
+        key = requester.user_id if requester.user_id is not None else _SYSTEM
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._notify()
+
+        started = time.monotonic()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Место уже передали нам — отдаём следующему
+                self._release()
+            else:
+                self._remove(key, waiter)
+                self._notify()
+            raise
+
+        waited = time.monotonic() - started
+        metrics.observe(f"llm.lane.{self.name}.wait", waited)
+        if waited > 5:
+            logger.info(f"[LLM QUEUE] lane={self.name} user={requester.user_id} | Waited {waited:.1f}s")
+
+    def _remove(self, key: Any, waiter: _Waiter):
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[key]
+
+    def _next(self) -> Optional[_Waiter]:
+        """Следующий запрос по кругу: первый пользователь в очереди уходит в конец"""
+        while self._queues:
+            key, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[key] = queue
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    def _release(self):
+        waiter = self._next()
+        if waiter is not None:
+            # Место передаётся напрямую — active не меняется
+            waiter.future.set_result(None)
+        else:
+            self.active -= 1
+        self._notify()
+
+    # ========================================================================
+    # Позиция в очереди
+    # ========================================================================
+
+    def _order(self) -> list[_Waiter]:
+        """Ожидающие в порядке обслуживания (раунды по пользователям)"""
+        queues = [list(queue) for queue in self._queues.values()]
+        order = []
+        for i in range(max((len(q) for q in queues), default=0)):
+            order.extend(q[i] for q in queues if i < len(q))
+        return order
+
+    def _notify(self):
+        """Сообщить пользователям новую позицию (у альбома — лучшую из его фото)"""
+        positions: dict[int, tuple[_Requester, int]] = {}
+        for position, waiter in enumerate(self._order(), 1):
+            requester = waiter.requester
+            if requester.on_queue is not None and id(requester) not in positions:
+                positions[id(requester)] = (requester, position)
+
+        now = time.monotonic()
+        for key, (requester, position) in positions.items():
+            shown = position >= config.LLM_QUEUE_NOTICE_POSITION or key in self._shown
+            throttled = key in self._shown and now - requester.notified_at < config.LLM_QUEUE_NOTICE_INTERVAL
+            if shown and position != requester.position and not throttled:
+                self._shown[key] = requester
+                self._send(requester, position, now)
+
+        # Дождались места — вернуть обычный статус
+        for key in [key for key in self._shown if key not in positions]:
+            self._send(self._shown.pop(key), 0, now)
+
+    @staticmethod
+    def _send(requester: _Requester, position: int, now: float):
+        requester.position = position
+        requester.notified_at = now
+        task = asyncio.ensure_future(requester.on_queue(position))
+        task.add_done_callback(_log_notice_error)
+
+
+def _log_notice_error(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"[LLM QUEUE] Queue notice failed: {task.exception()}")
+
+
+_lanes: dict[str, Lane] = {}
+
+
+def get_lane(name: str) -> Lane:
+    """Полоса по имени (создаётся лениво с лимитом из config)"""
+    lane = _lanes.get(name)
+    if lane is None:
+        limits = {
+            "chat": config.LLM_LANE_CHAT,
+            "vision": config.LLM_LANE_VISION,
+            "background": config.LLM_LANE_BACKGROUND,
+        }
+        lane = _lanes[name] = Lane(name, limits[name])
+    return lane
+
+
+def queue_notice(message: Any, busy_text: str) -> Optional[Callable[[int], Awaitable[Any]]]:
+    """
+    Колбэк для llm_requester: правит сообщение-индикатор позицией в очереди
+
+    Args:
+        message: Отправленное сообщение «Анализирую...» (None — без индикатора)
+        busy_text: Текст индикатора, когда запрос пошёл в работу
+    """
+    if message is None:
+        return None
+
+    async def on_queue(position: int):
+        if position:
+            await message.edit_text(f"⏳ В очереди: {position}. Много запросов, скоро отвечу...")
+        else:
+            await message.edit_text(busy_text)
+
+    return on_queue
@@ -0,0 +1,248 @@
+"""
+Общий транспорт для LLM API
+- Один httpx.AsyncClient на процесс (keep-alive, без TLS-рукопожатия на каждый запрос)
+- Ограниченные повторы с экспоненциальной задержкой и jitter, учёт retry-after
+- Адаптивный лимит параллельных запросов (AIMD) на каждого провайдера:
+  успех → лимит растёт на 1 за «окно», 429/529 → лимит делится пополам
+- Тело запроса сериализуется один раз; картинки (Base64Blob) вклеиваются готовыми bytes
+"""
+import asyncio
+import base64
+import json
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+import httpx
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Коды, при которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+# Коды перегрузки — сигнал уменьшить параллельность
+THROTTLE_STATUSES = {429, 529}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class LLMError(Exception):
+    """Ошибка LLM API (не-200 ответ или сетевая ошибка)"""
+
+    def __init__(self, provider: str, status: Optional[int], message: str):
+        super().__init__(f"{provider} API Error {status}: {message[:500]}")
+        self.provider = provider
+        self.status = status
+
+
+# ============================================================================
+# Сериализация тела запроса
+# ============================================================================
+
+class Base64Blob:
+    """
+    Картинка в base64 как bytes — в payload вместо строки
+
+    Кодируется один раз; в тело запроса попадает без промежуточных str
+    (обычный путь — bytes → str → json str → bytes — держит четыре копии).
+    """
+    __slots__ = ("data", "prefix")
+
+    def __init__(self, raw: bytes = b"", prefix: str = "", data: bytes = None):
+        self.data = data if data is not None else base64.b64encode(raw)
+        self.prefix = prefix
+
+    def with_prefix(self, prefix: str) -> "Base64Blob":
+        """Тот же base64 с префиксом (data URL для OpenAI-совместимых API), без копии"""
+        return Base64Blob(prefix=prefix, data=self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def dumps_body(payload: dict) -> bytes:
+    """JSON тела запроса; Base64Blob вставляются как строки без перекодирования"""
+    blobs: list[Base64Blob] = []
+    # Метка уникальна на вызов — текст пользователя с ней не совпадёт
+    marker = f"@@blob{random.getrandbits(64):x}"
+
+    def placeholder(obj):
+        if isinstance(obj, Base64Blob):
+            blobs.append(obj)
+            return f"{marker}:{len(blobs) - 1}@@"
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=placeholder).encode("utf-8")
+    if not blobs:
+        return body
+
+    # Алфавит base64 не требует экранирования в JSON — склеиваем одним join
+    parts = re.split(rb'"' + marker.encode() + rb':(\d+)@@"', body)
+    chunks = [parts[0]]
+    for i in range(1, len(parts), 2):
+        blob = blobs[int(parts[i])]
+        chunks += [b'"', blob.prefix.encode("utf-8"), blob.data, b'"', parts[i + 1]]
+    return b"".join(chunks)
+
+
+# ============================================================================
+# HTTP-клиент
+# ============================================================================
+
+def get_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент (создаётся лениво)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=config.LLM_MAX_CONCURRENCY * 2, max_keepalive_connections=20)
+        )
+    return _client
+
+
+async def close_client():
+    """Закрыть HTTP-клиент (при завершении бота)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ============================================================================
+# AIMD limiter
+# ============================================================================
+
+class AdaptiveLimiter:
+    """Лимит одновременных запросов: additive increase / multiplicative decrease"""
+
+    def __init__(self, name: str, initial: int = None, min_limit: int = 1, max_limit: int = None):
+        self.name = name
+        self.max_limit = max_limit or config.LLM_MAX_CONCURRENCY
+        self.min_limit = min_limit
+        self.limit = float(initial or self.max_limit)
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._last_decrease = 0.0
+
+        metrics.set_gauge(f"llm.{name}.limit", lambda: round(self.limit, 2))
+        metrics.set_gauge(f"llm.{name}.in_flight", lambda: self.in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занять слот (ждём, если лимит исчерпан)"""
+        started = time.perf_counter()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        metrics.observe(f"llm.{self.name}.queue_wait", time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self):
+        # +1 к лимиту примерно за каждые `limit` успешных запросов
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        # Одна волна 429 — одно уменьшение, а не по разу на каждый запрос из волны
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        metrics.inc(f"llm.{self.name}.throttled")
+        logger.warning(f"[LLM] {self.name}: throttled, concurrency limit → {int(self.limit)}")
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(provider: str) -> AdaptiveLimiter:
+    if provider not in _limiters:
+        _limiters[provider] = AdaptiveLimiter(provider)
+    return _limiters[provider]
+
+
+# ============================================================================
+# Запрос с повторами
+# ============================================================================
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Значение retry-after в секундах (если сервер его прислал)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    """Экспоненциальная задержка с full jitter"""
+    cap = min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def post_json(provider: str, url: str, payload: dict, headers: dict, timeout: float) -> dict:
+    """
+    POST JSON с повторами и адаптивным лимитом
+
+    Args:
+        provider: Имя провайдера (для лимитера и метрик)
+        url: Адрес API
+        payload: Тело запроса
+        headers: Заголовки
+        timeout: Таймаут одной попытки
+
+    Returns:
+        Распарсенный JSON ответа
+
+    Raises:
+        LLMError: не-200 после всех попыток или неповторяемая ошибка
+    """
+    limiter = get_limiter(provider)
+    client = get_client()
+    # Один раз на все попытки
+    body = dumps_body(payload)
+
+    for attempt in range(config.LLM_MAX_RETRIES + 1):
+        delay = None
+        try:
+            async with limiter.slot():
+                response = await client.post(url, content=body, headers=headers, timeout=timeout)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            error = LLMError(provider, None, f"{type(e).__name__}: {e}")
+        else:
+            if response.status_code == 200:
+                limiter.on_success()
+                return response.json()
+
+            error = LLMError(provider, response.status_code, response.text)
+            if response.status_code not in RETRY_STATUSES:
+                raise error
+            if response.status_code in THROTTLE_STATUSES:
+                limiter.on_throttle()
+            delay = _retry_after(response)
+
+        if attempt == config.LLM_MAX_RETRIES:
+            raise error
+
+        if delay is None:
+            delay = _backoff(attempt)
+        elif delay > config.LLM_RETRY_MAX_DELAY:
+            # Ждать дольше бюджета бессмысленно — пусть сработает fallback
+            raise error
+
+        metrics.inc(f"llm.{provider}.retries")
+        logger.warning(f"[LLM] {provider}: {error} — retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    raise LLMError(provider, None, "retries exhausted")
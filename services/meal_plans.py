@@ -0,0 +1,177 @@
+"""
+Планы питания с кэшем по профилю
+- План зависит от сигнатуры профиля: полоса калорий, цель, ограничения, страна —
+  пользователи с одинаковой сигнатурой получают один и тот же план
+- Кэш с TTL; одновременные запросы одной сигнатуры ждут одну генерацию
+- Фоновая задача заранее генерирует планы сигнатур, которые часто запрашивают
+- Личные предпочтения делают план уникальным — такие планы не кэшируются
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+import config
+from services import metrics
+from services.ai import generate_meal_plan
+from services.nutrition_db import normalize
+
+logger = logging.getLogger(__name__)
+
+# (полоса калорий, цель, ограничения, страна)
+Signature = tuple[int, str, tuple[str, ...], str]
+
+# Сигнатура → (время генерации, план)
+_plans: OrderedDict[Signature, tuple[float, str]] = OrderedDict()
+# Генерации в процессе: одновременные запросы ждут одну
+_inflight: dict[Signature, asyncio.Future] = {}
+# Спрос на сигнатуры (для предгенерации; затухает вдвое после каждого прохода)
+_demand: Counter = Counter()
+
+
+def plan_signature(
+    calorie_goal: Optional[int],
+    goal: Optional[str] = None,
+    restrictions: Optional[list[str]] = None,
+    country: Optional[str] = None
+) -> Signature:
+    """Нормализованная сигнатура профиля для кэша планов"""
+    band = config.MEAL_PLAN_CALORIE_BAND
+    calories = round((calorie_goal or config.DEFAULT_CALORIE_GOAL) / band) * band
+    cleaned = tuple(sorted({normalize(r) for r in restrictions or [] if normalize(r)}))
+    return calories, goal or "health", cleaned, normalize(country or "")
+
+
+def _cached(signature: Signature) -> Optional[str]:
+    cached = _plans.get(signature)
+    if cached is None or time.monotonic() - cached[0] > config.MEAL_PLAN_CACHE_TTL:
+        return None
+    _plans.move_to_end(signature)
+    return cached[1]
+
+
+def _store(signature: Signature, plan: str):
+    _plans[signature] = (time.monotonic(), plan)
+    _plans.move_to_end(signature)
+    while len(_plans) > config.MEAL_PLAN_CACHE_SIZE:
+        _plans.popitem(last=False)
+
+
+async def _generate(signature: Signature) -> str:
+    """Сгенерировать план сигнатуры (одна генерация на сигнатуру одновременно)"""
+    future = _inflight.get(signature)
+    if future is not None:
+        metrics.inc("meal_plan.coalesced")
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[signature] = future
+    try:
+        calories, goal, restrictions, country = signature
+        plan = await generate_meal_plan(
+            calories,
+            restrictions=", ".join(restrictions) or None,
+            goal=goal,
+            country=country or None
+        )
+        _store(signature, plan)
+        future.set_result(plan)
+        return plan
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Ошибку уже получил вызывающий — ждущие получат её через future
+        future.exception()
+        raise
+    finally:
+        del _inflight[signature]
+
+
+async def get_meal_plan(
+    calorie_goal: Optional[int],
+    goal: Optional[str] = None,
+    restrictions: Optional[list[str]] = None,
+    country: Optional[str] = None,
+    preferences: Optional[list[str]] = None
+) -> tuple[str, int]:
+    """
+    План питания на день: из кэша по сигнатуре профиля или новый
+
+    Args:
+        calorie_goal: Цель по калориям
+        goal: lose/gain/maintain/health
+        restrictions: Ограничения из памяти пользователя
+        country: Страна пользователя
+        preferences: Предпочтения — если есть, план личный и не кэшируется
+
+    Returns:
+        (план, калорийность плана)
+    """
+    if preferences:
+        metrics.inc("meal_plan.personal")
+        calories = calorie_goal or config.DEFAULT_CALORIE_GOAL
+        plan = await generate_meal_plan(
+            calories,
+            preferences=", ".join(preferences),
+            restrictions=", ".join(restrictions or []) or None,
+            goal=goal,
+            country=country
+        )
+        return plan, calories
+
+    signature = plan_signature(calorie_goal, goal, restrictions, country)
+    _demand[signature] += 1
+
+    plan = _cached(signature)
+    if plan is not None:
+        metrics.inc("meal_plan.cache.hit")
+        return plan, signature[0]
+
+    metrics.inc("meal_plan.cache.miss")
+    return await _generate(signature), signature[0]
+
+
+# ============================================================================
+# Предгенерация
+# ============================================================================
+
+async def pregenerate_meal_plans():
+    """
+    Заранее сгенерировать планы востребованных сигнатур (фоновая полоса LLM)
+
+    Только сигнатуры, которые с прошлых проходов запросили хотя бы
+    MEAL_PLAN_PREGENERATE_MIN_DEMAND раз: без спроса на /plan LLM не вызывается.
+    Перегенерируются отсутствующие планы и планы старше половины TTL.
+    """
+    popular = [
+        signature
+        for signature, count in _demand.most_common(config.MEAL_PLAN_PREGENERATE_TOP)
+        if count >= config.MEAL_PLAN_PREGENERATE_MIN_DEMAND
+    ]
+
+    # Затухание: сигнатуры, которые перестали запрашивать, выпадают через пару проходов
+    for signature in list(_demand):
+        _demand[signature] //= 2
+        if not _demand[signature]:
+            del _demand[signature]
+
+    refresh_age = config.MEAL_PLAN_CACHE_TTL / 2
+    now = time.monotonic()
+    generated = 0
+
+    for signature in popular:
+        cached = _plans.get(signature)
+        if cached is not None and now - cached[0] < refresh_age:
+            continue
+        try:
+            await _generate(signature)
+            generated += 1
+        except Exception as e:
+            logger.warning(f"[MEAL PLANS] Pregeneration failed for {signature}: {e}")
+
+    if generated:
+        metrics.inc("meal_plan.pregenerated", generated)
+    logger.info(f"[MEAL PLANS] Pregenerated {generated} plans, {len(_plans)} cached")
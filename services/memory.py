@@ -8,7 +8,7 @@ from typing import Optional
 from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.db import async_session
+from database.db import session_scope
 from database.models import ConversationMessage, UserMemory
 
 
@@ -32,14 +32,14 @@ async def save_message(user_id: int, role: str, content: str) -> ConversationMes
     if not content or not content.strip():
         return None
 
-    async with async_session() as session:
+    async with session_scope() as session:
         message = ConversationMessage(
             user_id=user_id,
             role=role,
             content=content.strip()
         )
         session.add(message)
-        await session.commit()
+        await session.flush()
         await session.refresh(message)
         return message
 
@@ -58,7 +58,7 @@ async def get_recent_messages(
     Returns:
         Список словарей {"role": str, "content": str}
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(
             select(ConversationMessage)
             .where(ConversationMessage.user_id == user_id)
@@ -90,13 +90,12 @@ async def clear_old_messages(user_id: int, days: int = 7) -> int:
     """
     cutoff = datetime.utcnow() - timedelta(days=days)
 
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(
             delete(ConversationMessage)
             .where(ConversationMessage.user_id == user_id)
             .where(ConversationMessage.created_at < cutoff)
         )
-        await session.commit()
         return result.rowcount
 
 
@@ -116,7 +115,7 @@ async def save_memory(
     Returns:
         Созданная запись UserMemory
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         # Проверяем, нет ли уже такого факта
         existing = await session.execute(
             select(UserMemory)
@@ -134,7 +133,7 @@ async def save_memory(
             content=content
         )
         session.add(memory)
-        await session.commit()
+        await session.flush()
         await session.refresh(memory)
         return memory
 
@@ -153,7 +152,7 @@ async def get_memories(
     Returns:
         Список словарей {"category": str, "content": str}
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         query = select(UserMemory).where(UserMemory.user_id == user_id)
 
         if category:
@@ -219,13 +218,12 @@ async def delete_memory(user_id: int, content: str) -> bool:
     Returns:
         True если удалено, False если не найдено
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(
             delete(UserMemory)
             .where(UserMemory.user_id == user_id)
             .where(UserMemory.content == content)
         )
-        await session.commit()
         return result.rowcount > 0
 
 
@@ -245,7 +243,7 @@ async def update_memory(
     Returns:
         Обновлённая запись или None
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(
             select(UserMemory)
             .where(UserMemory.user_id == user_id)
@@ -256,7 +254,7 @@ async def update_memory(
         if memory:
             memory.content = new_content
             memory.updated_at = datetime.utcnow()
-            await session.commit()
+            await session.flush()
             await session.refresh(memory)
             return memory
 
@@ -0,0 +1,96 @@
+"""
+Внутренние метрики процесса
+- Счётчики, тайминги (скользящее окно для перцентилей), gauges
+- Периодически пишутся в лог планировщиком (log_snapshot)
+"""
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Union
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних значений хранить для перцентилей
+TIMING_WINDOW = 500
+
+_counters: dict[str, float] = defaultdict(float)
+_timings: dict[str, deque] = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+_gauges: dict[str, Union[float, Callable[[], float]]] = {}
+
+
+def inc(name: str, value: float = 1):
+    """Увеличить счётчик"""
+    _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """Записать значение (обычно длительность в секундах)"""
+    _timings[name].append(value)
+
+
+def set_gauge(name: str, value: Union[float, Callable[[], float]]):
+    """Установить gauge: число или функция, вычисляемая при снятии снимка"""
+    _gauges[name] = value
+
+
+@contextmanager
+def timer(name: str):
+    """Замерить длительность блока: with timer("llm.claude"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def get_counter(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def percentile(name: str, p: float) -> float:
+    """Перцентиль по скользящему окну (0 если данных нет)"""
+    values = sorted(_timings.get(name, ()))
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def snapshot() -> dict:
+    """Снимок всех метрик"""
+    gauges = {}
+    for name, value in _gauges.items():
+        try:
+            gauges[name] = value() if callable(value) else value
+        except Exception as e:
+            gauges[name] = f"error: {e}"
+
+    return {
+        "counters": dict(_counters),
+        "timings": {
+            name: {
+                "count": len(values),
+                "avg": round(sum(values) / len(values), 4) if values else 0,
+                "p50": round(percentile(name, 50), 4),
+                "p95": round(percentile(name, 95), 4),
+                "max": round(max(values), 4) if values else 0
+            }
+            for name, values in _timings.items()
+        },
+        "gauges": gauges
+    }
+
+
+async def log_snapshot():
+    """Записать снимок метрик в лог (задача планировщика)"""
+    snap = snapshot()
+    for name, value in sorted(snap["counters"].items()):
+        logger.info(f"[METRICS] counter {name}={value:g}")
+    for name, stats in sorted(snap["timings"].items()):
+        logger.info(
+            f"[METRICS] timing {name} n={stats['count']} avg={stats['avg']} "
+            f"p50={stats['p50']} p95={stats['p95']} max={stats['max']}"
+        )
+    for name, value in sorted(snap["gauges"].items()):
+        logger.info(f"[METRICS] gauge {name}={value}")
@@ -0,0 +1,378 @@
+"""
+Локальный справочник КБЖУ (data/nutrition.tsv)
+- Файл отображается в память (mmap), строки разбираются по требованию
+- Индекс для нечёткого поиска: триграммы + отсортированные ключи (bisect по префиксу)
+- Парсер порций: «200г», «0,5 кг», «300 мл», «2 шт» / «2 яйца»
+- Напитки (колонка liquid) описываются в мл
+"""
+import logging
+import mmap
+import re
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Порог уверенности для записи без LLM и для проверки оценок LLM
+MATCH_THRESHOLD = 0.75
+CHECK_THRESHOLD = 0.85
+
+_mm: Optional[mmap.mmap] = None
+_offsets: list[int] = []          # entry_id → смещение строки в файле
+_keys: list[str] = []             # нормализованные названия и синонимы
+_key_entry: list[int] = []        # key_id → entry_id
+_key_trigrams: list[int] = []     # key_id → число триграмм ключа
+_exact: dict[str, int] = {}       # ключ → entry_id
+_trigrams: dict[str, list[int]] = {}
+_sorted_keys: list[tuple[str, int]] = []
+
+
+# ============================================================================
+# Нормализация и индекс
+# ============================================================================
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё → е, только буквы/цифры/% и одиночные пробелы"""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w%\s-]", " ", text)
+    return " ".join(text.split())
+
+
+def _trigrams_of(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _add_key(key: str, entry_id: int):
+    key = normalize(key)
+    if not key or key in _exact:
+        return
+    key_id = len(_keys)
+    _keys.append(key)
+    _key_entry.append(entry_id)
+    _exact[key] = entry_id
+    trigrams = _trigrams_of(key)
+    _key_trigrams.append(len(trigrams))
+    for trigram in trigrams:
+        _trigrams.setdefault(trigram, []).append(key_id)
+
+
+def load_nutrition_db(path: str = None) -> int:
+    """
+    Загрузить справочник (вызывается при старте бота, повторный вызов — no-op)
+
+    Returns:
+        Количество продуктов
+    """
+    global _mm, _sorted_keys
+    if _mm is not None:
+        return len(_offsets)
+
+    path = path or config.NUTRITION_DB_PATH
+    try:
+        with open(path, "rb") as f:
+            _mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        logger.error(f"[NUTRITION] Failed to load {path}: {e}")
+        return 0
+
+    offset = 0
+    size = len(_mm)
+    while offset < size:
+        end = _mm.find(b"\n", offset)
+        if end == -1:
+            end = size
+        line = _mm[offset:end].decode("utf-8")
+        if line.strip() and not line.startswith("#"):
+            fields = line.split("\t")
+            entry_id = len(_offsets)
+            _offsets.append(offset)
+            _add_key(fields[0], entry_id)
+            for alias in fields[6].split(",") if len(fields) > 6 else []:
+                _add_key(alias, entry_id)
+        offset = end + 1
+
+    _sorted_keys = sorted((key, key_id) for key_id, key in enumerate(_keys))
+    logger.info(f"[NUTRITION] Loaded {len(_offsets)} foods, {len(_keys)} names")
+    return len(_offsets)
+
+
+@lru_cache(maxsize=512)
+def get_entry(entry_id: int) -> dict:
+    """Разобрать строку справочника (значения на 100 г)"""
+    offset = _offsets[entry_id]
+    end = _mm.find(b"\n", offset)
+    fields = _mm[offset:end if end != -1 else len(_mm)].decode("utf-8").split("\t")
+    return {
+        "name": fields[0],
+        "calories": float(fields[1]),
+        "protein": float(fields[2]),
+        "fat": float(fields[3]),
+        "carbs": float(fields[4]),
+        "piece_g": float(fields[5]) if len(fields) > 5 and fields[5] else 0.0,
+        "liquid": len(fields) > 7 and fields[7].strip() == "1"
+    }
+
+
+# ============================================================================
+# Поиск
+# ============================================================================
+
+def _same_stems(query: str, key: str) -> bool:
+    """Слова совпадают с точностью до окончания: «куриную грудку» ~ «куриная грудка»"""
+    q_words, k_words = query.split(), key.split()
+    if len(q_words) != len(k_words):
+        return False
+    for q, k in zip(q_words, k_words):
+        stem = max(3, min(len(q), len(k)) - 2)
+        if q[:stem] != k[:stem]:
+            return False
+    return True
+
+
+def lookup(query: str) -> Optional[tuple[dict, float]]:
+    """
+    Найти продукт по названию
+
+    Returns:
+        (запись справочника, уверенность 0..1) или None
+    """
+    load_nutrition_db()
+    q = normalize(query)
+    if not q or not _keys:
+        return None
+
+    if q in _exact:
+        return get_entry(_exact[q]), 1.0
+
+    # Кандидаты по общим триграммам
+    q_trigrams = _trigrams_of(q)
+    shared = Counter()
+    for trigram in q_trigrams:
+        for key_id in _trigrams.get(trigram, ()):
+            shared[key_id] += 1
+
+    scores = {
+        key_id: 2 * count / (len(q_trigrams) + _key_trigrams[key_id])
+        for key_id, count in shared.items()
+    }
+
+    # Кандидаты по префиксу (падежные окончания): bisect по основе первого слова
+    first = q.split()[0]
+    stem = first[:max(3, len(first) - 2)]
+    i = bisect_left(_sorted_keys, (stem,))
+    while i < len(_sorted_keys) and _sorted_keys[i][0].startswith(stem):
+        key, key_id = _sorted_keys[i]
+        if _same_stems(q, key):
+            scores[key_id] = max(scores.get(key_id, 0), 0.9)
+        i += 1
+
+    if not scores:
+        return None
+    best = max(scores, key=lambda k: (scores[k], -len(_keys[k])))
+    return get_entry(_key_entry[best]), round(scores[best], 3)
+
+
+# ============================================================================
+# Порции
+# ============================================================================
+
+_UNITS = {
+    "г": 1, "гр": 1, "грамм": 1, "грамма": 1, "граммов": 1, "g": 1,
+    "кг": 1000, "килограмм": 1000,
+    "мл": 1, "ml": 1, "л": 1000, "литр": 1000, "литра": 1000,
+    "шт": None, "штук": None, "штуки": None, "штука": None,
+}
+
+_PORTION_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*([a-zа-я]+)?\.?", re.IGNORECASE)
+
+
+def parse_portion(text: str) -> Optional[tuple[str, float, Optional[str]]]:
+    """
+    Выделить порцию из текста
+
+    Returns:
+        (текст без порции, количество, единица) — единица "g" (граммы/мл),
+        "pcs" (штуки) или None (число без единицы: «2 яйца», «гречка 250»);
+        None вместо кортежа, если в тексте нет ровно одного числа
+    """
+    matches = list(_PORTION_RE.finditer(text))
+    if len(matches) != 1:
+        return None
+
+    m = matches[0]
+    amount = float(m.group(1).replace(",", "."))
+    unit_word = (m.group(2) or "").lower()
+
+    if unit_word in _UNITS:
+        factor = _UNITS[unit_word]
+        rest = text[:m.start()] + " " + text[m.end():]
+        if factor is None:
+            return " ".join(rest.split()), amount, "pcs"
+        return " ".join(rest.split()), amount * factor, "g"
+
+    # «2 яйца» — число без единицы, слово после него — сам продукт
+    rest = text[:m.start(1)] + " " + text[m.end(1):]
+    return " ".join(rest.split()), amount, None
+
+
+def nutrition_for(entry: dict, grams: float) -> dict:
+    """КБЖУ для порции в граммах"""
+    k = grams / 100
+    return {
+        "calories": int(round(entry["calories"] * k)),
+        "protein": round(entry["protein"] * k, 1),
+        "fat": round(entry["fat"] * k, 1),
+        "carbs": round(entry["carbs"] * k, 1)
+    }
+
+
+_ML_TYPED_RE = re.compile(r"\d\s*(мл|ml|л\b|литр)")
+_GRAMS_TYPED_RE = re.compile(r"\d\s*(г|гр|грамм\w*|g|кг|килограмм)\b")
+
+
+def portion_unit(entry: dict, text: str) -> str:
+    """Единица порции для описания: как написал пользователь, иначе мл для напитков"""
+    if _ML_TYPED_RE.search(text):
+        return "мл"
+    if _GRAMS_TYPED_RE.search(text):
+        return "г"
+    return "мл" if entry["liquid"] else "г"
+
+
+def _portion_grams(entry: dict, amount: float, unit: Optional[str]) -> Optional[float]:
+    if unit == "g":
+        return amount
+    # Без единицы: маленькое число — штуки («2 яйца»), большое — граммы («гречка 250»)
+    if unit is None and (amount >= 20 or entry["piece_g"] <= 0):
+        return amount if amount >= 20 else None
+    if entry["piece_g"] > 0:
+        return amount * entry["piece_g"]
+    return None
+
+
+# ============================================================================
+# Сообщения пользователя и проверка оценок LLM
+# ============================================================================
+
+_EAT_PREFIX_RE = re.compile(
+    r"^(я\s+)?(съел|съела|съели|поел|поела|скушал|скушала|выпил|выпила|"
+    r"на завтрак|на обед|на ужин|на перекус)\s+"
+)
+_MEAL_TYPES = {"на завтрак": "breakfast", "на обед": "lunch", "на ужин": "dinner", "на перекус": "snack"}
+# Несколько продуктов, уточнения и вопросы — это работа для LLM
+_COMPLEX_RE = re.compile(r"[?+;]|(?<!\d),|,(?!\d)|\b(и|с|со|без|или|сколько|можно|ли|вчера)\b")
+
+
+def match_food_message(text: str) -> Optional[tuple[dict, float]]:
+    """
+    Распознать простое сообщение «продукт + порция» («съел овсянку 200г»)
+
+    Returns:
+        (данные для log_food, уверенность) или None, если сообщение не подходит
+    """
+    t = " ".join(text.lower().replace("ё", "е").split())
+    if len(t) > 60 or _COMPLEX_RE.search(t):
+        return None
+
+    meal_type = None
+    prefix = _EAT_PREFIX_RE.match(t)
+    if prefix:
+        meal_type = _MEAL_TYPES.get(prefix.group(2))
+        t = t[prefix.end():]
+
+    portion = parse_portion(t)
+    if not portion:
+        return None
+    food_text, amount, unit = portion
+
+    found = lookup(food_text)
+    if not found or found[1] < MATCH_THRESHOLD:
+        return None
+    entry, score = found
+
+    # Число без единицы и без «съел» — только целые штуки («банан 2»): «сахар 5.5» скорее
+    # глюкоза, а «чай 300» может быть чем угодно — такие сообщения разбирает LLM
+    pieces = amount.is_integer() and amount < 20 and entry["piece_g"] > 0
+    if unit is None and not prefix and not pieces:
+        return None
+
+    grams = _portion_grams(entry, amount, unit)
+    if not grams or grams > 3000:
+        return None
+
+    label = portion_unit(entry, t)
+    data = {
+        "description": f"{entry['name'].capitalize()}, {grams:g} {label}",
+        "meal_type": meal_type,
+        **nutrition_for(entry, grams)
+    }
+    logger.info(f"[NUTRITION] '{text[:60]}' → {entry['name']} {grams:g} {label} (score {score})")
+    return data, score
+
+
+def resolve_food(text: str) -> Optional[tuple[dict, float]]:
+    """
+    Продукт и вес порции по тексту: «сыр 30г», «банан 2 шт», «кофе с молоком»
+
+    Без числа берётся одна штука (piece_g), если она задана у продукта.
+
+    Returns:
+        (запись справочника, граммы) или None
+    """
+    t = " ".join(text.lower().replace("ё", "е").split())
+    portion = parse_portion(t)
+    food_text, amount, unit = portion if portion else (t, 1, "pcs")
+
+    found = lookup(food_text)
+    if not found or found[1] < MATCH_THRESHOLD:
+        return None
+    entry = found[0]
+
+    grams = _portion_grams(entry, amount, unit)
+    if not grams or grams > 3000:
+        return None
+    return entry, grams
+
+
+def check_estimate(data: dict) -> Optional[dict]:
+    """
+    Сверить оценку log_food со справочником
+
+    Returns:
+        КБЖУ по справочнику, если в описании явная порция, продукт найден уверенно
+        и калории LLM расходятся больше чем на NUTRITION_TOLERANCE; иначе None
+    """
+    description = data.get("description") or ""
+    if _COMPLEX_RE.search(description.lower()):
+        return None
+
+    portion = parse_portion(description.lower())
+    if not portion:
+        return None
+    food_text, amount, unit = portion
+
+    found = lookup(food_text)
+    if not found or found[1] < CHECK_THRESHOLD:
+        return None
+    entry = found[0]
+
+    grams = _portion_grams(entry, amount, unit)
+    if not grams:
+        return None
+
+    reference = nutrition_for(entry, grams)
+    estimated = data.get("calories") or 0
+    if reference["calories"] <= 0:
+        return None
+    deviation = abs(estimated - reference["calories"]) / reference["calories"]
+    if deviation <= config.NUTRITION_TOLERANCE:
+        return None
+
+    reference["name"] = entry["name"]
+    reference["grams"] = grams
+    return reference
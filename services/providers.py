@@ -0,0 +1,367 @@
+"""
+LLM-провайдеры с health tracking
+- Claude (основной) и Z.AI (fallback, OpenAI-совместимый API)
+- Circuit breaker на каждого провайдера: по доле ошибок и медленных ответов
+- Хеджированные запросы для чата: если основной долго молчит — параллельно спрашиваем запасной
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+import config
+from services import metrics
+from services.llm_transport import Base64Blob, post_json
+
+logger = logging.getLogger(__name__)
+
+CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+
+
+class NoProviderAvailable(Exception):
+    """Все провайдеры недоступны (не настроены или circuit breaker открыт)"""
+
+
+# ============================================================================
+# Circuit breaker
+# ============================================================================
+
+class CircuitBreaker:
+    """
+    closed    — запросы идут, считаем результаты в скользящем окне
+    open      — провайдер считается упавшим, запросы не отправляем cooldown секунд
+    half_open — пропускаем один пробный запрос: успех → closed, ошибка → open
+
+    «Плохой» результат — ошибка ИЛИ ответ медленнее slow_threshold секунд.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window: int = None,
+        min_requests: int = None,
+        failure_rate: float = None,
+        slow_threshold: float = None,
+        cooldown: float = None
+    ):
+        self.name = name
+        self.min_requests = min_requests or config.LLM_BREAKER_MIN_REQUESTS
+        self.failure_rate = failure_rate or config.LLM_BREAKER_FAILURE_RATE
+        self.slow_threshold = slow_threshold or config.LLM_BREAKER_SLOW_SECONDS
+        self.cooldown = cooldown or config.LLM_BREAKER_COOLDOWN
+        self._outcomes: deque = deque(maxlen=window or config.LLM_BREAKER_WINDOW)
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+        metrics.set_gauge(f"llm.{name}.breaker_open", lambda: int(self.state != self.CLOSED))
+
+    def available(self) -> bool:
+        """Пропустит ли breaker запрос сейчас (без побочных эффектов — для выбора кандидатов)"""
+        now = time.monotonic()
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now - self._opened_at >= self.cooldown
+        # half_open — один пробный запрос одновременно
+        # (если проба так и не вернулась за cooldown — разрешаем новую)
+        return not (self._probe_started and now - self._probe_started < self.cooldown)
+
+    def allow(self) -> bool:
+        """Занять право на запрос (вызывать непосредственно перед отправкой: в half_open это проба)"""
+        if not self.available():
+            return False
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+            logger.info(f"[BREAKER] {self.name}: half-open, sending probe")
+        self._probe_started = time.monotonic()
+        return True
+
+    def record(self, ok: bool, latency: float):
+        """Записать результат запроса"""
+        bad = (not ok) or latency > self.slow_threshold
+
+        if self.state == self.HALF_OPEN:
+            self._probe_started = 0.0
+            if bad:
+                self._trip()
+            else:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                logger.info(f"[BREAKER] {self.name}: closed (probe ok, {latency:.1f}s)")
+            return
+
+        self._outcomes.append(bad)
+        if self.state == self.CLOSED and len(self._outcomes) >= self.min_requests:
+            bad_rate = sum(self._outcomes) / len(self._outcomes)
+            if bad_rate >= self.failure_rate:
+                self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        metrics.inc(f"llm.{self.name}.breaker_trips")
+        logger.warning(f"[BREAKER] {self.name}: OPEN for {self.cooldown:.0f}s")
+
+
+# ============================================================================
+# Провайдеры (вход и выход — в формате Anthropic Messages API)
+# ============================================================================
+
+class LLMProvider:
+    name = "base"
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.name)
+
+    def configured(self) -> bool:
+        raise NotImplementedError
+
+    async def _request(self, payload: dict, timeout: float) -> dict:
+        raise NotImplementedError
+
+    async def complete(self, payload: dict, timeout: float) -> dict:
+        """Выполнить запрос с учётом health tracking"""
+        started = time.perf_counter()
+        try:
+            result = await self._request(payload, timeout)
+        except asyncio.CancelledError:
+            # Проигравший хедж — не ошибка провайдера
+            raise
+        except Exception:
+            latency = time.perf_counter() - started
+            self.breaker.record(False, latency)
+            metrics.inc(f"llm.{self.name}.errors")
+            raise
+
+        latency = time.perf_counter() - started
+        self.breaker.record(True, latency)
+        metrics.observe(f"llm.{self.name}.latency", latency)
+        metrics.inc(f"llm.{self.name}.requests")
+        return result
+
+
+class ClaudeProvider(LLMProvider):
+    name = "claude"
+
+    def configured(self) -> bool:
+        return bool(config.CLAUDE_API_KEY)
+
+    async def _request(self, payload: dict, timeout: float) -> dict:
+        headers = {
+            "x-api-key": config.CLAUDE_API_KEY,
+            "Content-Type": "application/json",
+            "anthropic-version": "2023-06-01"
+        }
+        return await post_json(self.name, CLAUDE_API_URL, payload, headers, timeout)
+
+
+class ZaiProvider(LLMProvider):
+    """Z.AI (GLM) — OpenAI-совместимый chat/completions, конвертируем форматы"""
+    name = "zai"
+
+    def configured(self) -> bool:
+        return bool(config.ZAI_API_KEY)
+
+    async def _request(self, payload: dict, timeout: float) -> dict:
+        headers = {
+            "Authorization": f"Bearer {config.ZAI_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        data = await post_json(self.name, config.ZAI_API_URL, to_openai_payload(payload), headers, timeout)
+        return from_openai_response(data)
+
+
+def to_openai_payload(payload: dict) -> dict:
+    """Anthropic Messages → OpenAI chat/completions"""
+    messages = []
+    if payload.get("system"):
+        messages.append({"role": "system", "content": payload["system"]})
+
+    for msg in payload.get("messages", []):
+        content = msg.get("content")
+        if isinstance(content, str):
+            messages.append({"role": msg["role"], "content": content})
+            continue
+
+        if msg["role"] == "assistant":
+            text = "".join(b.get("text", "") for b in content if b.get("type") == "text")
+            tool_calls = [
+                {
+                    "id": b["id"],
+                    "type": "function",
+                    "function": {"name": b["name"], "arguments": json.dumps(b.get("input", {}), ensure_ascii=False)}
+                }
+                for b in content if b.get("type") == "tool_use"
+            ]
+            converted = {"role": "assistant", "content": text or None}
+            if tool_calls:
+                converted["tool_calls"] = tool_calls
+            messages.append(converted)
+            continue
+
+        # user: текст/картинки одним сообщением, tool_result — отдельными сообщениями role=tool
+        parts = []
+        for block in content:
+            block_type = block.get("type")
+            if block_type == "text":
+                parts.append({"type": "text", "text": block.get("text", "")})
+            elif block_type == "image":
+                source = block["source"]
+                prefix = f"data:{source['media_type']};base64,"
+                data = source["data"]
+                url = data.with_prefix(prefix) if isinstance(data, Base64Blob) else prefix + data
+                parts.append({"type": "image_url", "image_url": {"url": url}})
+            elif block_type == "tool_result":
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": block["tool_use_id"],
+                    "content": block.get("content", "")
+                })
+        if parts:
+            messages.append({"role": "user", "content": parts})
+
+    result = {
+        "model": config.ZAI_MODEL,
+        "max_tokens": payload.get("max_tokens", 1500),
+        "messages": messages
+    }
+    if payload.get("tools"):
+        result["tools"] = [
+            {
+                "type": "function",
+                "function": {
+                    "name": tool["name"],
+                    "description": tool.get("description", ""),
+                    "parameters": tool.get("input_schema", {"type": "object", "properties": {}})
+                }
+            }
+            for tool in payload["tools"]
+        ]
+    return result
+
+
+def from_openai_response(data: dict) -> dict:
+    """OpenAI chat/completions → Anthropic Messages (content blocks + stop_reason)"""
+    choice = (data.get("choices") or [{}])[0]
+    message = choice.get("message") or {}
+
+    content = []
+    if message.get("content"):
+        content.append({"type": "text", "text": message["content"]})
+
+    for call in message.get("tool_calls") or []:
+        function = call.get("function", {})
+        try:
+            tool_input = json.loads(function.get("arguments") or "{}")
+        except json.JSONDecodeError:
+            tool_input = {}
+        content.append({
+            "type": "tool_use",
+            "id": call.get("id"),
+            "name": function.get("name"),
+            "input": tool_input
+        })
+
+    has_tools = any(block["type"] == "tool_use" for block in content)
+    return {
+        "content": content or [{"type": "text", "text": ""}],
+        "stop_reason": "tool_use" if has_tools else "end_turn"
+    }
+
+
+# ============================================================================
+# Маршрутизация
+# ============================================================================
+
+PROVIDERS: list[LLMProvider] = [ClaudeProvider(), ZaiProvider()]
+
+
+def _candidates() -> list[LLMProvider]:
+    """
+    Настроенные провайдеры в порядке приоритета, чей breaker пропускает запрос
+
+    Только проверка: пробу half_open занимает breaker.allow() перед самой отправкой,
+    иначе запасной провайдер, до которого дело не дошло, блокировал бы свою пробу на cooldown
+    """
+    return [p for p in PROVIDERS if p.configured() and p.breaker.available()]
+
+
+async def complete(payload: dict, timeout: float = 60.0, hedge: bool = False) -> dict:
+    """
+    Выполнить запрос к LLM с автоматическим fallback
+
+    Args:
+        payload: Запрос в формате Anthropic Messages API
+        timeout: Таймаут одного запроса
+        hedge: Хеджировать (для чата): через LLM_HEDGE_DELAY без ответа
+               параллельно запускаем запасного провайдера, берём первый успешный
+
+    Returns:
+        Ответ в формате Anthropic Messages API
+    """
+    candidates = _candidates()
+    if not candidates:
+        metrics.inc("llm.no_provider")
+        raise NoProviderAvailable("Все LLM-провайдеры недоступны")
+
+    if hedge and len(candidates) > 1 and candidates[0].breaker.allow():
+        return await _hedged(candidates[0], candidates[1], payload, timeout)
+
+    last_error = None
+    for provider in candidates:
+        # Пробу half_open мог уже занять параллельный запрос
+        if not provider.breaker.allow():
+            continue
+        if last_error is not None:
+            metrics.inc("llm.fallback")
+            logger.warning(f"[LLM] Falling back to {provider.name}: {last_error}")
+        try:
+            return await provider.complete(payload, timeout)
+        except Exception as e:
+            last_error = e
+
+    if last_error is None:
+        metrics.inc("llm.no_provider")
+        raise NoProviderAvailable("Все LLM-провайдеры недоступны")
+    raise last_error
+
+
+async def _hedged(primary: LLMProvider, secondary: LLMProvider, payload: dict, timeout: float) -> dict:
+    """
+    Хеджированный запрос: первый успешный ответ побеждает, остальные отменяются
+
+    Право на запрос к primary уже занято (breaker.allow()), к secondary — занимается перед хеджем
+    """
+    tasks = {asyncio.create_task(primary.complete(payload, timeout)): primary}
+
+    done, _ = await asyncio.wait(tasks, timeout=config.LLM_HEDGE_DELAY)
+    if (not done or next(iter(done)).exception() is not None) and secondary.breaker.allow():
+        # Основной молчит или уже упал — подключаем запасного
+        metrics.inc("llm.hedge.fired")
+        logger.info(f"[LLM] Hedging request to {secondary.name}")
+        tasks[asyncio.create_task(secondary.complete(payload, timeout))] = secondary
+
+    pending = set(tasks)
+    last_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.inc(f"llm.hedge.won.{tasks[task].name}")
+                    return task.result()
+                last_error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise last_error
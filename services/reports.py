@@ -0,0 +1,373 @@
+"""
+Недельные отчёты
+- Пакетный расчёт для всех пользователей агрегирующими запросами (GROUP BY)
+- Хранение в weekly_reports, /week читает готовый отчёт
+- Рассылка через RateLimitedSender
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+from aiogram import Bot
+from sqlalchemy import select, func, update, Date
+from sqlalchemy.dialects.postgresql import insert
+
+import config
+from database.db import async_session, read_session
+from database.models import User, FoodEntry, WaterEntry, WeightEntry, ActivityEntry, WeeklyReport
+from services.sender import RateLimitedSender
+
+logger = logging.getLogger(__name__)
+
+# Рассылка отчёта: понедельник, 10:00 по местному времени
+REPORT_WEEKDAY = 0
+REPORT_HOUR = 10
+
+# Коридор «день по плану» относительно цели калорий
+ADHERENCE_MIN = 0.8
+ADHERENCE_MAX = 1.1
+
+
+# ============================================================================
+# SQL-выражения для локальных дат
+# ============================================================================
+
+_user_tz = func.coalesce(User.timezone, "Europe/Moscow")
+# Сегодняшняя дата в часовом поясе пользователя
+_local_today = func.date(func.timezone(_user_tz, func.now()), type_=Date)
+
+
+def _local_day(ts_column):
+    """Локальная дата записи: created_at хранится как UTC без tzinfo"""
+    return func.date(func.timezone(_user_tz, func.timezone("UTC", ts_column)), type_=Date)
+
+
+def _in_period(day_expr):
+    """7 полных локальных дней, заканчивая вчерашним"""
+    return (day_expr >= _local_today - 7) & (day_expr < _local_today)
+
+
+# ============================================================================
+# Расчёт
+# ============================================================================
+
+async def _build_batch(session, user_ids: list[int]) -> list[dict]:
+    """Посчитать отчёты для пачки пользователей (несколько GROUP BY запросов на всю пачку)"""
+    # Грубый фильтр по UTC для индекса; точные границы — по локальной дате
+    since_utc = datetime.utcnow() - timedelta(days=9)
+
+    users_result = await session.execute(
+        select(User.id, User.calorie_goal, _local_today.label("today"))
+        .where(User.id.in_(user_ids))
+    )
+    users = {row.id: row for row in users_result.all()}
+
+    food_day = _local_day(FoodEntry.created_at)
+    food_result = await session.execute(
+        select(
+            FoodEntry.user_id,
+            food_day.label("day"),
+            func.sum(FoodEntry.calories),
+            func.sum(FoodEntry.protein)
+        )
+        .join(User, User.id == FoodEntry.user_id)
+        .where(FoodEntry.user_id.in_(user_ids))
+        .where(FoodEntry.created_at >= since_utc)
+        .where(_in_period(food_day))
+        .group_by(FoodEntry.user_id, food_day)
+    )
+    food_days: dict[int, dict[date, tuple[int, float]]] = defaultdict(dict)
+    for user_id, day, calories, protein in food_result.all():
+        food_days[user_id][day] = (int(calories or 0), float(protein or 0))
+
+    water_day = _local_day(WaterEntry.created_at)
+    water_result = await session.execute(
+        select(WaterEntry.user_id, water_day.label("day"), func.sum(WaterEntry.amount))
+        .join(User, User.id == WaterEntry.user_id)
+        .where(WaterEntry.user_id.in_(user_ids))
+        .where(WaterEntry.created_at >= since_utc)
+        .where(_in_period(water_day))
+        .group_by(WaterEntry.user_id, water_day)
+    )
+    water_days: dict[int, list[int]] = defaultdict(list)
+    for user_id, _, amount in water_result.all():
+        water_days[user_id].append(int(amount or 0))
+
+    activity_day = _local_day(ActivityEntry.created_at)
+    activity_result = await session.execute(
+        select(ActivityEntry.user_id, func.sum(ActivityEntry.calories_burned))
+        .join(User, User.id == ActivityEntry.user_id)
+        .where(ActivityEntry.user_id.in_(user_ids))
+        .where(ActivityEntry.created_at >= since_utc)
+        .where(_in_period(activity_day))
+        .group_by(ActivityEntry.user_id)
+    )
+    activity_totals = {user_id: int(total or 0) for user_id, total in activity_result.all()}
+
+    weight_day = _local_day(WeightEntry.created_at)
+    weight_result = await session.execute(
+        select(WeightEntry.user_id, WeightEntry.weight)
+        .join(User, User.id == WeightEntry.user_id)
+        .where(WeightEntry.user_id.in_(user_ids))
+        .where(WeightEntry.created_at >= since_utc)
+        .where(_in_period(weight_day))
+        .order_by(WeightEntry.user_id, WeightEntry.created_at)
+    )
+    weights: dict[int, list[float]] = defaultdict(list)
+    for user_id, weight in weight_result.all():
+        weights[user_id].append(weight)
+
+    reports = []
+    for user_id, user in users.items():
+        days = food_days.get(user_id, {})
+        water = water_days.get(user_id, [])
+        user_weights = weights.get(user_id, [])
+
+        # Пустую неделю не сохраняем
+        if not days and not water and not user_weights and not activity_totals.get(user_id):
+            continue
+
+        goal = user.calorie_goal or config.DEFAULT_CALORIE_GOAL
+        logged = {day: v for day, v in days.items() if v[0] > 0}
+
+        report = {
+            "user_id": user_id,
+            "period_start": user.today - timedelta(days=7),
+            "period_end": user.today - timedelta(days=1),
+            "days_logged": len(logged),
+            "avg_calories": int(sum(v[0] for v in logged.values()) / len(logged)) if logged else 0,
+            "avg_protein": round(sum(v[1] for v in logged.values()) / len(logged), 1) if logged else 0,
+            "avg_water": int(sum(water) / len(water)) if water else 0,
+            "total_activity": activity_totals.get(user_id, 0),
+            "adherence_pct": int(
+                sum(1 for v in logged.values() if ADHERENCE_MIN * goal <= v[0] <= ADHERENCE_MAX * goal) / 7 * 100
+            ),
+            "weight_start": user_weights[0] if user_weights else None,
+            "weight_end": user_weights[-1] if user_weights else None,
+            "weight_delta": round(user_weights[-1] - user_weights[0], 1) if len(user_weights) >= 2 else None,
+            "best_day": None,
+            "best_day_calories": None,
+            "worst_day": None,
+            "worst_day_calories": None,
+            "calorie_goal": goal,
+            "created_at": datetime.utcnow()
+        }
+
+        if logged:
+            # Лучший день — ближе всего к цели, худший — дальше всего
+            best = min(logged, key=lambda d: abs(logged[d][0] - goal))
+            worst = max(logged, key=lambda d: abs(logged[d][0] - goal))
+            report.update({
+                "best_day": best,
+                "best_day_calories": logged[best][0],
+                "worst_day": worst,
+                "worst_day_calories": logged[worst][0]
+            })
+
+        reports.append(report)
+
+    return reports
+
+
+async def _store_reports(session, reports: list[dict]):
+    """Upsert отчётов одной командой (delivered_at не трогаем)"""
+    if not reports:
+        return
+    stmt = insert(WeeklyReport).values(reports)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_weekly_reports_user_period",
+        set_={
+            column: stmt.excluded[column]
+            for column in reports[0]
+            if column not in ("user_id", "period_start")
+        }
+    )
+    await session.execute(stmt)
+
+
+async def build_weekly_reports(user_ids: Optional[list[int]] = None) -> int:
+    """
+    Пересчитать недельные отчёты
+
+    Args:
+        user_ids: Только эти пользователи (по умолчанию — все, пачками по REPORT_BATCH_SIZE)
+
+    Returns:
+        Количество сохранённых отчётов
+    """
+    stored = 0
+    started = datetime.utcnow()
+
+    # Агрегаты читаем с реплики (если настроена), отчёты пишем в основную БД
+    async with read_session() as reader, async_session() as session:
+        if user_ids is not None:
+            batches = [user_ids[i:i + config.REPORT_BATCH_SIZE]
+                       for i in range(0, len(user_ids), config.REPORT_BATCH_SIZE)]
+            for batch in batches:
+                reports = await _build_batch(reader, batch)
+                await _store_reports(session, reports)
+                stored += len(reports)
+            await session.commit()
+        else:
+            # Keyset-пагинация по id — без OFFSET
+            last_id = 0
+            while True:
+                ids_result = await reader.execute(
+                    select(User.id)
+                    .where(User.id > last_id)
+                    .order_by(User.id)
+                    .limit(config.REPORT_BATCH_SIZE)
+                )
+                batch = list(ids_result.scalars().all())
+                if not batch:
+                    break
+                last_id = batch[-1]
+
+                reports = await _build_batch(reader, batch)
+                await _store_reports(session, reports)
+                await session.commit()
+                # Не держим снапшот реплики открытым на весь проход
+                await reader.rollback()
+                stored += len(reports)
+
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(f"[REPORTS] Built {stored} weekly reports in {elapsed:.1f}s")
+    return stored
+
+
+async def get_latest_report(user_id: int) -> Optional[WeeklyReport]:
+    """Последний сохранённый отчёт пользователя"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(WeeklyReport)
+            .where(WeeklyReport.user_id == user_id)
+            .order_by(WeeklyReport.period_start.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+
+# user_id → period_end пустой недели: повторный /week в тот же день не пересчитывает её
+# (пустые отчёты не храним — их бы разослали по понедельникам)
+_empty_weeks: dict[int, date] = {}
+
+
+async def get_or_build_report(user_id: int, timezone: str = "Europe/Moscow") -> Optional[WeeklyReport]:
+    """
+    Готовый отчёт за последние 7 полных дней; если его нет или он устарел —
+    считаем только для этого пользователя тем же пайплайном.
+    None — за эти 7 дней записей нет (старый отчёт не показываем)
+    """
+    try:
+        tz = ZoneInfo(timezone or "Europe/Moscow")
+    except Exception:
+        tz = ZoneInfo("Europe/Moscow")
+    yesterday = datetime.now(tz).date() - timedelta(days=1)
+
+    report = await get_latest_report(user_id)
+    if report and report.period_end >= yesterday:
+        return report
+    if _empty_weeks.get(user_id) == yesterday:
+        return None
+
+    await build_weekly_reports(user_ids=[user_id])
+    report = await get_latest_report(user_id)
+    if report and report.period_end >= yesterday:
+        return report
+
+    if len(_empty_weeks) > 10000:
+        for uid in [uid for uid, day in _empty_weeks.items() if day < yesterday]:
+            del _empty_weeks[uid]
+    _empty_weeks[user_id] = yesterday
+    return None
+
+
+# ============================================================================
+# Форматирование и рассылка
+# ============================================================================
+
+def format_weekly_report(report: WeeklyReport, water_goal: int = 2000) -> str:
+    """Текст недельного отчёта"""
+    period = f"{report.period_start.strftime('%d.%m')}–{report.period_end.strftime('%d.%m')}"
+
+    response = (
+        f"📊 **Статистика за неделю** ({period})\n\n"
+        f"🔥 В среднем: {report.avg_calories} / {report.calorie_goal} ккал/день\n"
+        f"🥩 Белок: {report.avg_protein:.0f} г/день\n"
+        f"💧 Вода: {report.avg_water} / {water_goal} мл/день\n"
+        f"🏃 Сожжено: {report.total_activity} ккал\n\n"
+        f"📅 Дней с записями: {report.days_logged} из 7\n"
+        f"🎯 Дней в цели: {report.adherence_pct}%\n"
+    )
+
+    if report.best_day:
+        response += (
+            f"\n✅ Лучший день: {report.best_day.strftime('%d.%m')} "
+            f"({report.best_day_calories} ккал)"
+        )
+    if report.worst_day and report.worst_day != report.best_day:
+        response += (
+            f"\n⚠️ Сложный день: {report.worst_day.strftime('%d.%m')} "
+            f"({report.worst_day_calories} ккал)"
+        )
+
+    if report.weight_delta is not None:
+        if report.weight_delta > 0:
+            response += f"\n\n⚖️ Вес: +{report.weight_delta:.1f} кг за неделю"
+        elif report.weight_delta < 0:
+            response += f"\n\n⚖️ Вес: {report.weight_delta:.1f} кг за неделю"
+        else:
+            response += "\n\n⚖️ Вес не изменился"
+
+    return response
+
+
+def _is_delivery_time(timezone: str) -> bool:
+    try:
+        tz = ZoneInfo(timezone or "Europe/Moscow")
+    except Exception:
+        tz = ZoneInfo("Europe/Moscow")
+    now_local = datetime.now(tz)
+    return now_local.weekday() == REPORT_WEEKDAY and now_local.hour == REPORT_HOUR
+
+
+async def deliver_weekly_reports(bot: Bot):
+    """Разослать отчёты пользователям, у которых сейчас понедельник 10:00 (запуск каждый час)"""
+    async with async_session() as session:
+        result = await session.execute(select(User.id, User.timezone))
+        due_ids = [user_id for user_id, timezone in result.all() if _is_delivery_time(timezone)]
+
+    if not due_ids:
+        return
+
+    # Досчитываем свежие отчёты только для тех, кому сейчас отправляем
+    await build_weekly_reports(user_ids=due_ids)
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(WeeklyReport, User.water_goal)
+            .join(User, User.id == WeeklyReport.user_id)
+            .where(WeeklyReport.user_id.in_(due_ids))
+            .where(WeeklyReport.delivered_at.is_(None))
+            .where(WeeklyReport.period_end >= date.today() - timedelta(days=2))
+        )
+        pending = result.all()
+
+    sender = RateLimitedSender(bot)
+    delivered_ids = []
+    for report, water_goal in pending:
+        text = format_weekly_report(report, water_goal) + "\n\nХорошей новой недели! 💪"
+        if await sender.send(report.user_id, text, parse_mode="Markdown"):
+            delivered_ids.append(report.id)
+
+    if delivered_ids:
+        async with async_session() as session:
+            await session.execute(
+                update(WeeklyReport)
+                .where(WeeklyReport.id.in_(delivered_ids))
+                .values(delivered_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    logger.info(f"[REPORTS] Delivered {sender.sent}, failed {sender.failed}")
@@ -0,0 +1,51 @@
+"""
+Политика ответа после выполнения инструментов
+- Для «чистых» записей (вода, вес...) хватает шаблонного подтверждения — второй запрос к LLM не нужен
+- Набор таких инструментов настраивается через TEMPLATE_ONLY_TOOLS
+- Решения считаются в метриках
+"""
+import logging
+
+import config
+from services import metrics
+from services.fast_path import render_reply
+
+logger = logging.getLogger(__name__)
+
+
+def needs_followup(tool_calls: list[dict], exec_results: list[dict]) -> bool:
+    """
+    Нужен ли второй запрос к LLM за финальным текстом
+
+    Args:
+        tool_calls: Вызовы инструментов [{"name", "input", "id"}]
+        exec_results: Результаты execute_tool в том же порядке
+
+    Returns:
+        False — достаточно шаблона, True — нужен комментарий коуча
+    """
+    names = {tool["name"] for tool in tool_calls}
+    extra = names - config.TEMPLATE_ONLY_TOOLS
+    failed = [r for r in exec_results if not r.get("success")]
+
+    if extra:
+        reason = "tools"
+    elif failed:
+        # Ошибку лучше объяснит модель
+        reason = "failed"
+    else:
+        metrics.inc("response_policy.template")
+        logger.info(f"[POLICY] Template reply for {sorted(names)}")
+        return False
+
+    metrics.inc("response_policy.followup")
+    metrics.inc(f"response_policy.followup.{reason}")
+    return True
+
+
+def render_template(response_text: str, tool_calls: list[dict], exec_results: list[dict]) -> str:
+    """Шаблонный ответ: текст модели из первого ответа + подтверждение по каждому инструменту"""
+    parts = [response_text.strip()] if response_text and response_text.strip() else []
+    for tool, result in zip(tool_calls, exec_results):
+        parts.append(render_reply(tool["name"], tool["input"], result))
+    return "\n\n".join(parts) or "✅ Готово!"
@@ -6,8 +6,12 @@ from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select, func
 
-from database.db import async_session
+from database.db import async_session, read_session, recently_written
 from database.models import User, WaterEntry, FoodEntry
+from database.partitions import maintain_partitions
+from services.reports import build_weekly_reports, deliver_weekly_reports
+from services.meal_plans import pregenerate_meal_plans
+from services.metrics import log_snapshot
 
 
 def get_user_local_hour(user: User) -> int:
@@ -39,7 +43,7 @@ async def send_water_reminder(bot: Bot):
     # Часы для напоминаний о воде (по местному времени пользователя)
     water_hours = {9, 11, 13, 15, 17, 19, 21}
 
-    async with async_session() as session:
+    async with read_session() as session, async_session() as primary:
         result = await session.execute(
             select(User).where(User.remind_water == True)
         )
@@ -51,6 +55,9 @@ async def send_water_reminder(bot: Bot):
             if local_hour not in water_hours:
                 continue
 
+            # Только что писал — реплика может отставать, читаем с primary
+            db = primary if recently_written(user.id) else session
+
             # Получаем начало дня в часовом поясе пользователя
             try:
                 tz = ZoneInfo(user.timezone or "Europe/Moscow")
@@ -61,7 +68,7 @@ async def send_water_reminder(bot: Bot):
             day_start_utc = day_start_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
 
             # Проверяем, сколько воды выпито сегодня
-            water_result = await session.execute(
+            water_result = await db.execute(
                 select(func.sum(WaterEntry.amount))
                 .where(WaterEntry.user_id == user.id)
                 .where(WaterEntry.created_at >= day_start_utc)
@@ -90,7 +97,7 @@ async def send_food_reminder(bot: Bot):
     # Часы для напоминаний о еде (по местному времени)
     food_hours = {8, 13, 19}
 
-    async with async_session() as session:
+    async with read_session() as session, async_session() as primary:
         result = await session.execute(
             select(User).where(User.remind_food == True)
         )
@@ -101,6 +108,9 @@ async def send_food_reminder(bot: Bot):
             if local_hour not in food_hours:
                 continue
 
+            # Только что писал — реплика может отставать, читаем с primary
+            db = primary if recently_written(user.id) else session
+
             # Получаем начало дня в часовом поясе пользователя
             try:
                 tz = ZoneInfo(user.timezone or "Europe/Moscow")
@@ -111,7 +121,7 @@ async def send_food_reminder(bot: Bot):
             day_start_utc = day_start_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
 
             # Проверяем, сколько калорий съедено сегодня
-            food_result = await session.execute(
+            food_result = await db.execute(
                 select(func.sum(FoodEntry.calories))
                 .where(FoodEntry.user_id == user.id)
                 .where(FoodEntry.created_at >= day_start_utc)
@@ -194,7 +204,7 @@ async def send_sleep_reminder(bot: Bot):
 
 async def send_daily_summary(bot: Bot):
     """Отправить вечернюю сводку"""
-    async with async_session() as session:
+    async with read_session() as session, async_session() as primary:
         result = await session.execute(select(User))
         users = result.scalars().all()
 
@@ -203,6 +213,9 @@ async def send_daily_summary(bot: Bot):
             if get_user_local_hour(user) != 21:
                 continue
 
+            # Только что писал — реплика может отставать, читаем с primary
+            db = primary if recently_written(user.id) else session
+
             # Получаем начало дня в часовом поясе пользователя
             try:
                 tz = ZoneInfo(user.timezone or "Europe/Moscow")
@@ -213,7 +226,7 @@ async def send_daily_summary(bot: Bot):
             day_start_utc = day_start_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
 
             # Калории
-            food_result = await session.execute(
+            food_result = await db.execute(
                 select(func.sum(FoodEntry.calories))
                 .where(FoodEntry.user_id == user.id)
                 .where(FoodEntry.created_at >= day_start_utc)
@@ -221,7 +234,7 @@ async def send_daily_summary(bot: Bot):
             total_calories = food_result.scalar_one() or 0
 
             # Вода
-            water_result = await session.execute(
+            water_result = await db.execute(
                 select(func.sum(WaterEntry.amount))
                 .where(WaterEntry.user_id == user.id)
                 .where(WaterEntry.created_at >= day_start_utc)
@@ -298,5 +311,46 @@ def setup_scheduler(bot: Bot):
         replace_existing=True
     )
 
+    # Недельные отчёты - пакетный пересчёт раз в сутки ночью (UTC)
+    scheduler.add_job(
+        build_weekly_reports,
+        CronTrigger(hour=1, minute=15),
+        id="weekly_reports_build",
+        replace_existing=True
+    )
+
+    # Рассылка недельных отчётов - каждый час, внутри проверяется понедельник 10:00 по местному
+    scheduler.add_job(
+        deliver_weekly_reports,
+        CronTrigger(minute=45),
+        args=[bot],
+        id="weekly_reports_delivery",
+        replace_existing=True
+    )
+
+    # Партиции записей: будущие месяцы и срок хранения - раз в сутки ночью (UTC)
+    scheduler.add_job(
+        maintain_partitions,
+        CronTrigger(hour=2, minute=30),
+        id="partition_maintenance",
+        replace_existing=True
+    )
+
+    # Планы питания для часто запрашиваемых профилей - заранее, раз в час
+    scheduler.add_job(
+        pregenerate_meal_plans,
+        CronTrigger(minute=20),
+        id="meal_plan_pregeneration",
+        replace_existing=True
+    )
+
+    # Снимок внутренних метрик в лог каждые 15 минут
+    scheduler.add_job(
+        log_snapshot,
+        CronTrigger(minute="*/15"),
+        id="metrics_log",
+        replace_existing=True
+    )
+
     scheduler.start()
     return scheduler
@@ -0,0 +1,63 @@
+"""
+Рассылка сообщений с ограничением скорости
+Telegram допускает ~30 сообщений в секунду на бота — держимся ниже лимита
+"""
+import asyncio
+import logging
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedSender:
+    """Отправка сообщений не быстрее rate_per_sec, с учётом retry_after от Telegram"""
+
+    def __init__(self, bot: Bot, rate_per_sec: float = None):
+        self.bot = bot
+        self.interval = 1.0 / (rate_per_sec or config.SEND_RATE_PER_SEC)
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    async def _wait_slot(self):
+        """Дождаться своего слота (равномерно распределяем отправки)"""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        """
+        Отправить сообщение
+
+        Returns:
+            True если доставлено, False если пользователь недоступен / ошибка
+        """
+        for _ in range(3):
+            await self._wait_slot()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent += 1
+                return True
+            except TelegramRetryAfter as e:
+                # Flood control — притормаживаем всю рассылку
+                logger.warning(f"[SENDER] Flood control, sleeping {e.retry_after}s")
+                async with self._lock:
+                    self._next_slot = time.monotonic() + e.retry_after
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован / чат не найден — повтор не поможет
+                logger.info(f"[SENDER] chat={chat_id} | Not delivered: {e}")
+                break
+            except Exception as e:
+                logger.error(f"[SENDER] chat={chat_id} | Error: {e}")
+                break
+
+        self.failed += 1
+        return False
@@ -0,0 +1,440 @@
+"""
+Реестр инструментов AI коуча
+- Каждый инструмент объявляет схему, read/write-классификацию и таблицы, которые трогает
+- Валидаторы входа компилируются из схем один раз при импорте
+- COACH_TOOLS для API и диспетчеризация в coach.py строятся из реестра
+- Обработчики привязываются декоратором @handler("имя") в coach.py
+"""
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+
+class ToolInputError(ValueError):
+    """Некорректные параметры инструмента"""
+
+
+@dataclass
+class ToolSpec:
+    name: str
+    description: str
+    input_schema: dict
+    read_only: bool
+    tables: tuple[str, ...]
+    handler: Optional[Callable[[int, dict], Awaitable[dict]]] = None
+    validate: Callable[[dict], dict] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.validate = compile_validator(self.name, self.input_schema)
+
+    def to_api(self) -> dict:
+        """Описание инструмента для Anthropic API"""
+        return {"name": self.name, "description": self.description, "input_schema": self.input_schema}
+
+
+# ============================================================================
+# Валидация (компилируется из JSON-схемы один раз)
+# ============================================================================
+
+def _to_integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        value = float(value.replace(",", ".").strip())
+    if isinstance(value, float):
+        return int(round(value))
+    if isinstance(value, int):
+        return value
+    raise ValueError
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        return float(value.replace(",", ".").strip())
+    if isinstance(value, (int, float)):
+        return value
+    raise ValueError
+
+
+def _to_string(value: Any) -> str:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError
+
+
+def _to_boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ValueError
+
+
+_COERCERS = {
+    "integer": _to_integer,
+    "number": _to_number,
+    "string": _to_string,
+    "boolean": _to_boolean,
+}
+
+
+def compile_validator(tool_name: str, schema: dict) -> Callable[[dict], dict]:
+    """
+    Собрать функцию проверки входа по JSON-схеме инструмента
+
+    Поддерживается то, что реально используется в схемах: типы полей, enum,
+    required и default. Неизвестные поля и None у необязательных полей отбрасываются.
+    """
+    required = frozenset(schema.get("required", ()))
+    fields = [
+        (
+            name,
+            _COERCERS.get(prop.get("type"), lambda v: v),
+            prop.get("type", "any"),
+            frozenset(prop["enum"]) if "enum" in prop else None,
+            prop.get("default"),
+            name in required
+        )
+        for name, prop in schema.get("properties", {}).items()
+    ]
+
+    def validate(tool_input: dict) -> dict:
+        if not isinstance(tool_input, dict):
+            raise ToolInputError(f"{tool_name}: ожидался объект параметров")
+
+        cleaned = {}
+        for name, coerce, type_name, enum, default, is_required in fields:
+            value = tool_input.get(name)
+            if value is None:
+                if is_required:
+                    raise ToolInputError(f"{tool_name}: не указан обязательный параметр {name}")
+                if default is not None:
+                    cleaned[name] = default
+                continue
+            try:
+                value = coerce(value)
+            except (ValueError, TypeError):
+                raise ToolInputError(f"{tool_name}: {name} должен быть {type_name}, получено {value!r}")
+            if enum is not None and value not in enum:
+                raise ToolInputError(f"{tool_name}: {name} должен быть одним из {sorted(enum)}")
+            cleaned[name] = value
+        return cleaned
+
+    return validate
+
+
+# ============================================================================
+# Объявления инструментов
+# ============================================================================
+
+TOOL_SPECS = [
+    ToolSpec(
+        name="log_food",
+        description="Записать приём пищи. Используй когда пользователь говорит что съел.",
+        read_only=False,
+        tables=("food_entries",),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "description": {"type": "string", "description": "Что съел (название блюда)"},
+                "calories": {"type": "integer", "description": "Калории"},
+                "protein": {"type": "number", "description": "Белки в граммах"},
+                "carbs": {"type": "number", "description": "Углеводы в граммах"},
+                "fat": {"type": "number", "description": "Жиры в граммах"},
+                "fiber": {"type": "number", "description": "Клетчатка в граммах"},
+                "meal_type": {
+                    "type": "string",
+                    "enum": ["breakfast", "lunch", "dinner", "snack"],
+                    "description": "Тип приёма пищи"
+                }
+            },
+            "required": ["description", "calories"]
+        }
+    ),
+    ToolSpec(
+        name="log_water",
+        description="Записать воду. Используй когда пользователь говорит что выпил воду/чай/кофе/напиток.",
+        read_only=False,
+        tables=("water_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "amount_ml": {"type": "integer", "description": "Количество в мл"}
+            },
+            "required": ["amount_ml"]
+        }
+    ),
+    ToolSpec(
+        name="log_weight",
+        description="Записать вес пользователя.",
+        read_only=False,
+        tables=("weight_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "weight_kg": {"type": "number", "description": "Вес в килограммах"}
+            },
+            "required": ["weight_kg"]
+        }
+    ),
+    ToolSpec(
+        name="log_activity",
+        description="Записать активность/тренировку.",
+        read_only=False,
+        tables=("activity_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "activity_type": {"type": "string", "description": "Тип активности (бег, ходьба, тренировка и т.д.)"},
+                "duration_minutes": {"type": "integer", "description": "Длительность в минутах"},
+                "calories_burned": {"type": "integer", "description": "Сожжённые калории (если известно)"}
+            },
+            "required": ["activity_type", "duration_minutes"]
+        }
+    ),
+    ToolSpec(
+        name="get_today_stats",
+        description="Получить статистику за сегодня. Используй когда нужно узнать сколько съедено/выпито.",
+        read_only=True,
+        tables=("users", "food_entries", "water_entries", "activity_entries"),
+        input_schema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    ToolSpec(
+        name="get_weight_history",
+        description="Получить историю веса за последние N дней.",
+        read_only=True,
+        tables=("weight_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "days": {"type": "integer", "description": "Количество дней", "default": 7}
+            }
+        }
+    ),
+    ToolSpec(
+        name="get_health_trend",
+        description="Получить тренд пульса или сна за последние N дней (дневные min/avg/max). Используй когда спрашивают про пульс, сон или восстановление.",
+        read_only=True,
+        tables=("health_metric_daily",),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "metric": {
+                    "type": "string",
+                    "enum": ["heart_rate", "sleep_hours"],
+                    "description": "Метрика: heart_rate (пульс), sleep_hours (сон в часах)"
+                },
+                "days": {"type": "integer", "description": "Количество дней", "default": 7}
+            },
+            "required": ["metric"]
+        }
+    ),
+    ToolSpec(
+        name="remember_fact",
+        description="Запомнить важный факт о пользователе (привычка, предпочтение, ограничение в питании, цель).",
+        read_only=False,
+        tables=("user_memories",),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "category": {
+                    "type": "string",
+                    "enum": ["preference", "habit", "restriction", "goal", "fact"],
+                    "description": "Категория: preference (предпочтение), habit (привычка), restriction (ограничение), goal (цель), fact (факт)"
+                },
+                "content": {"type": "string", "description": "Текст факта (например: 'не ест молочку', 'вегетарианец')"}
+            },
+            "required": ["category", "content"]
+        }
+    ),
+    ToolSpec(
+        name="update_profile",
+        description="Обновить профиль пользователя (имя, возраст, рост, вес, цель и т.д.)",
+        read_only=False,
+        tables=("users",),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "first_name": {"type": "string", "description": "Имя пользователя"},
+                "age": {"type": "integer", "description": "Возраст"},
+                "gender": {"type": "string", "enum": ["male", "female"], "description": "Пол"},
+                "height_cm": {"type": "integer", "description": "Рост в сантиметрах"},
+                "current_weight_kg": {"type": "number", "description": "Текущий вес"},
+                "target_weight_kg": {"type": "number", "description": "Целевой вес"},
+                "calorie_goal": {"type": "integer", "description": "Цель по калориям"},
+                "water_goal": {"type": "integer", "description": "Цель по воде в мл"},
+                "goal": {
+                    "type": "string",
+                    "enum": ["lose", "gain", "maintain", "health"],
+                    "description": "Цель: lose (похудеть), gain (набрать), maintain (поддерживать), health (здоровье)"
+                }
+            }
+        }
+    ),
+    ToolSpec(
+        name="check_profile_complete",
+        description="Проверить, заполнен ли профиль пользователя (есть ли рост/вес для расчётов)",
+        read_only=True,
+        tables=("users",),
+        input_schema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    ToolSpec(
+        name="get_today_activities",
+        description="Получить список активностей за сегодня. Используй чтобы узнать что уже записано.",
+        read_only=True,
+        tables=("activity_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    ToolSpec(
+        name="update_daily_activity",
+        description="Обновить или установить дневную активность (сожжённые калории). Используй когда пользователь хочет исправить калории активности или указывает что данные неверные.",
+        read_only=False,
+        tables=("activity_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "calories_burned": {"type": "integer", "description": "Правильное количество сожжённых калорий"},
+                "activity_type": {"type": "string", "description": "Тип активности (ходьба, бег, тренировка)"},
+                "reason": {"type": "string", "description": "Почему меняем (например: 'пользователь указал на ошибку')"}
+            },
+            "required": ["calories_burned"]
+        }
+    ),
+    ToolSpec(
+        name="clear_today_activities",
+        description="Удалить все активности за сегодня. Используй если пользователь говорит что данные неверные и нужно сбросить.",
+        read_only=False,
+        tables=("activity_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
+            },
+            "required": ["confirm"]
+        }
+    ),
+    ToolSpec(
+        name="list_today_food",
+        description="Показать все записи еды за сегодня с номерами. Используй когда пользователь хочет посмотреть что записано или исправить.",
+        read_only=True,
+        tables=("food_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    ToolSpec(
+        name="delete_food_entry",
+        description="Удалить запись еды. Используй когда пользователь говорит удалить конкретную еду (по номеру или описанию).",
+        read_only=False,
+        tables=("food_entries", "food_analyses", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "entry_number": {"type": "integer", "description": "Номер записи из списка (1, 2, 3...)"},
+                "description_match": {"type": "string", "description": "Часть описания для поиска (например 'яичница' или 'мороженое')"}
+            }
+        }
+    ),
+    ToolSpec(
+        name="update_food_entry",
+        description="Изменить запись еды. Используй когда пользователь хочет исправить калории или описание конкретной еды.",
+        read_only=False,
+        tables=("food_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "entry_number": {"type": "integer", "description": "Номер записи из списка"},
+                "description_match": {"type": "string", "description": "Часть описания для поиска"},
+                "new_description": {"type": "string", "description": "Новое описание"},
+                "new_calories": {"type": "integer", "description": "Новые калории"},
+                "new_protein": {"type": "number", "description": "Новый белок"},
+                "new_carbs": {"type": "number", "description": "Новые углеводы"},
+                "new_fat": {"type": "number", "description": "Новые жиры"}
+            }
+        }
+    ),
+    ToolSpec(
+        name="clear_today_food",
+        description="Удалить ВСЕ записи еды за сегодня. Используй ТОЛЬКО если пользователь явно просит сбросить всё.",
+        read_only=False,
+        tables=("food_entries", "food_analyses", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
+            },
+            "required": ["confirm"]
+        }
+    ),
+    ToolSpec(
+        name="list_today_water",
+        description="Показать все записи воды за сегодня.",
+        read_only=True,
+        tables=("water_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    ToolSpec(
+        name="clear_today_water",
+        description="Удалить ВСЕ записи воды за сегодня. Используй если пользователь хочет сбросить воду.",
+        read_only=False,
+        tables=("water_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "confirm": {"type": "boolean", "description": "Подтверждение удаления"}
+            },
+            "required": ["confirm"]
+        }
+    ),
+    ToolSpec(
+        name="set_today_water",
+        description="Установить конкретное количество воды за сегодня (сбросить и записать новое значение).",
+        read_only=False,
+        tables=("water_entries", "users"),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "amount_ml": {"type": "integer", "description": "Количество воды в мл"}
+            },
+            "required": ["amount_ml"]
+        }
+    )
+]
+
+TOOLS: dict[str, ToolSpec] = {spec.name: spec for spec in TOOL_SPECS}
+
+
+def handler(tool_name: str):
+    """Привязать обработчик к инструменту: @handler("log_water")"""
+    spec = TOOLS[tool_name]
+
+    def decorator(func: Callable[[int, dict], Awaitable[dict]]):
+        spec.handler = func
+        return func
+
+    return decorator
+
+
+def get_tool(tool_name: str) -> Optional[ToolSpec]:
+    return TOOLS.get(tool_name)
+
+
+def api_tools() -> list[dict]:
+    """Список инструментов в формате Anthropic API"""
+    return [spec.to_api() for spec in TOOL_SPECS]
@@ -0,0 +1,263 @@
+"""
+Вода: запись и итог за день (кнопки, напоминания, /water, AI-коуч)
+- Micro-batching: записи за WATER_BATCH_WINDOW копятся и пишутся одним
+  multi-row INSERT в одной транзакции — волна нажатий после напоминания
+  не открывает по соединению на каждое
+- Итог за день — из счётчика в памяти; из БД он читается (одним GROUP BY на пачку)
+  при первом нажатии, после смены дня, записи пользователя в обход писателя
+  или по истечении WATER_TOTALS_TTL
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select, func, insert, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import config
+from database.db import async_session, read_scope, mark_user_write, written_since
+from database.models import User, WaterEntry
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
+_user_tz = func.coalesce(User.timezone, DEFAULT_TIMEZONE)
+# Локальная дата записи и «сегодня» пользователя (created_at хранится как UTC без tzinfo)
+_local_day = func.date(func.timezone(_user_tz, func.timezone("UTC", WaterEntry.created_at)), type_=Date)
+_local_today = func.date(func.timezone(_user_tz, func.now()), type_=Date)
+
+
+class _DayTotal:
+    """
+    Выпито за локальный день пользователя и его цель
+
+    loaded_at — когда счётчик прочитан из БД (от него считается WATER_TOTALS_TTL);
+    synced_at — после какого момента записи пользователя сделаны не писателем
+    (собственные записи писателя счётчик уже учитывает)
+    """
+    __slots__ = ("day", "total", "goal", "timezone", "loaded_at", "synced_at")
+
+    def __init__(self, day: date, total: int, goal: int, timezone: str, loaded_at: float):
+        self.day = day
+        self.total = total
+        self.goal = goal
+        self.timezone = timezone
+        self.loaded_at = loaded_at
+        self.synced_at = loaded_at
+
+
+# user_id → итог дня
+_totals: dict[int, _DayTotal] = {}
+# (user_id, amount, created_at, future) — ждут записи
+_pending: list[tuple[int, int, datetime, asyncio.Future]] = []
+_flush_timer: Optional[asyncio.TimerHandle] = None
+# Ссылки на задачи записи (иначе их может собрать GC)
+_flushes: set[asyncio.Task] = set()
+
+
+def _local_date(timezone: str) -> date:
+    try:
+        tz = ZoneInfo(timezone or DEFAULT_TIMEZONE)
+    except Exception:
+        tz = ZoneInfo(DEFAULT_TIMEZONE)
+    return datetime.now(tz).date()
+
+
+def _is_fresh(user_id: int, total: Optional[_DayTotal], now: float) -> bool:
+    """Счётчик можно использовать без БД"""
+    return (
+        total is not None
+        and now - total.loaded_at < config.WATER_TOTALS_TTL
+        # Цель, часовой пояс или вода менялись в обход писателя
+        and not written_since(user_id, total.synced_at)
+    )
+
+
+async def add_water(user_id: int, amount: int) -> tuple[int, int]:
+    """
+    Добавить воду (в ближайшую пачку записи)
+
+    Returns:
+        (всего сегодня, цель)
+    """
+    global _flush_timer
+    future = asyncio.get_running_loop().create_future()
+    _pending.append((user_id, amount, datetime.utcnow(), future))
+
+    if len(_pending) >= config.WATER_BATCH_MAX:
+        _start_flush()
+    elif _flush_timer is None:
+        _flush_timer = asyncio.get_running_loop().call_later(config.WATER_BATCH_WINDOW, _start_flush)
+
+    return await future
+
+
+def _start_flush():
+    global _pending, _flush_timer
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+        _flush_timer = None
+    if not _pending:
+        return
+
+    batch, _pending = _pending, []
+    # Пустой контекст: запись не должна попасть в сессию апдейта, который её запустил
+    task = asyncio.create_task(_flush(batch), context=contextvars.Context())
+    _flushes.add(task)
+    task.add_done_callback(_flushes.discard)
+
+
+async def _flush(batch: list[tuple[int, int, datetime, asyncio.Future]]):
+    metrics.observe("water.batch_size", len(batch))
+    try:
+        with metrics.timer("water.flush"):
+            results = await _write(batch)
+    except Exception as e:
+        logger.error(f"[WATER] Batch of {len(batch)} failed: {e}")
+        for *_, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for (*_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+
+async def _load(session, user_ids: set[int]) -> dict[int, _DayTotal]:
+    """Итоги локального «сегодня» и цели пользователей (два запроса на всех)"""
+    result = await session.execute(
+        select(User.id, User.timezone, User.water_goal).where(User.id.in_(user_ids))
+    )
+    profiles = {row.id: (row.timezone, row.water_goal) for row in result}
+
+    result = await session.execute(
+        select(WaterEntry.user_id, func.sum(WaterEntry.amount))
+        .join(User, User.id == WaterEntry.user_id)
+        .where(WaterEntry.user_id.in_(user_ids))
+        # Грубый фильтр по UTC для индекса; точная граница — локальная дата
+        .where(WaterEntry.created_at >= datetime.utcnow() - timedelta(days=2))
+        .where(_local_day == _local_today)
+        .group_by(WaterEntry.user_id)
+    )
+    sums = dict(result.all())
+
+    loaded = {}
+    for user_id in user_ids:
+        timezone, goal = profiles.get(user_id, (None, None))
+        timezone = timezone or DEFAULT_TIMEZONE
+        loaded[user_id] = _DayTotal(
+            _local_date(timezone), sums.get(user_id) or 0,
+            goal or config.DEFAULT_WATER_GOAL, timezone, 0.0
+        )
+    return loaded
+
+
+def _roll_day(total: _DayTotal):
+    """Новый локальный день — счётчик с нуля"""
+    today = _local_date(total.timezone)
+    if total.day != today:
+        total.day, total.total = today, 0
+
+
+async def get_today_water(user_id: int) -> tuple[int, int]:
+    """
+    Выпито за локальный «сегодня» пользователя: из счётчика, если он свежий, иначе из БД
+
+    Returns:
+        (всего сегодня, цель)
+    """
+    total = _totals.get(user_id)
+    if not _is_fresh(user_id, total, time.monotonic()):
+        metrics.inc("water.totals.miss")
+        # Момент до запроса: запись, закоммиченная во время чтения, сделает счётчик устаревшим
+        loaded_at = time.monotonic()
+        async with read_scope(user_id) as session:
+            total = (await _load(session, {user_id}))[user_id]
+        total.loaded_at = total.synced_at = loaded_at
+        _totals[user_id] = total
+    else:
+        metrics.inc("water.totals.hit")
+
+    _roll_day(total)
+    return total.total, total.goal
+
+
+async def _write(batch: list[tuple[int, int, datetime, asyncio.Future]]) -> list[tuple[int, int]]:
+    """Записать пачку одной транзакцией и вернуть (всего, цель) для каждой записи"""
+    now = time.monotonic()
+    user_ids = {user_id for user_id, *_ in batch}
+    cold = {user_id for user_id in user_ids if not _is_fresh(user_id, _totals.get(user_id), now)}
+    warm = {user_id: _totals[user_id] for user_id in user_ids - cold}
+    loaded: dict[int, _DayTotal] = {}
+
+    async with async_session() as session:
+        if cold:
+            # Нажал кнопку, а пользователя ещё нет — создаём с целями по умолчанию
+            await session.execute(
+                pg_insert(User)
+                .values([{"id": user_id} for user_id in cold])
+                .on_conflict_do_nothing(index_elements=[User.id])
+            )
+
+        await session.execute(
+            insert(WaterEntry).values([
+                {"user_id": user_id, "amount": amount, "created_at": created_at}
+                for user_id, amount, created_at, _ in batch
+            ])
+        )
+
+        if cold:
+            # Итог дня уже с записями этой пачки
+            loaded = await _load(session, cold)
+
+        await session.commit()
+
+    # Пока шла пачка, пользователь писал в обход писателя — тёплый счётчик устарел
+    stale = {user_id for user_id, total in warm.items() if written_since(user_id, total.synced_at)}
+
+    # Реплика отстаёт от этих записей — чтения пользователей пусть идут на primary
+    for user_id in user_ids:
+        mark_user_write(user_id)
+    synced_at = time.monotonic()
+
+    # Холодным пользователям итог из БД уже включает пачку — вычитаем, чтобы пройти её по порядку
+    for user_id, amount, *_ in batch:
+        if user_id in loaded:
+            loaded[user_id].total -= amount
+    for user_id, total in loaded.items():
+        total.loaded_at = synced_at
+    totals = {**warm, **loaded}
+
+    results = []
+    for user_id, amount, *_ in batch:
+        total = totals[user_id]
+        _roll_day(total)
+        total.total += amount
+        results.append((total.total, total.goal))
+
+    # loaded_at не двигаем: TTL считается от чтения из БД, а не от последнего нажатия
+    for user_id, total in totals.items():
+        total.synced_at = synced_at
+        if user_id in stale:
+            _totals.pop(user_id, None)
+        else:
+            _totals[user_id] = total
+
+    _prune(synced_at)
+    return results
+
+
+def _prune(now: float):
+    """Не держать счётчики пользователей, давно не нажимавших кнопки"""
+    if len(_totals) <= 10000:
+        return
+    cutoff = now - config.WATER_TOTALS_TTL
+    for user_id in [user_id for user_id, total in _totals.items() if total.loaded_at < cutoff]:
+        del _totals[user_id]